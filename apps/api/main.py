@@ -1,30 +1,80 @@
 from __future__ import annotations
 
+import hashlib
 import io
 import json
 import os
 import shutil
 import uuid
+import weakref
+from dataclasses import dataclass, replace
+from datetime import datetime
 from pathlib import Path
 from typing import AsyncGenerator, Dict, List, Literal, Optional
 
-from fastapi import BackgroundTasks, Depends, FastAPI, File, Header, HTTPException, Request, Response, UploadFile
+from fastapi import BackgroundTasks, Depends, FastAPI, File, Header, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sse_starlette.sse import EventSourceResponse
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from redis import Redis
 import redis
 from rq import Queue
 
-from kits.kit_common import normalize_text, gen_request_id
+from kits.kit_common import BoundedExecutor, QueueFullError, TTLCache, normalize_text, gen_request_id, process_memory
 from kits.kit_common.highlight import extract_snippet_and_highlights
+from kits.kit_chunker import join_chunks
 
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from langchain_community.docstore.document import Document
 
-from kits.kit_llm import EmbeddingBackend, EmbedConfig, ChatConfig, chat_stream
+from kits.kit_llm import (
+    AnswerCache,
+    CachedAnswer,
+    ChatConfig,
+    EmbedConfig,
+    EmbeddingBackend,
+    LLM_CLIENTS,
+    PromptConfig,
+    PromptSource,
+    answer_reservation,
+    build_prompt,
+    chat_stream,
+    close_llm_clients,
+    get_embedding_backend,
+    get_query_batcher,
+    get_reranker,
+    init_llm_clients,
+    warmup_embeddings,
+)
+from kits.kit_index import (
+    AnnConfig,
+    BM25Index,
+    ColumnarDocstore,
+    IndexVersion,
+    LockTimeout,
+    MetadataFilter,
+    TenantLock,
+    TenantManifest,
+    VectorStoreCache,
+    apply_search_params,
+    current_version,
+    docstore_format,
+    filtered_search,
+    index_signature,
+    index_size_bytes,
+    live_mask,
+    load_tombstones,
+    load_vectorstore as load_index_dir,
+    mmap_io_flags,
+    mmr_select,
+    position_metadata,
+    reciprocal_rank_fusion,
+)
 
 import time
 import logging
@@ -43,11 +93,46 @@ LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO), format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger("api")
 
+# Resident per-tenant vectorstores; reloaded when the worker rewrites the index files
+VS_CACHE = VectorStoreCache(
+    max_entries=int(os.getenv("VS_CACHE_MAX_ENTRIES", "8")),
+    max_bytes=int(float(os.getenv("VS_CACHE_MAX_MB", "1024")) * 1024 * 1024),
+)
+
+# Sparse (BM25) indexes, cached like the vectorstores and reloaded when bm25.json changes
+SPARSE_CACHE = VectorStoreCache(max_entries=int(os.getenv("VS_CACHE_MAX_ENTRIES", "8")))
+
+# Tenant manifests (indexed files, upload times), for filters and deletions
+MANIFEST_CACHE = VectorStoreCache(max_entries=int(os.getenv("VS_CACHE_MAX_ENTRIES", "8")))
+
+# Generated answers per (tenant, index generation, question, top_k, model); 0 entries disables
+ANSWER_CACHE = AnswerCache(
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")),
+    ttl_s=float(os.getenv("ANSWER_CACHE_TTL_S", "3600")),
+    semantic_threshold=float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0")),
+)
+ANSWER_CACHE_ENABLED = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024")) > 0
+
+# Search results per (tenant, index generation, query, k); 0 entries disables
+RETRIEVAL_CACHE = TTLCache(
+    max_entries=int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "2048")),
+    ttl_s=float(os.getenv("RETRIEVAL_CACHE_TTL_S", "300")),
+)
+RETRIEVAL_CACHE_ENABLED = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "2048")) > 0
+
+# Retrieval (embedding, index load, FAISS search) blocks; it runs here instead of on the event loop
+RETRIEVAL_POOL = BoundedExecutor(
+    max_workers=int(os.getenv("RETRIEVAL_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("RETRIEVAL_MAX_QUEUE", "0")),
+    name="retrieval",
+)
+
 
 class FileInfo(BaseModel):
     filename: str
     size_bytes: int
     mime: Optional[str] = None
+    sha256: Optional[str] = None
 
 
 class IndexJob(BaseModel):
@@ -66,11 +151,14 @@ class SourcePreview(BaseModel):
     page: Optional[int] = None
     snippet: str
     highlights: List[tuple[int, int]] = []
+    # Full chunk text for the prompt builder; never serialized to clients or the answer cache
+    text: Optional[str] = Field(default=None, exclude=True)
 
 
 class QAResponse(BaseModel):
     answer: str
     sources: List[SourcePreview]
+    debug: Optional[dict] = None
 
 
 def get_env_summary() -> Dict[str, str]:
@@ -100,13 +188,48 @@ def allowed_ext(filename: str) -> bool:
     return ext in {"pdf", "md", "txt", "docx"}
 
 
-def index_path(tenant: str) -> Path:
+def tenant_dir(tenant: str) -> Path:
     return FAISS_DIR / tenant
 
 
+def index_version(tenant: str) -> Optional[IndexVersion]:
+    return current_version(tenant_dir(tenant))
+
+
+def index_path(tenant: str) -> Path:
+    """Directory of the tenant's current index generation (the tenant directory for legacy indexes)."""
+    v = index_version(tenant)
+    return v.path if v is not None else tenant_dir(tenant)
+
+
 def has_index(tenant: str) -> bool:
-    p = index_path(tenant)
-    return (p / "index.faiss").exists() and (p / "index.pkl").exists()
+    v = index_version(tenant)
+    return v is not None and docstore_format(v.path) is not None
+
+
+def _version_signature(v: IndexVersion, names: Optional[List[str]] = None):
+    """Cache key for files of v: published generations never change, legacy indexes are rewritten in place."""
+    if v.generation:
+        return v.key if all((v.path / n).exists() for n in names or ()) else None
+    return index_signature(v.path, names)
+
+
+def index_generation(tenant: str):
+    """Changes whenever the worker publishes a new index for the tenant."""
+    v = index_version(tenant)
+    return _version_signature(v) if v is not None else None
+
+
+def tenant_lock(tenant: str, wait_s: float = 0.0) -> TenantLock:
+    """The worker's per-tenant index write lock (Redis, or a lock file when Redis is unreachable)."""
+    conn = None
+    try:
+        conn = get_queue().connection
+        conn.ping()
+    except Exception as e:
+        logger.warning("Redis unavailable for index lock, using lock file: %s", e)
+        conn = None
+    return TenantLock(tenant, redis=conn, lock_dir=DATA_DIR / "locks", wait_s=wait_s)
 
 
 def get_embeddings() -> EmbeddingBackend:
@@ -114,7 +237,15 @@ def get_embeddings() -> EmbeddingBackend:
     # warnings if openai selected without keys
     if cfg.backend == "openai" and not os.getenv("OPENAI_API_KEY"):
         logger.warning("EMBED_BACKEND=openai but OPENAI_API_KEY is not set")
-    return EmbeddingBackend(cfg)
+    return get_embedding_backend(cfg)
+
+
+def get_query_embedder():
+    """Backend used for query vectors; with EMBED_QUERY_BATCH=1 concurrent queries share forward passes."""
+    backend = get_embeddings()
+    if os.getenv("EMBED_QUERY_BATCH", "0") in {"1", "true", "True"}:
+        return get_query_batcher(backend)
+    return backend
 
 
 def build_langchain_embeddings(backend: EmbeddingBackend):
@@ -132,11 +263,70 @@ def build_langchain_embeddings(backend: EmbeddingBackend):
 
 
 def load_vectorstore(tenant: str) -> FAISS:
-    if not has_index(tenant):
+    v = index_version(tenant)
+    sig = _version_signature(v) if v is not None else None
+    if sig is None:
         raise HTTPException(status_code=404, detail={"error": {"code": 404, "type": "not_found", "message": "Index not found"}})
-    vs_dir = str(index_path(tenant))
-    emb = build_langchain_embeddings(get_embeddings())
-    return FAISS.load_local(vs_dir, emb, allow_dangerous_deserialization=True)
+
+    def _load() -> FAISS:
+        logger.info("Loading vectorstore tenant=%s", tenant)
+        emb = build_langchain_embeddings(get_embeddings())
+        # Pickled or columnar docstore; columnar keeps chunk text on disk until a hit needs it
+        io_flags = mmap_io_flags() if os.getenv("FAISS_MMAP", "0") in {"1", "true", "True"} else 0
+        vs = load_index_dir(v.path, emb, io_flags=io_flags)
+        apply_search_params(vs.index, AnnConfig())
+        live = live_mask(vs.index.ntotal, load_tombstones(v.path))
+        if live is not None:
+            _LIVE[vs] = live
+        return vs
+
+    return VS_CACHE.get(tenant, sig, _load, size_bytes=index_size_bytes(v.path))
+
+
+def load_sparse_index(tenant: str) -> Optional[BM25Index]:
+    """Tenant's BM25 index, or None if the worker has not built one yet."""
+    v = index_version(tenant)
+    sig = _version_signature(v, [BM25Index.FILENAME]) if v is not None else None
+    if sig is None:
+        return None
+    p = v.path
+
+    def _load() -> Optional[BM25Index]:
+        idx = BM25Index.load(p)
+        if idx is not None:
+            idx.prepare()  # concurrent searches then only read it
+        return idx
+
+    return SPARSE_CACHE.get(tenant, sig, _load, size_bytes=index_size_bytes(p, [BM25Index.FILENAME]))
+
+
+def load_manifest(tenant: str) -> Optional[TenantManifest]:
+    """The worker's manifest of the tenant's current index, or None without an index."""
+    v = index_version(tenant)
+    sig = _version_signature(v, [TenantManifest.FILENAME]) if v is not None else None
+    if sig is None:
+        return None
+    p = v.path
+    return MANIFEST_CACHE.get(tenant, sig, lambda: TenantManifest.load(p))
+
+
+def load_upload_times(tenant: str) -> Dict[str, float]:
+    """Upload time per indexed file, from the worker's manifest."""
+    manifest = load_manifest(tenant)
+    return manifest.upload_times() if manifest is not None else {}
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default) in {"1", "true", "True"}
+
+
+def rerank_enabled() -> bool:
+    return _env_flag("RERANK")
+
+
+def get_search_mode() -> str:
+    mode = os.getenv("SEARCH_MODE", "dense").lower()
+    return mode if mode in {"dense", "hybrid"} else "dense"
 
 
 def get_top_k() -> int:
@@ -176,6 +366,34 @@ async def on_startup():
         logger.warning("LLM_BACKEND=openai but OPENAI_API_KEY is not set")
     if cfg["llm_backend"] == "ollama" and not os.getenv("OLLAMA_HOST"):
         logger.warning("LLM_BACKEND=ollama but OLLAMA_HOST is not set; defaulting to localhost:11434")
+    if os.getenv("EMBED_WARMUP", "0") in {"1", "true", "True"}:
+        t0 = time.perf_counter()
+        await run_in_threadpool(warmup_embeddings)
+        logger.info("Embedding model warmed up in %.0f ms", (time.perf_counter() - t0) * 1000)
+    chat_cfg, prompt_cfg = ChatConfig(), PromptConfig()
+    reserved = answer_reservation(chat_cfg.max_tokens, prompt_cfg)
+    if reserved < chat_cfg.max_tokens:
+        logger.warning(
+            "LLM_MAX_TOKENS=%d does not fit LLM_CONTEXT_TOKENS=%d; answer prompts reserve only %d tokens for the answer",
+            chat_cfg.max_tokens,
+            prompt_cfg.context_tokens,
+            reserved,
+        )
+    if rerank_enabled():
+        # Otherwise queries skip reranking until the background load finishes
+        await run_in_threadpool(get_reranker().load)
+    # Open the pooled LLM client on the serving loop; connections are kept alive across answers
+    try:
+        await init_llm_clients()
+    except Exception as e:
+        # e.g. missing OPENAI_API_KEY; chat_stream reports it on first use
+        logger.warning("Could not create LLM client at startup: %s", e)
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await close_llm_clients()
+    RETRIEVAL_POOL.shutdown(wait=False)
 
 
 @app.get("/health")
@@ -184,6 +402,27 @@ def health():
     return {"status": "ok", **cfg}
 
 
+@app.get("/stats")
+def stats():
+    out = {
+        "vectorstore_cache": VS_CACHE.stats(),
+        "sparse_cache": SPARSE_CACHE.stats(),
+        "retrieval_pool": RETRIEVAL_POOL.stats(),
+        "answer_cache": ANSWER_CACHE.stats(),
+        "retrieval_cache": RETRIEVAL_CACHE.stats(),
+        "llm_clients": LLM_CLIENTS.stats(),
+        "reranker": get_reranker().stats(),
+        "process": {"pid": os.getpid(), **process_memory()},
+    }
+    emb_cache = getattr(get_embeddings(), "cache", None)
+    if emb_cache is not None:
+        out["embedding_cache"] = emb_cache.stats()
+    embedder = get_query_embedder()
+    if hasattr(embedder, "stats"):
+        out["query_batcher"] = embedder.stats()
+    return out
+
+
 @app.post("/tenant/new")
 def tenant_new():
     return {"tenant": str(uuid.uuid4())}
@@ -218,15 +457,32 @@ async def index(
     for uf in files:
         if not allowed_ext(uf.filename or ""):
             raise HTTPException(status_code=400, detail={"error": {"code": 400, "type": "validation_error", "message": f"Unsupported file: {uf.filename}"}})
-        content = await uf.read()
-        size_mb = len(content) / (1024 * 1024)
-        if size_mb > max_mb:
-            raise HTTPException(status_code=413, detail={"error": {"code": 413, "type": "payload_too_large", "message": f"File too big: {uf.filename}"}})
-        dest = up_dir / (uf.filename or f"upload_{len(saved_paths)}")
-        with open(dest, "wb") as f:
-            f.write(content)
-        saved_paths.append(str(dest))
-        infos.append(FileInfo(filename=uf.filename or dest.name, size_bytes=len(content), mime=uf.content_type))
+    # Streamed to temporary files in chunks, hashing and size-checking as they go,
+    # so a request never holds a whole file in memory; the uploads only replace
+    # earlier ones once every file of the request was accepted.
+    chunk_size = max(1, int(os.getenv("UPLOAD_CHUNK_KB", "1024"))) * 1024
+    staged: List[tuple[Path, Path]] = []
+    try:
+        for uf in files:
+            dest = up_dir / Path(uf.filename or f"upload_{len(staged)}").name
+            tmp = up_dir / f".{dest.name}.{uuid.uuid4().hex[:8]}.part"
+            staged.append((tmp, dest))
+            digest = hashlib.sha256()
+            size = 0
+            with open(tmp, "wb") as f:
+                while chunk := await uf.read(chunk_size):
+                    size += len(chunk)
+                    if size > max_mb * 1024 * 1024:
+                        raise HTTPException(status_code=413, detail={"error": {"code": 413, "type": "payload_too_large", "message": f"File too big: {uf.filename}"}})
+                    digest.update(chunk)
+                    f.write(chunk)
+            infos.append(FileInfo(filename=uf.filename or dest.name, size_bytes=size, mime=uf.content_type, sha256=digest.hexdigest()))
+        for tmp, dest in staged:
+            os.replace(tmp, dest)
+            saved_paths.append(str(dest))
+    finally:
+        for tmp, _ in staged:
+            tmp.unlink(missing_ok=True)
 
     # Decide sync vs async
     force_sync = os.getenv("INDEX_SYNC", "0") in {"1", "true", "True"}
@@ -237,7 +493,8 @@ async def index(
 
     try:
         q = get_queue()
-        job = q.enqueue("apps.worker.worker.index_files_job", tenant, saved_paths)
+        # Hashes let the worker skip re-reading files to detect unchanged uploads
+        job = q.enqueue("apps.worker.worker.index_files_job", tenant, saved_paths, [i.sha256 for i in infos])
         logger.info("Enqueued INDEX_FILES job=%s tenant=%s files=%d", job.id, tenant, len(saved_paths))
         return JSONResponse(status_code=202, content={"job_id": job.id, "tenant": tenant, "files": [i.model_dump() for i in infos]})
     except Exception as e:
@@ -245,6 +502,34 @@ async def index(
         raise HTTPException(status_code=500, detail={"error": {"code": 500, "type": "internal_error", "message": "Failed to enqueue indexing job"}})
 
 
+@app.delete("/documents/{filename}")
+def delete_document(filename: str, x_tenant_id: Optional[str] = Header(None, alias="X-Tenant-ID")):
+    tenant = ensure_tenant(x_tenant_id)
+    if not filename or Path(filename).name != filename:
+        raise HTTPException(status_code=400, detail={"error": {"code": 400, "type": "validation_error", "message": f"Invalid filename: {filename}"}})
+    manifest = load_manifest(tenant)
+    upload = UPLOADS_DIR / tenant / filename
+    if (manifest is None or manifest.get(filename) is None) and not upload.exists():
+        raise HTTPException(status_code=404, detail={"error": {"code": 404, "type": "not_found", "message": f"Document not found: {filename}"}})
+    # Moved aside now, for the job to remove once the deletion is published: a
+    # file re-uploaded under the same name before the job runs is left alone
+    pending = upload.with_name(f".deleting-{uuid.uuid4().hex[:8]}-{filename}")
+    try:
+        os.replace(upload, pending)
+    except FileNotFoundError:
+        pending = None
+    try:
+        q = get_queue()
+        job = q.enqueue("apps.worker.worker.delete_files_job", tenant, [filename], [pending.name if pending else None])
+        logger.info("Enqueued DELETE_FILES job=%s tenant=%s file=%s", job.id, tenant, filename)
+    except Exception as e:
+        logger.error("Queue enqueue failed: %s", e)
+        if pending is not None and not upload.exists():
+            os.replace(pending, upload)
+        raise HTTPException(status_code=500, detail={"error": {"code": 500, "type": "internal_error", "message": "Failed to enqueue deletion job"}})
+    return JSONResponse(status_code=202, content={"job_id": job.id, "tenant": tenant, "files": [filename]})
+
+
 @app.get("/status/{job_id}")
 def status(job_id: str):
     q = get_queue()
@@ -258,45 +543,431 @@ def status(job_id: str):
     err = job.meta.get("error") if job.meta else None
     # tenant saved in meta by worker
     tenant = job.meta.get("tenant") if job.meta else None
-    return {"job_id": job.id, "tenant": tenant, "status": st, "progress": progress, "error": err}
+    # Taken over by another job of the tenant (see worker coalescing): that job's progress is ours
+    leader_id = job.meta.get("coalesced_into") if job.meta else None
+    if leader_id and rq_st == "started":
+        leader = q.fetch_job(leader_id)
+        leader_st = leader.get_status(refresh=True) if leader is not None else None
+        if leader_st == "started":
+            progress = int(leader.meta.get("progress", 0))
+        elif leader_st != "finished":
+            # The job running it died before finishing or requeueing ours
+            st, err = "error", (leader.meta.get("error") if leader is not None else None) or "Indexing job was lost"
+    out = {"job_id": job.id, "tenant": tenant, "status": st, "progress": progress, "error": err}
+    if leader_id:
+        out["coalesced_into"] = leader_id
+    return out
 
 
 class AskBody(BaseModel):
     question: str
     top_k: Optional[int] = None
+    mode: Optional[Literal["dense", "hybrid"]] = None
+    rerank: Optional[bool] = None
+    mmr: Optional[bool] = None
+    merge_adjacent: Optional[bool] = None
+    # Restrict retrieval to these files / pages (inclusive) / upload window
+    filenames: Optional[List[str]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    uploaded_after: Optional[datetime] = None
+    uploaded_before: Optional[datetime] = None
+    debug: bool = False
+
+    def search_options(self) -> "SearchOptions":
+        flt = metadata_filter(self.filenames, self.page_from, self.page_to, self.uploaded_after, self.uploaded_before)
+        return search_options(self.mode, self.rerank, self.mmr, self.merge_adjacent, flt)
+
+
+def _preview(doc: Document, score: float, query: str) -> SourcePreview:
+    meta = doc.metadata or {}
+    snippet, hl = extract_snippet_and_highlights(doc.page_content, query)
+    return SourcePreview(
+        id=str(meta.get("id") or uuid.uuid4()),
+        score=score,
+        filename=meta.get("source"),
+        page=meta.get("page"),
+        snippet=snippet,
+        highlights=hl,
+        text=doc.page_content,
+    )
 
 
-def _search(tenant: str, query: str, k: int) -> List[SourcePreview]:
-    emb = build_langchain_embeddings(get_embeddings())
-    vs = load_vectorstore(tenant)
-    # Fetch docs and distances
-    results = vs.similarity_search_with_score(query, k=k)
-    previews: List[SourcePreview] = []
-    for doc, dist in results:
-        meta = doc.metadata or {}
-        snippet, hl = extract_snippet_and_highlights(doc.page_content, query)
+def _lap(debug: Optional[dict], stage: str, t0: float) -> float:
+    """Record the time since t0 under debug["timings_ms"][stage]; returns the new start."""
+    now = time.perf_counter()
+    if debug is not None:
+        debug.setdefault("timings_ms", {})[stage] = round((now - t0) * 1000, 2)
+    return now
+
+
+@dataclass(frozen=True)
+class SearchOptions:
+    """How sources are selected; part of every retrieval/answer cache key."""
+
+    mode: str = "dense"
+    rerank: bool = False
+    mmr: bool = False
+    merge_adjacent: bool = False
+    filter: Optional[MetadataFilter] = None
+
+
+def search_options(
+    mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    mmr: Optional[bool] = None,
+    merge_adjacent: Optional[bool] = None,
+    flt: Optional[MetadataFilter] = None,
+) -> SearchOptions:
+    """Per-request overrides on top of the env defaults."""
+    return SearchOptions(
+        mode=mode or get_search_mode(),
+        rerank=rerank_enabled() if rerank is None else rerank,
+        mmr=_env_flag("SEARCH_MMR") if mmr is None else mmr,
+        merge_adjacent=_env_flag("SEARCH_MERGE_ADJACENT") if merge_adjacent is None else merge_adjacent,
+        filter=flt,
+    )
+
+
+def metadata_filter(
+    filenames: Optional[List[str]] = None,
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+) -> Optional[MetadataFilter]:
+    return MetadataFilter.build(
+        filenames,
+        page_from,
+        page_to,
+        uploaded_after.timestamp() if uploaded_after is not None else None,
+        uploaded_before.timestamp() if uploaded_before is not None else None,
+    )
+
+
+@dataclass
+class _Candidate:
+    doc: Document
+    score: float
+    # FAISS positions of the chunk(s); several once adjacent chunks are merged
+    positions: List[Optional[int]]
+
+
+def _dense_candidates(vs: FAISS, qvec: List[float], n: int, mask: Optional[np.ndarray] = None) -> List[_Candidate]:
+    # Search the index directly (not via LangChain) to keep the positions for MMR
+    q = np.asarray([qvec], dtype="float32")
+    if getattr(vs, "_normalize_L2", False):
+        faiss.normalize_L2(q)
+    if mask is None:
+        dists, idx = vs.index.search(q, n)
+    else:
+        # Only allowed positions are scored, so a filter never costs top-k slots
+        dists, idx = filtered_search(vs.index, q, n, mask, exact_max=int(os.getenv("FILTER_EXACT_MAX", "4096")))
+    out: List[_Candidate] = []
+    for pos, dist in zip(idx[0], dists[0]):
+        if pos < 0:
+            continue
+        doc = vs.docstore.search(vs.index_to_docstore_id[int(pos)])
+        if not isinstance(doc, Document):
+            continue
         # Convert distance (lower better) to similarity [0..1], here assume cosine distance in [0..2] approx
-        sim = 1.0 / (1.0 + float(dist))
-        previews.append(
-            SourcePreview(
-                id=str(meta.get("id") or uuid.uuid4()),
-                score=sim,
-                filename=meta.get("source"),
-                page=meta.get("page"),
-                snippet=snippet,
-                highlights=hl,
-            )
-        )
+        out.append(_Candidate(doc, 1.0 / (1.0 + float(dist)), [int(pos)]))
+    return out
+
+
+def _doc_id(doc: Document) -> str:
+    return str(doc.id or (doc.metadata or {}).get("id"))
+
+
+def _hybrid_candidates(
+    vs: FAISS, sparse: BM25Index, query: str, qvec: List[float], n: int, mask: Optional[np.ndarray] = None
+) -> List[_Candidate]:
+    """Fuse dense and BM25 candidates with weighted reciprocal rank fusion."""
+    fetch = max(n, int(os.getenv("HYBRID_CANDIDATES", "50")))
+    w_dense = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+    w_sparse = float(os.getenv("HYBRID_SPARSE_WEIGHT", "1.0"))
+    rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+    dense = {_doc_id(c.doc): c for c in _dense_candidates(vs, qvec, fetch, mask)}
+    keep = None
+    if mask is not None:
+
+        def keep(cid: str) -> bool:
+            pos = _position_of(vs, cid)
+            return pos is not None and pos < len(mask) and bool(mask[pos])
+
+    sparse_ids = [cid for cid, _ in sparse.search(query, fetch, keep)]
+    fused = reciprocal_rank_fusion([(list(dense), w_dense), (sparse_ids, w_sparse)], k=rrf_k)
+    # Scale so a chunk ranked first by both retrievers scores 1.0
+    best = (w_dense + w_sparse) / (rrf_k + 1) or 1.0
+    out: List[_Candidate] = []
+    for cid, score in fused:
+        if cid in dense:
+            out.append(replace(dense[cid], score=score / best))
+        else:
+            doc = vs.docstore.search(cid)
+            if not isinstance(doc, Document):
+                continue  # sparse index written ahead of the loaded vectorstore
+            # Position looked up only if MMR needs the vector
+            out.append(_Candidate(doc, score / best, [None]))
+        if len(out) >= n:
+            break
+    return out
+
+
+def _rerank(query: str, cands: List[_Candidate], debug: Optional[dict]) -> List[_Candidate]:
+    res = get_reranker().rerank(query, [c.doc.page_content for c in cands])
+    if debug is not None:
+        debug["rerank"] = res.info()
+    # Scored candidates carry the cross-encoder score; unscored (over budget) keep the retriever's
+    return [replace(cands[i], score=res.scores.get(i, cands[i].score)) for i in res.order]
+
+
+def _merge_adjacent(cands: List[_Candidate]) -> List[_Candidate]:
+    """Fold candidates that are neighbouring chunks of the same page into one source.
+
+    Overlapping chunks otherwise fill several top-k slots with mostly the same
+    text. A merged source ranks where its best part ranked, scores as its best
+    part, and its text is the parts joined in order with the overlap removed.
+    Chunks without a "chunk" position (indexes built before it was recorded)
+    are left alone.
+    """
+    groups: List[List[_Candidate]] = []
+    group_of: Dict[tuple, int] = {}
+    for c in cands:
+        md = c.doc.metadata or {}
+        idx = md.get("chunk")
+        if not isinstance(idx, int):
+            groups.append([c])
+            continue
+        key = (md.get("source"), md.get("page"))
+        hits = sorted({group_of[key + (idx + d,)] for d in (-1, 1) if key + (idx + d,) in group_of})
+        if not hits:
+            g = len(groups)
+            groups.append([c])
+        else:
+            g = hits[0]
+            groups[g].append(c)
+            for other in hits[1:]:  # c bridges two groups: fold the later one in
+                groups[g].extend(groups[other])
+                for member in groups[other]:
+                    mmd = member.doc.metadata
+                    group_of[(mmd.get("source"), mmd.get("page"), mmd["chunk"])] = g
+                groups[other] = []
+        group_of[key + (idx,)] = g
+    out: List[_Candidate] = []
+    for parts in groups:
+        if len(parts) == 1:
+            out.append(parts[0])
+        elif parts:
+            head = parts[0]  # best ranked part: its id and score represent the merged source
+            ordered = sorted(parts, key=lambda c: c.doc.metadata["chunk"])
+            text = ordered[0].doc.page_content
+            for c in ordered[1:]:
+                text = join_chunks(text, c.doc.page_content)
+            md = dict(head.doc.metadata)
+            md["chunks"] = [c.doc.metadata["chunk"] for c in ordered]
+            doc = Document(id=head.doc.id, page_content=text, metadata=md)
+            out.append(_Candidate(doc, max(c.score for c in parts), [p for c in ordered for p in c.positions]))
+    return out
+
+
+# Live-position masks of loaded stores that still hold vectors of deleted chunks
+_LIVE: "weakref.WeakKeyDictionary[FAISS, np.ndarray]" = weakref.WeakKeyDictionary()
+
+# Reverse of index_to_docstore_id for pickled docstores, built on first need per loaded store
+_POSITIONS: "weakref.WeakKeyDictionary[FAISS, Dict[str, int]]" = weakref.WeakKeyDictionary()
+
+
+def _position_of(vs: FAISS, cid: str) -> Optional[int]:
+    if isinstance(vs.docstore, ColumnarDocstore):
+        return vs.docstore.row(cid)
+    positions = _POSITIONS.get(vs)
+    if positions is None:
+        positions = _POSITIONS[vs] = {str(v): int(p) for p, v in vs.index_to_docstore_id.items()}
+    return positions.get(cid)
+
+
+def _mmr(vs: FAISS, cands: List[_Candidate], k: int, debug: Optional[dict]) -> List[_Candidate]:
+    """Diversify the top k with MMR over the stored vectors (no re-embedding)."""
+    for c in cands:
+        if None in c.positions:
+            c.positions = [p if p is not None else _position_of(vs, _doc_id(c.doc)) for p in c.positions]
+    flat = sorted({p for c in cands for p in c.positions if p is not None})
+    try:
+        stored = vs.index.reconstruct_batch(np.asarray(flat, dtype="int64")) if flat else None
+    except RuntimeError as e:
+        # e.g. an IVF index saved without a direct map
+        if debug is not None:
+            debug["mmr"] = {"skipped": str(e).splitlines()[0]}
+        return cands
+    row_of = {p: i for i, p in enumerate(flat)}
+    vectors = np.zeros((len(cands), vs.index.d), dtype="float32")
+    for i, c in enumerate(cands):
+        rows = [row_of[p] for p in c.positions if p is not None]
+        if rows:
+            vectors[i] = stored[rows].mean(axis=0)
+    order = mmr_select(vectors, [c.score for c in cands], k, float(os.getenv("MMR_LAMBDA", "0.7")))
+    if debug is not None:
+        debug["mmr"] = {"candidates": len(cands), "picked": order}
+    return [cands[i] for i in order]
+
+
+def _search(
+    tenant: str,
+    query: str,
+    k: int,
+    qvec: Optional[List[float]] = None,
+    opts: SearchOptions = SearchOptions(),
+    debug: Optional[dict] = None,
+) -> List[SourcePreview]:
+    t0 = time.perf_counter()
+    vs = load_vectorstore(tenant)
+    t0 = _lap(debug, "load_index", t0)
+    # Embed with the current backend: cached vectorstores outlive the request that loaded them
+    if qvec is None:
+        qvec = get_query_embedder().embed_query(query)
+        t0 = _lap(debug, "embed", t0)
+    # Reranking, MMR and merging choose the final k from a larger candidate set
+    n = k
+    if opts.rerank:
+        n = max(n, get_reranker().cfg.candidates)
+    if opts.mmr or opts.merge_adjacent:
+        n = max(n, int(os.getenv("MMR_FETCH_K", "20")))
+    # Deleted chunks keep their vectors until the index is compacted: never retrieve them
+    mask = _LIVE.get(vs)
+    if opts.filter is not None:
+        times = load_upload_times(tenant) if opts.filter.by_time else None
+        fmask = position_metadata(vs).mask(opts.filter, times)
+        mask = fmask if mask is None else fmask & mask
+        if debug is not None:
+            debug["filter"] = {"allowed": int(mask.sum()), "total": len(mask)}
+        t0 = _lap(debug, "filter", t0)
+    sparse = load_sparse_index(tenant) if opts.mode == "hybrid" else None
+    # Indexes from before hybrid search have no bm25.json until the next indexing job
+    if sparse is not None:
+        cands = _hybrid_candidates(vs, sparse, query, qvec, n, mask)
+    else:
+        cands = _dense_candidates(vs, qvec, n, mask)
+    t0 = _lap(debug, "retrieve", t0)
+    if opts.rerank and len(cands) > 1:
+        cands = _rerank(query, cands, debug)
+        t0 = _lap(debug, "rerank", t0)
+    if opts.merge_adjacent:
+        before = len(cands)
+        cands = _merge_adjacent(cands)
+        if debug is not None:
+            debug["merged_chunks"] = before - len(cands)
+        t0 = _lap(debug, "merge", t0)
+    if opts.mmr and len(cands) > k:
+        cands = _mmr(vs, cands, k, debug)
+        t0 = _lap(debug, "mmr", t0)
+    previews = [_preview(c.doc, c.score, query) for c in cands[:k]]
+    _lap(debug, "snippets", t0)
     return previews
 
 
+async def _embed_query_async(query: str) -> Optional[List[float]]:
+    embedder = get_query_embedder()
+    if not hasattr(embedder, "aembed_query"):
+        return None
+    # Batched or remote embeddings are awaited outside the pool: batching is not
+    # capped by RETRIEVAL_CONCURRENCY and network waits don't hold a worker.
+    # Local models without batching stay on the pool, which bounds their CPU use.
+    if isinstance(embedder, EmbeddingBackend) and embedder.cfg.backend != "openai":
+        return None
+    return await embedder.aembed_query(query)
+
+
+async def _search_async(
+    tenant: str,
+    query: str,
+    k: int,
+    qvec: Optional[List[float]] = None,
+    opts: Optional[SearchOptions] = None,
+    debug: Optional[dict] = None,
+) -> List[SourcePreview]:
+    t_start = time.perf_counter()
+    opts = opts or search_options()
+    cache_key = None
+    if RETRIEVAL_CACHE_ENABLED:
+        # The generation changes on every index rewrite, so stale entries are never hit
+        cache_key = (tenant, index_generation(tenant), " ".join(query.split()), k, opts)
+        cached = RETRIEVAL_CACHE.get(cache_key)
+        if cached is not None:
+            if debug is not None:
+                debug["cache"] = "hit"
+                _lap(debug, "total", t_start)
+            return list(cached)
+    if qvec is None:
+        t0 = time.perf_counter()
+        qvec = await _embed_query_async(query)
+        if qvec is not None:
+            _lap(debug, "embed", t0)
+    try:
+        res = await RETRIEVAL_POOL.run(_search, tenant, query, k, qvec, opts, debug)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail={"error": {"code": 503, "type": "overloaded", "message": "Too many concurrent searches"}})
+    if cache_key is not None:
+        RETRIEVAL_CACHE.set(cache_key, tuple(res))
+    if debug is not None:
+        debug["cache"] = "miss" if cache_key is not None else "off"
+        _lap(debug, "total", t_start)
+    return res
+
+
 @app.get("/search")
-def search(tenant: str, q: str, k: Optional[int] = None):
+async def search(
+    tenant: str,
+    q: str,
+    k: Optional[int] = None,
+    mode: Optional[Literal["dense", "hybrid"]] = None,
+    rerank: Optional[bool] = None,
+    mmr: Optional[bool] = None,
+    merge_adjacent: Optional[bool] = None,
+    filename: Optional[List[str]] = Query(None),
+    page_from: Optional[int] = None,
+    page_to: Optional[int] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    debug: bool = False,
+):
     tenant = ensure_tenant(tenant)
     if not has_index(tenant):
         raise HTTPException(status_code=404, detail={"error": {"code": 404, "type": "not_found", "message": "Index not found"}})
-    res = _search(tenant, q, k or get_top_k())
-    return {"results": [r.model_dump() for r in res]}
+    info: Optional[dict] = {} if debug else None
+    flt = metadata_filter(filename, page_from, page_to, uploaded_after, uploaded_before)
+    opts = search_options(mode, rerank, mmr, merge_adjacent, flt)
+    res = await _search_async(tenant, q, k or get_top_k(), opts=opts, debug=info)
+    out: dict = {"results": [r.model_dump() for r in res]}
+    if info is not None:
+        out["debug"] = info
+    return out
+
+
+def _build_prompt(question: str, sources: List[SourcePreview], chat_cfg: ChatConfig, debug: Optional[dict] = None) -> str:
+    built = build_prompt(question, [PromptSource(snippet=s.snippet, text=s.text) for s in sources], chat_cfg.max_tokens)
+    if debug is not None:
+        debug["prompt"] = built.info()
+    return built.prompt
+
+
+async def _cached_answer(tenant: str, question: str, k: int, model: str, opts: SearchOptions):
+    """Look up the answer cache; returns (hit, cache key, query vector computed for the semantic lookup)."""
+    if not ANSWER_CACHE_ENABLED:
+        return None, None, None
+    scope = ANSWER_CACHE.scope(tenant, index_generation(tenant), k, model, opts)
+    key = ANSWER_CACHE.key(scope, question)
+    hit = ANSWER_CACHE.get(key)
+    qvec = None
+    if hit is None and ANSWER_CACHE.semantic:
+        qvec = await _embed_query_async(question)
+        if qvec is None:
+            try:
+                qvec = await RETRIEVAL_POOL.run(get_query_embedder().embed_query, question)
+            except QueueFullError:
+                raise HTTPException(status_code=503, detail={"error": {"code": 503, "type": "overloaded", "message": "Too many concurrent searches"}})
+        hit = ANSWER_CACHE.get_semantic(scope, qvec)
+    return hit, key, qvec
 
 
 @app.post("/answer")
@@ -307,20 +978,24 @@ async def answer(body: AskBody, x_tenant_id: Optional[str] = Header(None, alias=
     if not has_index(tenant):
         raise HTTPException(status_code=404, detail={"error": {"code": 404, "type": "not_found", "message": "Index not found"}})
     k = body.top_k or get_top_k()
-    sources = _search(tenant, body.question, k)
-    # Build prompt
-    ctx = "\n\n".join([f"Source {i+1}: {s.snippet}" for i, s in enumerate(sources)])
-    prompt = (
-        "You are a helpful assistant. Answer the user based only on the sources.\n"
-        "If unsure, say you don't know.\n\n"
-        f"Question: {body.question}\n\n"
-        f"Sources:\n{ctx}\n\n"
-        "Answer in the language of the question."
-    )
+    chat_cfg = ChatConfig()
+    opts = body.search_options()
+    info: Optional[dict] = {} if body.debug else None
+    hit, cache_key, qvec = await _cached_answer(tenant, body.question, k, chat_cfg.model, opts)
+    if hit is not None:
+        return QAResponse(answer=hit.answer, sources=[SourcePreview(**s) for s in hit.sources], debug={"answer_cache": "hit"} if body.debug else None)
+    sources = await _search_async(tenant, body.question, k, qvec, opts=opts, debug=info)
+    # Tokenizing every source is CPU work: keep it off the event loop
+    prompt = await run_in_threadpool(_build_prompt, body.question, sources, chat_cfg, info)
     chunks: List[str] = []
-    async for tok in chat_stream(prompt, ChatConfig()):
+    t0 = time.perf_counter()
+    async for tok in chat_stream(prompt, chat_cfg):
         chunks.append(tok)
-    return QAResponse(answer="".join(chunks), sources=sources)
+    _lap(info, "llm", t0)
+    # An empty answer means the LLM call failed; don't pin that
+    if cache_key is not None and chunks:
+        ANSWER_CACHE.put(cache_key, CachedAnswer(tokens=chunks, sources=[s.model_dump() for s in sources], question=body.question), qvec)
+    return QAResponse(answer="".join(chunks), sources=sources, debug=info)
 
 
 @app.post("/answer/stream")
@@ -331,23 +1006,43 @@ async def answer_stream(body: AskBody, request: Request, x_tenant_id: Optional[s
     if not has_index(tenant):
         raise HTTPException(status_code=404, detail={"error": {"code": 404, "type": "not_found", "message": "Index not found"}})
     k = body.top_k or get_top_k()
-    sources = _search(tenant, body.question, k)
-    ctx = "\n\n".join([f"Source {i+1}: {s.snippet}" for i, s in enumerate(sources)])
-    prompt = (
-        "You are a helpful assistant. Answer the user based only on the sources.\n"
-        "If unsure, say you don't know.\n\n"
-        f"Question: {body.question}\n\n"
-        f"Sources:\n{ctx}\n\n"
-        "Answer in the language of the question."
-    )
+    chat_cfg = ChatConfig()
+    opts = body.search_options()
+    info: Optional[dict] = {} if body.debug else None
+    hit, cache_key, qvec = await _cached_answer(tenant, body.question, k, chat_cfg.model, opts)
+    if hit is not None:
+
+        async def replay_gen() -> AsyncGenerator[dict, None]:
+            # Same event sequence as a live answer, so clients don't need to know
+            yield {"event": "context", "data": json.dumps({"sources": hit.sources})}
+            for tok in hit.tokens:
+                yield {"event": "token", "data": json.dumps({"t": tok})}
+            yield {"event": "done", "data": json.dumps({"finish_reason": "stop", "cached": True})}
+
+        return EventSourceResponse(replay_gen())
+
+    sources = await _search_async(tenant, body.question, k, qvec, opts=opts, debug=info)
+    # Tokenizing every source is CPU work: keep it off the event loop
+    prompt = await run_in_threadpool(_build_prompt, body.question, sources, chat_cfg, info)
 
     async def event_gen() -> AsyncGenerator[dict, None]:
         # Send context first
-        yield {"event": "context", "data": json.dumps({"sources": [s.model_dump() for s in sources]})}
+        source_dicts = [s.model_dump() for s in sources]
+        yield {"event": "context", "data": json.dumps({"sources": source_dicts})}
+        tokens: List[str] = []
         try:
-            async for tok in chat_stream(prompt, ChatConfig()):
+            t0 = time.perf_counter()
+            async for tok in chat_stream(prompt, chat_cfg):
+                tokens.append(tok)
                 yield {"event": "token", "data": json.dumps({"t": tok})}
-            yield {"event": "done", "data": json.dumps({"finish_reason": "stop"})}
+            _lap(info, "llm", t0)
+            # Store before "done": clients usually disconnect as soon as they see it
+            if cache_key is not None and tokens:
+                ANSWER_CACHE.put(cache_key, CachedAnswer(tokens=tokens, sources=source_dicts, question=body.question), qvec)
+            done = {"finish_reason": "stop"}
+            if info is not None:
+                done["debug"] = info
+            yield {"event": "done", "data": json.dumps(done)}
         except Exception as e:
             logger.exception("Error during streaming")
             yield {"event": "error", "data": json.dumps({"message": str(e)})}
@@ -358,11 +1053,17 @@ async def answer_stream(body: AskBody, request: Request, x_tenant_id: Optional[s
 @app.post("/reset")
 def reset(x_tenant_id: Optional[str] = Header(None, alias="X-Tenant-ID")):
     tenant = ensure_tenant(x_tenant_id)
-    # If indexing is in progress, could return 409; skipping for MVP
-    # Delete index and uploads
-    idx = index_path(tenant)
-    up = UPLOADS_DIR / tenant
-    for p in [idx, up]:
-        if p.exists():
-            shutil.rmtree(p, ignore_errors=True)
+    # Delete index (all generations) and uploads, unless a job is writing the index right now
+    try:
+        with tenant_lock(tenant):
+            for p in [tenant_dir(tenant), UPLOADS_DIR / tenant]:
+                if p.exists():
+                    shutil.rmtree(p, ignore_errors=True)
+    except LockTimeout:
+        raise HTTPException(status_code=409, detail={"error": {"code": 409, "type": "conflict", "message": "Indexing in progress"}})
+    VS_CACHE.invalidate(tenant)
+    SPARSE_CACHE.invalidate(tenant)
+    MANIFEST_CACHE.invalidate(tenant)
+    ANSWER_CACHE.invalidate_tenant(tenant)
+    RETRIEVAL_CACHE.discard_where(lambda key: key[0] == tenant)
     return {"deleted": True}
@@ -0,0 +1,169 @@
+"""Document loading for the worker, optionally spread over a process pool.
+
+Kept apart from worker.py so pool processes only import the parsers, not the
+embedding/index stack.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from kits.kit_common import normalize_text
+
+
+def iter_pdf_pages(path: Path, start: int = 0, stop: Optional[int] = None) -> Iterator[Document]:
+    """Pages [start, stop) of a PDF, extracted like PyPDFLoader does but without touching the others."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(str(path))
+    total = len(reader.pages)
+    stop = total if stop is None else min(stop, total)
+    for i in range(start, stop):
+        text = reader.pages[i].extract_text()
+        yield Document(
+            page_content=text,
+            metadata={"source": str(path), "total_pages": total, "page": i, "page_label": reader.page_labels[i]},
+        )
+
+
+def iter_documents(path: Path, pages: Optional[Tuple[int, int]] = None) -> Iterator[Document]:
+    ext = path.suffix.lower()
+    if ext == ".pdf":
+        # Page by page, so a large file is never fully in memory; pages selects a range
+        docs = iter_pdf_pages(path, *(pages or (0, None)))
+    elif ext in {".md", ".txt"}:
+        from langchain_community.document_loaders import TextLoader
+
+        docs = TextLoader(str(path), encoding="utf-8").lazy_load()
+    elif ext == ".docx":
+        from langchain_community.document_loaders.word_document import Docx2txtLoader
+
+        docs = Docx2txtLoader(str(path)).lazy_load()
+    else:
+        raise ValueError(f"Unsupported file: {path.name}")
+    for d in docs:
+        d.page_content = normalize_text(d.page_content)
+        yield d
+
+
+def load_documents(path: Path) -> List[Document]:
+    return list(iter_documents(path))
+
+
+def parse_part(path: str, pages: Optional[Tuple[int, int]]) -> List[Document]:
+    """Pool task: normalized documents of a file, or of a page range of a PDF."""
+    return list(iter_documents(Path(path), pages))
+
+
+def split_parts(path: Path, pages_per_part: int) -> List[Optional[Tuple[int, int]]]:
+    """Page ranges a file is parsed in; None means the whole file in one task."""
+    if path.suffix.lower() != ".pdf":
+        return [None]
+    try:
+        from pypdf import PdfReader
+
+        total = len(PdfReader(str(path)).pages)
+    except Exception:
+        return [None]  # unreadable: the parse task raises it when the file is indexed
+    return [(s, min(s + pages_per_part, total)) for s in range(0, total, pages_per_part)] or [None]
+
+
+_PARSE_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def parse_pool(workers: int) -> ProcessPoolExecutor:
+    """The process-wide parser pool, created on first use."""
+    global _PARSE_POOL
+    if _PARSE_POOL is None:
+        # spawn: the worker may hold model threads, which forked children would inherit mid-state
+        ctx = multiprocessing.get_context(os.getenv("PARSE_START_METHOD", "spawn"))
+        _PARSE_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+    return _PARSE_POOL
+
+
+def shutdown_parse_pool() -> None:
+    global _PARSE_POOL
+    if _PARSE_POOL is not None:
+        _PARSE_POOL.shutdown(cancel_futures=True)
+        _PARSE_POOL = None
+
+
+class DocumentStream:
+    """Parses a job's files in a process pool and hands their documents back file by file, in order.
+
+    PDFs are split into page ranges, so a single large file also spreads over
+    all workers. At most `lookahead` parts are in flight or waiting to be
+    consumed, which bounds memory while the pool keeps parsing ahead of the
+    file being embedded. The pool is only used once there are at least two
+    parts to spread over `workers`; otherwise, and for files in `skip`
+    (expected unchanged), files are parsed lazily in-process.
+    """
+
+    def __init__(self, paths: List[Path], workers: int, pages_per_part: int, lookahead: int, skip: Iterable[int] = ()):
+        self.paths: List[Path] = []
+        self._workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pages_per_part = pages_per_part
+        self._lookahead = max(1, lookahead)
+        self._pooled: Set[int] = set()  # files whose parts go through the pool
+        self._parts: deque = deque()
+        self._inflight: deque = deque()  # (file index, future), in submission order
+        self.extend(paths, skip)  # starts parsing while the caller loads the index
+
+    def extend(self, paths: List[Path], skip: Iterable[int] = ()) -> None:
+        """Append files after the current ones (e.g. of jobs taken over later); skip holds stream indices."""
+        start = len(self.paths)
+        self.paths.extend(paths)
+        if self._workers <= 1:
+            return
+        skip = set(skip)
+        parts = [(i, rng) for i, p in enumerate(paths, start) if i not in skip for rng in split_parts(p, self._pages_per_part)]
+        if self._pool is None and len(parts) < 2:
+            return  # nothing to spread: a pool would only add its startup cost
+        self._pool = parse_pool(self._workers)
+        self._pooled.update(i for i, _ in parts)
+        self._parts.extend(parts)
+        self._fill()
+
+    def _fill(self) -> None:
+        while self._parts and len(self._inflight) < self._lookahead:
+            i, rng = self._parts.popleft()
+            self._inflight.append((i, self._pool.submit(parse_part, str(self.paths[i]), rng)))
+
+    def documents(self, i: int) -> Iterator[Document]:
+        """Documents of file i; files must be consumed (or skipped) in order."""
+        if i not in self._pooled:
+            if i < len(self.paths):
+                yield from iter_documents(self.paths[i])
+            return
+        while True:
+            self._fill()
+            if not self._inflight or self._inflight[0][0] != i:
+                return
+            _, fut = self._inflight.popleft()
+            try:
+                docs = fut.result()
+            except BrokenProcessPool:
+                shutdown_parse_pool()  # a parser process died; the next job gets a fresh pool
+                raise
+            yield from docs
+
+    def skip(self, i: int) -> None:
+        """Drop file i's parts (e.g. the file is unchanged)."""
+        while self._inflight and self._inflight[0][0] == i:
+            self._inflight.popleft()[1].cancel()
+        while self._parts and self._parts[0][0] == i:
+            self._parts.popleft()
+
+    def close(self) -> None:
+        """Cancel whatever is still queued (job failed or finished early)."""
+        self._parts.clear()
+        while self._inflight:
+            self._inflight.popleft()[1].cancel()
@@ -1,20 +1,50 @@
 from __future__ import annotations
 
+import logging
 import os
+import time
 import uuid
 from pathlib import Path
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Set
 
 from redis import Redis
-from rq import Queue, Worker
+from rq import Queue, SimpleWorker, Worker
+from rq.defaults import DEFAULT_FAILURE_TTL, DEFAULT_RESULT_TTL
+from rq.job import Job, JobStatus
+from rq.utils import utcnow
 
-from kits.kit_common import normalize_text
 from kits.kit_chunker import split_text, split_markdown
-from kits.kit_llm import EmbeddingBackend, EmbedConfig
+from kits.kit_llm import get_embedding_backend
+from kits.kit_index import (
+    AnnConfig,
+    BM25Index,
+    IndexVersion,
+    TenantLock,
+    TenantManifest,
+    chunk_hash,
+    compact_documents,
+    current_version,
+    delete_documents,
+    docstore_format,
+    file_sha256,
+    load_tombstones,
+    load_vectorstore,
+    needs_rebuild,
+    publish_version,
+    rebuild_index,
+    resolve_kind,
+    save_vectorstore,
+)
 
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_community.document_loaders.word_document import Docx2txtLoader
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from apps.worker.parsing import (
+    DocumentStream,
+    iter_documents as _iter_documents,
+    load_documents as _load_documents,
+    shutdown_parse_pool,
+)
 
 
 APP_ROOT = Path(__file__).resolve().parents[2]
@@ -23,26 +53,10 @@ DATA_DIR = Path(_os.getenv("DOC_RAG_DATA_DIR", str(APP_ROOT / "data")))
 FAISS_DIR = DATA_DIR / "faiss"
 UPLOADS_DIR = DATA_DIR / "uploads"
 
-
-def _load_documents(path: Path):
-    ext = path.suffix.lower()
-    if ext == ".pdf":
-        loader = PyPDFLoader(str(path))
-    elif ext in {".md", ".txt"}:
-        loader = TextLoader(str(path), encoding="utf-8")
-    elif ext == ".docx":
-        loader = Docx2txtLoader(str(path))
-    else:
-        raise ValueError(f"Unsupported file: {path.name}")
-    docs = loader.load()
-    # normalize
-    for d in docs:
-        d.page_content = normalize_text(d.page_content)
-    return docs
+logger = logging.getLogger("worker")
 
 
-def _chunk_documents(docs, max_tokens: int, overlap: int):
-    chunks = []
+def _iter_chunks(docs: Iterable[Document], max_tokens: int, overlap: int) -> Iterator[tuple[str, dict]]:
     for d in docs:
         text = d.page_content
         if not text:
@@ -51,45 +65,411 @@ def _chunk_documents(docs, max_tokens: int, overlap: int):
             parts = split_markdown(text, max_tokens=max_tokens, overlap=overlap)
         else:
             parts = split_text(text, max_tokens=max_tokens, overlap=overlap)
-        for p in parts:
+        for i, p in enumerate(parts):
             md = dict(d.metadata or {})
             md["id"] = uuid.uuid4().hex
-            chunks.append((p, md))
-    return chunks
+            # Position within the page/document: lets search merge neighbouring chunks
+            md["chunk"] = i
+            yield p, md
+
+
+def _chunk_documents(docs, max_tokens: int, overlap: int):
+    return list(_iter_chunks(docs, max_tokens=max_tokens, overlap=overlap))
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch: list = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _IndexWriter:
+    """Embeds chunk batches and appends them to the tenant's FAISS index in memory."""
+
+    def __init__(self, tenant: str):
+        self.tenant_dir = FAISS_DIR / tenant
+        # Published generations are never modified: read the current one, save() writes the next
+        self.version = current_version(self.tenant_dir)
+        self.vs_dir = self.version.path if self.version is not None else self.tenant_dir
+        self.backend = get_embedding_backend()
+        from langchain_core.embeddings import Embeddings as LCEmb
+
+        backend = self.backend
+
+        class _LCEmb(LCEmb):
+            def embed_documents(self, texts: List[str]) -> List[List[float]]:
+                return backend.embed_texts(texts)
+
+            def embed_query(self, text: str) -> List[float]:
+                return backend.embed_query(text)
+
+        self.emb = _LCEmb()
+        self.vs: Optional[FAISS] = None
+        # Positions of deleted chunks whose vectors are still in the (non-flat) index
+        self.tombstones: set = set()
+        if docstore_format(self.vs_dir) is not None:
+            self.vs = load_vectorstore(self.vs_dir, self.emb, writable=True)
+            self.tombstones = set(load_tombstones(self.vs_dir).tolist())
+        self.manifest = TenantManifest.load(self.vs_dir)
+        self.ann_cfg = AnnConfig()
+        if self.vs is not None and not self.manifest.exists():
+            self._bootstrap_manifest()
+        loaded_bm25 = BM25Index.load(self.vs_dir)
+        self.bm25 = loaded_bm25 or BM25Index()
+        # Index built before hybrid search: backfill the sparse index from the docstore
+        self._bm25_backfilled = self.vs is not None and loaded_bm25 is None
+        if self._bm25_backfilled:
+            for cid in self.vs.index_to_docstore_id.values():
+                doc = self.vs.docstore.search(cid)
+                if isinstance(doc, Document):
+                    self.bm25.add(cid, doc.page_content)
+        self.added = 0
+        self.deleted = 0
+        self.removed_files = 0
+        self.compacted = 0
+
+    def _bootstrap_manifest(self) -> None:
+        # Index built before manifests existed: recover chunk hashes from the
+        # docstore so re-uploads of those files are diffed instead of duplicated.
+        chunks_by_file: dict = {}
+        for cid in self.vs.index_to_docstore_id.values():
+            doc = self.vs.docstore.search(cid)
+            if not isinstance(doc, Document):
+                continue
+            name = Path(str(doc.metadata.get("source", ""))).name
+            chunks_by_file.setdefault(name, []).append([chunk_hash(doc.page_content, doc.metadata.get("page")), cid])
+        for name, chunks in chunks_by_file.items():
+            self.manifest.set_file(name, "", chunks)
+
+    def add(self, chunks: List[tuple[str, dict]]) -> None:
+        texts = [t for t, _ in chunks]
+        metas = [m for _, m in chunks]
+        ids = [m["id"] for m in metas]
+        vecs = self.backend.embed_texts(texts)
+        pairs = list(zip(texts, vecs))
+        if self.vs is None:
+            self.vs = FAISS.from_embeddings(pairs, self.emb, metas, ids=ids)
+        else:
+            self.vs.add_embeddings(pairs, metas, ids=ids)
+        for cid, text in zip(ids, texts):
+            self.bm25.add(cid, text)
+        self.added += len(texts)
+
+    def delete(self, ids: List[str]) -> None:
+        if self.vs is None or not ids:
+            return
+        self.deleted += delete_documents(self.vs, ids, self.ann_cfg, self.tombstones)
+        self.bm25.remove(ids)
 
+    def remove_file(self, name: str) -> bool:
+        """Delete all chunks of an indexed file; returns False if it is not in the index."""
+        if self.manifest.get(name) is None:
+            return False
+        self.delete(self.manifest.remove_file(name))
+        self.removed_files += 1
+        return True
 
-def _save_to_faiss(tenant: str, chunks: List[tuple[str, dict]]):
-    vs_dir = FAISS_DIR / tenant
-    vs_dir.mkdir(parents=True, exist_ok=True)
-    emb_backend = EmbeddingBackend(EmbedConfig())
-    from langchain_core.embeddings import Embeddings as LCEmb
+    @property
+    def tombstone_ratio(self) -> float:
+        n = self.vs.index.ntotal if self.vs is not None else 0
+        return len(self.tombstones) / n if n else 0.0
 
-    class _LCEmb(LCEmb):
-        def embed_documents(self, texts: List[str]) -> List[List[float]]:
-            return emb_backend.embed_texts(texts)
+    def compact(self) -> int:
+        """Drop tombstoned vectors by rebuilding the index from the live ones; returns how many."""
+        if self.vs is None or not self.tombstones:
+            return 0
+        t0 = time.perf_counter()
+        live = self.vs.index.ntotal - len(self.tombstones)
+        kind = resolve_kind(self.ann_cfg, live, self.manifest.settings.get("ann_index"))
+        dropped = compact_documents(self.vs, self.tombstones, self.ann_cfg, kind)
+        self.compacted += dropped
+        logger.info("Compacted index tenant=%s: dropped %d vectors, rebuilt as %s (%d vectors) in %.0f ms", self.tenant_dir.name, dropped, kind, live, (time.perf_counter() - t0) * 1000)
+        return dropped
 
-        def embed_query(self, text: str) -> List[float]:
-            return emb_backend.embed_query(text)
+    def save(self, lock: Optional[TenantLock] = None) -> Optional[IndexVersion]:
+        """Publish the index as a new generation; returns it, or None if nothing changed."""
+        if self.vs is None:
+            return None
+        # If nothing changed, skip writing (or creating an empty) index
+        if not (self.added or self.deleted or self.removed_files or self.compacted or self._bm25_backfilled):
+            return None
+        kind = needs_rebuild(self.vs.index, self.ann_cfg, self.manifest.settings.get("ann_index"))
+        if kind is not None and self.tombstones:
+            self.compact()  # rebuilds anyway: leave the deleted vectors out
+        elif kind is not None:
+            t0 = time.perf_counter()
+            self.vs.index = rebuild_index(self.vs.index, kind, self.ann_cfg)
+            logger.info("Rebuilt index as %s (%d vectors) in %.0f ms", kind, self.vs.index.ntotal, (time.perf_counter() - t0) * 1000)
+        fmt = os.getenv("DOCSTORE_FORMAT", "pickle")
 
-    emb = _LCEmb()
+        def _write(d: Path) -> None:
+            self.bm25.save(d)
+            save_vectorstore(self.vs, d, fmt=fmt, tombstones=self.tombstones)
+            self.manifest.save(d)
+            if lock is not None:
+                lock.ensure_held()  # last check before the swap makes it visible
 
-    texts = [t for t, _ in chunks]
-    metas = [m for _, m in chunks]
+        version = publish_version(self.tenant_dir, _write, keep=max(1, int(os.getenv("INDEX_KEEP_GENERATIONS", "2"))))
+        logger.info("Published index generation %d (%d vectors) to %s", version.generation, self.vs.index.ntotal, version.path)
+        return version
 
-    # If there is nothing to add, skip creating an empty index
-    if not texts:
+    def index_file(
+        self,
+        path: Path,
+        batch_size: int,
+        max_tokens: int,
+        overlap: int,
+        on_batch=None,
+        documents: Optional[Iterable[Document]] = None,
+        sha256: Optional[str] = None,
+    ) -> bool:
+        """Index one file incrementally; returns False if it is unchanged since the last run.
+
+        Chunks whose (page, text) hash is already recorded for this file keep
+        their vectors; only new chunks are embedded and vanished ones deleted.
+        documents are the file's parsed pages when parsing happens elsewhere;
+        sha256 is the file's hash when the uploader already computed it.
+        """
+        name = path.name
+        sha = sha256 or file_sha256(path)
+        entry = self.manifest.get(name)
+        if entry is not None and entry.get("sha256") == sha:
+            return False
+        known = self.manifest.chunk_ids_by_hash(name)
+        kept: List[List[str]] = []
+
+        def _fresh() -> Iterator[tuple[str, dict]]:
+            docs = documents if documents is not None else _iter_documents(path)
+            for text, md in _iter_chunks(docs, max_tokens=max_tokens, overlap=overlap):
+                h = chunk_hash(text, md.get("page"))
+                ids = known.get(h)
+                if ids:
+                    kept.append([h, ids.pop()])
+                    continue
+                kept.append([h, md["id"]])
+                yield text, md
+
+        for batch in _batched(_fresh(), batch_size):
+            self.add(batch)
+            if on_batch is not None:
+                on_batch(batch)
+        self.delete([cid for ids in known.values() for cid in ids])
+        # The API writes each upload afresh, so its mtime is the upload time
+        self.manifest.set_file(name, sha, kept, uploaded_at=path.stat().st_mtime)
+        return True
+
+
+def _file_progress(meta: dict) -> float:
+    """Fraction of the current file covered by a chunk, from PDF page metadata when known."""
+    total = meta.get("total_pages")
+    page = meta.get("page")
+    if isinstance(total, int) and total > 0 and isinstance(page, int):
+        return min(1.0, (page + 1) / total)
+    return 0.0
+
+
+def _tenant_lock(tenant: str, job) -> TenantLock:
+    return TenantLock(
+        tenant,
+        redis=job.connection if job is not None else None,
+        lock_dir=DATA_DIR / "locks",
+        ttl_s=float(os.getenv("INDEX_LOCK_TTL_S", "60")),
+        wait_s=float(os.getenv("INDEX_LOCK_WAIT_S", "120")),
+    )
+
+
+def _schedule_compaction(job, tenant: str, writer: "_IndexWriter") -> None:
+    """Queue a compaction once deleted-but-still-indexed vectors pass COMPACT_TOMBSTONE_RATIO."""
+    ratio = writer.tombstone_ratio
+    if job is None or not writer.tombstones or ratio < float(os.getenv("COMPACT_TOMBSTONE_RATIO", "0.2")):
+        return
+    q = Queue(job.origin, connection=job.connection)
+    job_id = f"compact-{tenant}"
+    pending = q.fetch_job(job_id)
+    if pending is not None and pending.get_status(refresh=True) in {JobStatus.QUEUED, JobStatus.STARTED}:
         return
+    q.enqueue("apps.worker.worker.compact_index_job", tenant, job_id=job_id)
+    logger.info("Enqueued compaction tenant=%s tombstone ratio=%.2f", tenant, ratio)
+
+
+def _job_files(job) -> tuple[Optional[str], List[str], List[Optional[str]]]:
+    """(tenant, file_paths, file_hashes) an index_files_job was enqueued with."""
+    args = list(job.args or ())
+    kwargs = job.kwargs or {}
+    tenant = args[0] if args else kwargs.get("tenant")
+    files = list(args[1] if len(args) > 1 else kwargs.get("file_paths", []))
+    hashes = args[2] if len(args) > 2 else kwargs.get("file_hashes")
+    return tenant, files, list(hashes or [None] * len(files))
+
+
+def _files_size(paths: List[Path]) -> int:
+    total = 0
+    for p in paths:
+        try:
+            total += p.stat().st_size
+        except OSError:
+            pass  # fails the job when it is indexed
+    return total
+
+
+_SCAN_PAGE = 100  # job hashes fetched per round trip while looking for jobs to take over
+
+
+def _end_claimed_job(job, status: JobStatus, exc_string: str = "") -> None:
+    """Finish or fail a taken-over job the way RQ's worker ends the jobs it runs.
+
+    The job lands in the finished/failed registry with ended_at set, and its
+    dependents (e.g. jobs enqueued with depends_on=) are enqueued.
+    """
+    job.ended_at = utcnow()
+    with job.connection.pipeline() as pipe:
+        job.set_status(status, pipeline=pipe)
+        if status == JobStatus.FAILED:
+            ttl = job.failure_ttl if job.failure_ttl is not None else DEFAULT_FAILURE_TTL
+            job.failed_job_registry.add(job, ttl=ttl, exc_string=exc_string, pipeline=pipe)
+        else:
+            ttl = job.get_result_ttl(DEFAULT_RESULT_TTL)
+            job.save(pipeline=pipe, include_meta=False)
+            if ttl != 0:
+                job.finished_job_registry.add(job, ttl, pipeline=pipe)
+        pipe.execute()
+    Queue(job.origin, connection=job.connection, serializer=job.serializer).enqueue_dependents(job)
+    if status == JobStatus.FINISHED:
+        job.cleanup(ttl, remove_from_queue=False)
+
+
+class _JobBatch:
+    """The files of a running index job plus those of queued jobs it took over.
+
+    Uploads arrive one file per /index request, so a burst leaves several
+    jobs for the same tenant in the queue. The running job removes them from
+    the queue (marked started, with meta["coalesced_into"] set to its id) and
+    indexes their files in its own load/append/publish cycle, as long as
+    the batch stays within a job count and a total upload size, which keeps
+    it within the running job's timeout. Each claimed job is then finished
+    or failed with its own meta, or put back on the queue if the batch as a
+    whole fails (e.g. timed out); a job put back is never taken over again,
+    so it cannot drag the next batch into the same failure.
+    """
+
+    def __init__(self, job, tenant: str, paths: List[Path], hashes: List[Optional[str]]):
+        self.job = job
+        self.tenant = tenant
+        self.paths = list(paths)
+        self.hashes = list(hashes)  # sha256 computed at upload, None if unknown
+        self.owners: list = [None] * len(self.paths)  # job each file came from; None is the running job
+        self.claimed: list = []
+
+    def claim(self, limit: int, max_bytes: int = 0) -> List[Path]:
+        """Take over queued index jobs of this tenant, up to limit jobs and max_bytes of files in total; returns their files."""
+        job = self.job
+        if job is None or len(self.claimed) >= limit:
+            return []
+        q = Queue(job.origin, connection=job.connection)
+        added: List[Path] = []
+        size = _files_size(self.paths)
+        for other in self._scan(q, limit):
+            tenant, files, hashes = _job_files(other)
+            if other.id == job.id or tenant != self.tenant:
+                continue
+            # Stop rather than skip: later uploads must not be indexed ahead of this job
+            if other.func_name != job.func_name:
+                break  # e.g. a deletion
+            if other.meta.get("released_from"):
+                break  # its last batch failed: it runs on its own
+            size += _files_size([Path(f) for f in files])
+            if max_bytes and size > max_bytes:
+                break
+            if q.remove(other.id) != 1:
+                continue  # another worker dequeued it first
+            other.meta.update(tenant=tenant, progress=0, coalesced_into=job.id)
+            other.save_meta()
+            other.started_at = utcnow()  # persisted with the job when it ends
+            other.set_status(JobStatus.STARTED)
+            self.claimed.append(other)
+            self.paths += [Path(f) for f in files]
+            self.hashes += hashes
+            self.owners += [other] * len(files)
+            added += [Path(f) for f in files]
+        if added:
+            logger.info("Job %s tenant=%s took over %d queued job(s), %d file(s) in total", job.id, self.tenant, len(self.claimed), len(self.paths))
+        return added
+
+    def unchanged(self, start: int = 0) -> Set[int]:
+        """Indices (from start) of files whose hash matches the published manifest; fills in missing hashes.
+
+        Only a hint for what to parse ahead: index_file re-checks under the lock.
+        """
+        tenant_dir = FAISS_DIR / self.tenant
+        version = current_version(tenant_dir)
+        manifest = TenantManifest.load(version.path if version is not None else tenant_dir)
+        out: Set[int] = set()
+        for i in range(start, len(self.paths)):
+            entry = manifest.get(self.paths[i].name)
+            if entry is None:
+                continue
+            if self.hashes[i] is None:
+                self.hashes[i] = file_sha256(self.paths[i])
+            if entry.get("sha256") == self.hashes[i]:
+                out.add(i)
+        return out
+
+    def _scan(self, q: Queue, limit: int) -> Iterator:
+        """Queued jobs from the head of the queue, fetched a page at a time while claiming."""
+        scan = max(1, int(os.getenv("INDEX_COALESCE_SCAN", "1000")))
+        ids = q.get_job_ids(0, scan)
+        for start in range(0, len(ids), _SCAN_PAGE):
+            for other in Job.fetch_many(ids[start : start + _SCAN_PAGE], connection=q.connection, serializer=q.serializer):
+                if len(self.claimed) >= limit:
+                    return
+                if other is not None:
+                    yield other
+
+    def fail(self, other, error: Exception) -> None:
+        """Fail one claimed job and drop its files from the batch."""
+        keep = [i for i, o in enumerate(self.owners) if o is not other]
+        self.paths = [self.paths[i] for i in keep]
+        self.hashes = [self.hashes[i] for i in keep]
+        self.owners = [self.owners[i] for i in keep]
+        self.claimed.remove(other)
+        other.meta["error"] = str(error)
+        other.save_meta()
+        _end_claimed_job(other, JobStatus.FAILED, str(error))
 
-    if (vs_dir / "index.faiss").exists():
-        vs = FAISS.load_local(str(vs_dir), emb, allow_dangerous_deserialization=True)
-        vs.add_texts(texts, metas)
-        vs.save_local(str(vs_dir))
-    else:
-        vs = FAISS.from_texts(texts, emb, metas)
-        vs.save_local(str(vs_dir))
+    def finish(self, version: Optional[IndexVersion], skipped: List[int], deleted: List[int]) -> None:
+        """Record the outcome on every job of the batch; skipped/deleted are per file index."""
+        for owner in [self.job] + self.claimed:
+            if owner is None:
+                continue
+            mine = [i for i, o in enumerate(self.owners) if o is (None if owner is self.job else owner)]
+            if version is not None:
+                owner.meta["generation"] = version.generation
+            owner.meta["progress"] = 100
+            owner.meta["skipped_files"] = [self.paths[i].name for i in mine if i in skipped]
+            owner.meta["deleted_chunks"] = sum(deleted[i] for i in mine)
+            if owner is self.job:
+                owner.meta["coalesced_jobs"] = [o.id for o in self.claimed]
+            owner.save_meta()
+            if owner is not self.job:
+                _end_claimed_job(owner, JobStatus.FINISHED)
 
+    def release(self) -> None:
+        """Put the claimed jobs back at the front of the queue (the batch failed before publishing)."""
+        # Last first, so they end up in their original order
+        for other in reversed(self.claimed):
+            other.meta.pop("coalesced_into", None)
+            other.meta["released_from"] = self.job.id
+            other.save_meta()
+            Queue(other.origin, connection=other.connection).enqueue_job(other, at_front=True)
+        self.claimed = []
 
-def index_files_job(tenant: str, file_paths: List[str]):
+
+def index_files_job(tenant: str, file_paths: List[str], file_hashes: Optional[List[Optional[str]]] = None):
     from rq import get_current_job
 
     job = get_current_job()
@@ -98,38 +478,191 @@ def index_files_job(tenant: str, file_paths: List[str]):
         job.meta["progress"] = 0
         job.save_meta()
 
+    # With a preloaded model (see main) this is a no-op; otherwise the job pays the load here
+    t0 = time.perf_counter()
+    get_embedding_backend().load()
+    model_ready_ms = int((time.perf_counter() - t0) * 1000)
+    logger.info("Job tenant=%s embedding model ready in %d ms", tenant, model_ready_ms)
+    if job is not None:
+        job.meta["model_ready_ms"] = model_ready_ms
+        job.save_meta()
+
     max_tokens = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
     overlap = int(os.getenv("CHUNK_OVERLAP", "64"))
+    batch_size = max(1, int(os.getenv("EMBED_BATCH_SIZE", "64")))
 
-    all_chunks: List[tuple[str, dict]] = []
-    n = len(file_paths)
-    for i, p in enumerate(file_paths):
-        try:
-            docs = _load_documents(Path(p))
-            chunks = _chunk_documents(docs, max_tokens=max_tokens, overlap=overlap)
-            all_chunks.extend(chunks)
-        except Exception as e:
-            if job is not None:
-                job.meta["error"] = str(e)
-                job.save_meta()
-            raise
-        finally:
-            if job is not None:
-                job.meta["progress"] = int(((i + 1) / n) * 80)
-                job.save_meta()
-
-    # Embed + save to FAISS
-    _save_to_faiss(tenant, all_chunks)
+    def _report(done_files: float) -> None:
+        if job is not None:
+            # 0..95 tracks parse+embed work, the final 5 is the save
+            job.meta["progress"] = int(95 * done_files / len(batch.paths))
+            job.meta["embedded_chunks"] = writer.added
+            job.save_meta()
+
+    # Queued jobs of the same tenant are indexed along with this one, so a burst
+    # of single-file uploads costs one index load and publish instead of one each.
+    max_coalesce = int(os.getenv("INDEX_COALESCE_MAX_JOBS", "32"))
+    max_coalesce_bytes = int(os.getenv("INDEX_COALESCE_MAX_BYTES", str(32 * 1024 * 1024)))
+    batch = _JobBatch(job, tenant, [Path(p) for p in file_paths], list(file_hashes or [None] * len(file_paths)))
+    batch.claim(max_coalesce, max_coalesce_bytes)
+    # Pages are parsed in a process pool ahead of the embedder, then chunked and
+    # embedded batch by batch: only one batch of chunk texts and vectors plus a
+    # bounded number of parsed page ranges is held besides the index itself.
+    workers = int(os.getenv("PARSE_WORKERS", "0")) or os.cpu_count() or 1
+    forked = os.getenv("WORKER_CLASS", "fork").lower() != "simple"
+    if forked and workers > 1 and not os.getenv("PARSE_WORKERS"):
+        # A forked work horse exits after the job, so its pool is started anew
+        # for every job: only worth it when asked for explicitly
+        logger.info("Job tenant=%s parses in-process under the forking worker; set PARSE_WORKERS or WORKER_CLASS=simple for a parser pool", tenant)
+        workers = 1
+    pages_per_part = max(1, int(os.getenv("PARSE_PAGES_PER_TASK", "16")))
+    # Files already indexed with the same content are not parsed ahead
+    stream = DocumentStream(list(batch.paths), workers, pages_per_part, 2 * workers, batch.unchanged() if workers > 1 else ())
+    # One writer per tenant at a time: the index is loaded, extended and
+    # published under the lock, so concurrent jobs never drop each other's chunks.
+    # Parsing (above) already runs while a job waits for it.
+    lock = _tenant_lock(tenant, job)
+    try:
+        with lock:
+            # Jobs queued while this one waited for the lock join the batch too
+            start = len(batch.paths)
+            added = batch.claim(max_coalesce, max_coalesce_bytes)
+            stream.extend(added, batch.unchanged(start) if workers > 1 and added else ())
+            while True:
+                writer = _IndexWriter(tenant)
+                skipped: List[int] = []
+                deleted = [0] * len(batch.paths)
+                failed = None
+                for i, p in enumerate(batch.paths):
+                    before = writer.deleted
+                    try:
+                        changed = writer.index_file(
+                            p,
+                            batch_size=batch_size,
+                            max_tokens=max_tokens,
+                            overlap=overlap,
+                            on_batch=lambda b: _report(i + _file_progress(b[-1][1])),
+                            documents=stream.documents(i),
+                            sha256=batch.hashes[i],
+                        )
+                    except Exception as e:
+                        failed = (i, e)
+                        break
+                    if not changed:
+                        stream.skip(i)
+                        logger.info("Skipping unchanged file tenant=%s file=%s", tenant, p.name)
+                        skipped.append(i)
+                    deleted[i] = writer.deleted - before
+                    _report(i + 1)
+                if failed is None:
+                    break
+                i, e = failed
+                owner = batch.owners[i]
+                if owner is None:
+                    if job is not None:
+                        job.meta["error"] = str(e)
+                        job.save_meta()
+                    raise e
+                # A file of a job taken over from the queue: fail only that job and
+                # redo the batch without it (nothing has been published yet)
+                logger.warning("Job %s tenant=%s failed on %s: %s", owner.id, tenant, batch.paths[i].name, e)
+                batch.fail(owner, e)
+                stream.close()
+                stream = DocumentStream(list(batch.paths), workers, pages_per_part, 2 * workers, batch.unchanged() if workers > 1 else ())
+            version = writer.save(lock)
+    except BaseException:
+        batch.release()
+        raise
+    finally:
+        stream.close()
+        if forked:
+            shutdown_parse_pool()  # the work horse exits anyway; only a SimpleWorker keeps the pool
+
+    batch.finish(version, skipped, deleted)
+    _schedule_compaction(job, tenant, writer)
+
+
+def delete_files_job(tenant: str, filenames: List[str], uploads: Optional[List[Optional[str]]] = None):
+    """Remove files' chunks from the tenant index and publish the result as a new generation.
+
+    uploads are the names the API moved the files' uploads to when the
+    deletion was requested; they are removed once it is published.
+    """
+    from rq import get_current_job
+
+    job = get_current_job()
+    if job is not None:
+        job.meta["tenant"] = tenant
+        job.meta["progress"] = 0
+        job.save_meta()
+    missing: List[str] = []
+    with _tenant_lock(tenant, job) as lock:
+        writer = _IndexWriter(tenant)
+        for name in filenames:
+            if not writer.remove_file(name):
+                missing.append(name)
+        version = writer.save(lock)
+        # Only after the generation without them is published: a failed job leaves the uploads in place
+        for name in uploads or ():
+            if name:
+                (UPLOADS_DIR / tenant / name).unlink(missing_ok=True)
+    logger.info("Deleted %d chunks of %d file(s) tenant=%s", writer.deleted, writer.removed_files, tenant)
     if job is not None:
+        if version is not None:
+            job.meta["generation"] = version.generation
         job.meta["progress"] = 100
+        job.meta["deleted_chunks"] = writer.deleted
+        job.meta["missing_files"] = missing
+        job.meta["tombstone_ratio"] = round(writer.tombstone_ratio, 4)
+        job.save_meta()
+    _schedule_compaction(job, tenant, writer)
+
+
+def compact_index_job(tenant: str):
+    """Rebuild the tenant index without its tombstoned vectors (no re-embedding)."""
+    from rq import get_current_job
+
+    job = get_current_job()
+    if job is not None:
+        job.meta["tenant"] = tenant
         job.save_meta()
+    with _tenant_lock(tenant, job) as lock:
+        writer = _IndexWriter(tenant)
+        dropped = writer.compact()
+        version = writer.save(lock) if dropped else None
+    if job is not None:
+        if version is not None:
+            job.meta["generation"] = version.generation
+        job.meta["compacted_vectors"] = dropped
+        job.save_meta()
+
+
+def preload_embeddings(warmup: bool = False) -> None:
+    """Load the shared embedding model in this process so jobs reuse it.
+
+    Forked work horses inherit the loaded weights copy-on-write. A warm-up
+    encode is only run for the non-forking worker: starting torch's thread
+    pools before fork() can deadlock the child.
+    """
+    t0 = time.perf_counter()
+    be = get_embedding_backend()
+    be.load()
+    if warmup:
+        be.embed_query("warmup")
+    logger.info("Preloaded embedding model %s in %.0f ms", be.cfg.model, (time.perf_counter() - t0) * 1000)
 
 
 def main():
+    logging.basicConfig(level=getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO), format="%(asctime)s [%(levelname)s] %(message)s")
     redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
     r = Redis.from_url(redis_url)
     q = Queue(connection=r)
-    w = Worker([q], connection=r)
+    # "fork": stock RQ worker, one forked work horse per job (isolates crashes)
+    # "simple": run jobs in the worker process itself, model stays loaded and warm
+    worker_class = os.getenv("WORKER_CLASS", "fork").lower()
+    simple = worker_class == "simple"
+    if os.getenv("WORKER_PRELOAD", "1") in {"1", "true", "True"}:
+        preload_embeddings(warmup=simple)
+    w = (SimpleWorker if simple else Worker)([q], connection=r)
     w.work()
 
 
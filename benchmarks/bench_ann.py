@@ -0,0 +1,69 @@
+"""Recall/latency of the ANN index kinds against the exact flat index.
+
+Uses clustered synthetic vectors (unit-normalized, like sentence-transformers
+output) so IVF/PQ behave roughly as on real embeddings.
+
+    python benchmarks/bench_ann.py --n 200000 --dim 384 --kinds hnsw,ivf,ivfpq,ivfsq
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from kits.kit_index import AnnConfig, apply_search_params, build_index  # noqa: E402
+
+
+def make_data(n: int, dim: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(16, n // 500), dim)).astype("float32")
+    x = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    q = x[rng.choice(n, queries, replace=False)] + 0.05 * rng.standard_normal((queries, dim)).astype("float32")
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    return x, q.astype("float32")
+
+
+def bench(kind: str, x: np.ndarray, q: np.ndarray, k: int, truth, cfg: AnnConfig):
+    t0 = time.perf_counter()
+    index = build_index(kind, x, cfg)
+    build_s = time.perf_counter() - t0
+    apply_search_params(index, cfg)
+    t0 = time.perf_counter()
+    for row in q:  # one query at a time, like the API
+        index.search(row[None, :], k)
+    per_query_ms = (time.perf_counter() - t0) * 1000 / len(q)
+    _, ids = index.search(q, k)
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ids, truth)]) if truth is not None else 1.0
+    return build_s, per_query_ms, recall, index
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--kinds", default="hnsw,ivf,ivfpq,ivfsq")
+    args = ap.parse_args()
+    cfg = AnnConfig(min_train=0)
+    x, q = make_data(args.n, args.dim, args.queries)
+    print(f"n={args.n} dim={args.dim} queries={args.queries} k={args.k} nprobe={cfg.nprobe} efSearch={cfg.ef_search}")
+    print(f"{'kind':<8}{'build s':>9}{'ms/query':>10}{'recall@k':>10}")
+    build_s, ms, _, flat = bench("flat", x, q, args.k, None, cfg)
+    _, truth = flat.search(q, args.k)
+    print(f"{'flat':<8}{build_s:>9.2f}{ms:>10.3f}{1.0:>10.3f}")
+    for kind in args.kinds.split(","):
+        build_s, ms, recall, _ = bench(kind, x, q, args.k, truth, cfg)
+        print(f"{kind:<8}{build_s:>9.2f}{ms:>10.3f}{recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Latency of dense-only vs hybrid (dense + BM25 with RRF) retrieval.
+
+Builds a synthetic tenant with N chunks (random vectors, Zipf-distributed
+vocabulary plus a few rare identifiers), then times the API's _search in
+both modes with the index and sparse index already resident.
+
+    python benchmarks/bench_hybrid.py --chunks 50000 --queries 200
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("DOC_RAG_DATA_DIR", tempfile.mkdtemp(prefix="bench-hybrid-"))
+os.environ.setdefault("EMBED_BACKEND", "hash")
+
+import numpy as np  # noqa: E402
+from langchain_community.vectorstores import FAISS  # noqa: E402
+from langchain_core.embeddings import FakeEmbeddings  # noqa: E402
+
+from apps.api import main as api  # noqa: E402
+from kits.kit_index import BM25Index, save_vectorstore  # noqa: E402
+
+
+def build(tenant: str, n: int, dim: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(20000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocab))]
+    texts = []
+    for i in range(n):
+        words = rng.choices(vocab, weights=weights, k=60)
+        if i % 1000 == 0:
+            words.append(f"ID-{i:06d}")
+        texts.append(" ".join(words))
+    vecs = np.random.default_rng(seed).standard_normal((n, dim), dtype=np.float32)
+    ids = [f"c{i}" for i in range(n)]
+    metas = [{"source": f"doc{i // 100}.txt", "page": 0, "id": cid} for i, cid in enumerate(ids)]
+    vs = FAISS.from_embeddings(list(zip(texts, vecs.tolist())), FakeEmbeddings(size=dim), metas, ids=ids)
+    path = api.index_path(tenant)
+    bm25 = BM25Index()
+    for cid, t in zip(ids, texts):
+        bm25.add(cid, t)
+    bm25.save(path)
+    save_vectorstore(vs, path)
+    return [f"ID-{i:06d} term{rng.randint(0, 200)}" for i in range(0, n, 1000)]
+
+
+def timeit(fn, queries, qvec) -> list[float]:
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q, qvec)
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=20000)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    tenant = "bench-hybrid"
+    t0 = time.perf_counter()
+    queries = build(tenant, args.chunks, args.dim)
+    print(f"built {args.chunks} chunks in {time.perf_counter() - t0:.1f}s")
+    queries = (queries * (args.queries // max(1, len(queries)) + 1))[: args.queries]
+    qvec = np.random.default_rng(1).standard_normal(args.dim).tolist()
+
+    # Warm the caches (index load, postings build) outside the timing
+    api._search(tenant, queries[0], args.k, qvec, api.SearchOptions(mode="hybrid"))
+    for mode in ("dense", "hybrid"):
+        lat = sorted(timeit(lambda q, v: api._search(tenant, q, args.k, v, api.SearchOptions(mode=mode)), queries, qvec))
+        p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+        print(f"{mode:<7} p50={statistics.median(lat):.2f} ms  p95={p95:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Time-to-first-token of chat_stream with a fresh client per prompt vs the pooled client.
+
+Starts a local stub of Ollama's /api/generate that streams a few NDJSON
+tokens, then runs N concurrent askers once with a new httpx.AsyncClient per
+prompt (the old behaviour) and once through kit_llm's pooled clients.
+Loopback connects are nearly free, so --connect-ms delays the first request
+on every new connection to stand in for TCP+TLS setup to a remote server.
+
+    python benchmarks/bench_llm_clients.py --requests 200 --concurrency 1,8 --connect-ms 30
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import httpx  # noqa: E402
+
+import kits.kit_llm as kit_llm  # noqa: E402
+from kits.kit_llm import ChatConfig, LLMClientPool, chat_stream  # noqa: E402
+
+
+def make_handler(connect_ms: float, token_ms: float, n_tokens: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        connections = 0
+
+        def setup(self):
+            super().setup()
+            type(self).connections += 1
+            self._fresh = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", "0")))
+            if self._fresh:
+                time.sleep(connect_ms / 1000)
+                self._fresh = False
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(n_tokens + 1):
+                line = {"done": True} if i == n_tokens else {"response": f"t{i} "}
+                data = (json.dumps(line) + "\n").encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+                if i < n_tokens:
+                    time.sleep(token_ms / 1000)
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+async def _unpooled_stream(prompt: str, cfg: ChatConfig, url: str):
+    # What chat_stream did before: a new client (and connection) per prompt
+    async with httpx.AsyncClient(timeout=None) as client:
+        req = {"model": cfg.model, "prompt": prompt, "stream": True}
+        async with client.stream("POST", url, json=req) as resp:
+            async for line in resp.aiter_lines():
+                if line:
+                    data = json.loads(line)
+                    if data.get("response"):
+                        yield data["response"]
+
+
+async def run(mode: str, requests: int, concurrency: int, url: str):
+    cfg = ChatConfig(backend="ollama", model="stub")
+    ttft: list[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def ask(i: int):
+        async with sem:
+            t0 = time.perf_counter()
+            stream = chat_stream(f"q{i}", cfg) if mode == "pooled" else _unpooled_stream(f"q{i}", cfg, url + "/api/generate")
+            first = None
+            async for _ in stream:
+                if first is None:
+                    first = time.perf_counter() - t0
+            ttft.append((first or 0.0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(ask(i) for i in range(requests)))
+    wall = time.perf_counter() - t0
+    await kit_llm.close_llm_clients()
+    return ttft, wall
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--concurrency", default="1,8")
+    ap.add_argument("--connect-ms", type=float, default=20.0)
+    ap.add_argument("--token-ms", type=float, default=2.0)
+    ap.add_argument("--tokens", type=int, default=8)
+    args = ap.parse_args()
+
+    handler = make_handler(args.connect_ms, args.token_ms, args.tokens)
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{srv.server_address[1]}"
+    os.environ["OLLAMA_HOST"] = url
+
+    print(f"{'mode':<9} {'conc':>5} {'ttft_p50_ms':>12} {'ttft_p95_ms':>12} {'req/s':>8} {'conns':>6}")
+    for conc in [int(c) for c in args.concurrency.split(",")]:
+        for mode in ("per-call", "pooled"):
+            kit_llm.LLM_CLIENTS = LLMClientPool()
+            handler.connections = 0
+            ttft, wall = asyncio.run(run(mode, args.requests, conc, url))
+            ttft.sort()
+            p95 = ttft[min(len(ttft) - 1, int(len(ttft) * 0.95))]
+            print(
+                f"{mode:<9} {conc:>5} {statistics.median(ttft):>12.1f} {p95:>12.1f} "
+                f"{args.requests / wall:>8.1f} {handler.connections:>6}"
+            )
+    srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
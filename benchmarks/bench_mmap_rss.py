@@ -0,0 +1,76 @@
+"""Per-process memory of several API-like workers holding the same tenant index.
+
+Each worker process loads the index (plain read vs FAISS_MMAP-style mapping),
+runs queries, and reports RSS and PSS while all workers are alive. With
+mmap the vectors are shared through the page cache, so PSS per worker drops
+roughly by a factor of the worker count.
+
+    python benchmarks/bench_mmap_rss.py --n 300000 --dim 384 --workers 4 --kind flat
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import faiss  # noqa: E402
+
+from kits.kit_common import process_memory  # noqa: E402
+from kits.kit_index import AnnConfig, build_index, mmap_io_flags  # noqa: E402
+
+
+def _worker(path: str, io_flags: int, queries: np.ndarray, barrier, out) -> None:
+    index = faiss.read_index(path, io_flags)
+    for q in queries:
+        index.search(q[None, :], 10)
+    barrier.wait()  # measure while every worker holds its copy
+    out.put(process_memory())
+    barrier.wait()
+
+
+def run(path: str, io_flags: int, workers: int, queries: np.ndarray) -> list:
+    ctx = mp.get_context("spawn")
+    barrier, out = ctx.Barrier(workers), ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(path, io_flags, queries, barrier, out)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    stats = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return stats
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=300_000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--kind", default="flat")
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+    x = rng.random((args.n, args.dim), dtype="float32")
+    index = build_index(args.kind, x, AnnConfig(min_train=0))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "index.faiss")
+        faiss.write_index(index, path)
+        size_mb = Path(path).stat().st_size / 1e6
+        del index
+        print(f"kind={args.kind} index file {size_mb:.0f} MB, {args.workers} workers")
+        print(f"{'mode':<8}{'RSS MB/worker':>15}{'PSS MB/worker':>15}")
+        for name, flags in (("plain", 0), ("mmap", mmap_io_flags())):
+            stats = run(path, flags, args.workers, x[:50])
+            rss = np.mean([s.get("rss_mb", s["max_rss_mb"]) for s in stats])
+            pss = np.mean([s.get("pss_mb", float("nan")) for s in stats])
+            print(f"{name:<8}{rss:>15.0f}{pss:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Throughput/latency of query embedding with and without the micro-batcher.
+
+N concurrent clients each embed queries in a loop for a fixed duration,
+once calling the backend directly (batch of 1 per query) and once through
+QueryBatcher. Uses the configured EMBED_BACKEND; --simulate replaces it
+with a stand-in whose cost is a fixed per-call overhead plus a per-item
+cost, which is roughly how a transformer forward pass behaves on CPU.
+
+    EMBED_BACKEND=sentence_transformers python benchmarks/bench_query_batcher.py --concurrency 1,4,16,64
+    python benchmarks/bench_query_batcher.py --simulate
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from kits.kit_llm import QueryBatcher, get_embedding_backend  # noqa: E402
+
+
+class SimulatedBackend:
+    def __init__(self, call_ms: float, item_ms: float):
+        self.call_ms = call_ms
+        self.item_ms = item_ms
+        self._lock = threading.Lock()  # one forward pass at a time, like a single model
+
+    def embed_texts(self, texts):
+        with self._lock:
+            time.sleep((self.call_ms + self.item_ms * len(texts)) / 1000)
+        return [[0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return self.embed_texts([text])[0]
+
+
+def run(embedder, clients: int, seconds: float):
+    latencies = []
+    lock = threading.Lock()
+    stop = time.perf_counter() + seconds
+
+    def client(i: int) -> None:
+        n = 0
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            embedder.embed_query(f"client {i} question {n}")
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    return len(latencies) / elapsed, statistics.median(latencies), p95
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", default="1,4,16,64")
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--max-wait-ms", type=float, default=5.0)
+    ap.add_argument("--max-batch", type=int, default=32)
+    ap.add_argument("--simulate", action="store_true", help="stand-in backend: 8 ms per call + 0.3 ms per query")
+    args = ap.parse_args()
+    backend = SimulatedBackend(8.0, 0.3) if args.simulate else get_embedding_backend()
+    if not args.simulate:
+        backend.load()
+        backend.embed_query("warmup")
+    batcher = QueryBatcher(backend, max_wait_ms=args.max_wait_ms, max_batch=args.max_batch)
+    print(f"{'clients':>8}{'mode':>9}{'qps':>9}{'p50 ms':>9}{'p95 ms':>9}")
+    for c in (int(x) for x in args.concurrency.split(",")):
+        for name, embedder in (("direct", backend), ("batched", batcher)):
+            qps, p50, p95 = run(embedder, c, args.seconds)
+            print(f"{c:>8}{name:>9}{qps:>9.0f}{p50:>9.1f}{p95:>9.1f}")
+    print("batcher:", batcher.stats())
+
+
+if __name__ == "__main__":
+    main()
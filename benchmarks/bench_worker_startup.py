@@ -0,0 +1,78 @@
+"""Per-job embedding startup cost for the worker modes.
+
+Simulates what RQ does for every indexing job and times the part of the job
+that gets the embedding model ready and embeds a first batch:
+
+* fork-cold:    stock forking worker, nothing preloaded (previous behaviour)
+* fork-preload: forking worker with WORKER_PRELOAD=1 (model loaded in parent)
+* simple:       WORKER_CLASS=simple, jobs run in-process with a warm model
+
+Usage (from the repo root, with the worker requirements installed):
+
+    EMBED_BACKEND=sentence_transformers python benchmarks/bench_worker_startup.py --jobs 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from kits.kit_llm import get_embedding_backend  # noqa: E402
+
+TEXTS = [f"benchmark chunk number {i} with some filler words" for i in range(64)]
+
+
+def _job_startup_ms() -> float:
+    t0 = time.perf_counter()
+    be = get_embedding_backend()
+    be.load()
+    be.embed_texts(TEXTS)
+    return (time.perf_counter() - t0) * 1000
+
+
+def _forked_job_ms() -> float:
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:  # work horse
+        os.close(r)
+        os.write(w, f"{_job_startup_ms():.3f}".encode())
+        os._exit(0)
+    os.close(w)
+    with os.fdopen(r) as f:
+        out = f.read()
+    os.waitpid(pid, 0)
+    return float(out)
+
+
+def run(mode: str, jobs: int) -> list[float]:
+    if mode == "fork-cold":
+        return [_forked_job_ms() for _ in range(jobs)]
+    if mode == "fork-preload":
+        get_embedding_backend().load()
+        return [_forked_job_ms() for _ in range(jobs)]
+    get_embedding_backend().load()
+    return [_job_startup_ms() for _ in range(jobs)]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=5)
+    ap.add_argument("--modes", default="fork-cold,fork-preload,simple")
+    args = ap.parse_args()
+    print(f"backend={os.getenv('EMBED_BACKEND', 'sentence_transformers')} model={os.getenv('EMBED_MODEL', 'default')}")
+    print(f"{'mode':<14}{'mean ms':>10}{'median ms':>12}{'max ms':>10}")
+    # fork-cold must run first: later modes load the model into this process
+    for mode in args.modes.split(","):
+        times = run(mode, args.jobs)
+        print(f"{mode:<14}{statistics.mean(times):>10.1f}{statistics.median(times):>12.1f}{max(times):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
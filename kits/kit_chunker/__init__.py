@@ -48,3 +48,13 @@ def split_markdown(text: str, max_tokens: int, overlap: int) -> List[str]:
         chunks.extend(sub)
     return chunks
 
+
+
+def join_chunks(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping the tokens they share through overlap."""
+    a = _simple_tokenize(first)
+    b = _simple_tokenize(second)
+    for m in range(min(len(a), len(b)), 0, -1):
+        if a[-m:] == b[:m]:
+            return " ".join(a + b[m:])
+    return " ".join(a + b)
@@ -1,9 +1,15 @@
-from .utils import normalize_text, now_ms, gen_request_id
+from .utils import normalize_text, now_ms, gen_request_id, process_memory
 from .highlight import extract_snippet_and_highlights
+from .executor import BoundedExecutor, QueueFullError
+from .cache import TTLCache
 
 __all__ = [
     "normalize_text",
     "now_ms",
     "gen_request_id",
+    "process_memory",
     "extract_snippet_and_highlights",
+    "BoundedExecutor",
+    "QueueFullError",
+    "TTLCache",
 ]
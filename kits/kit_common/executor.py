@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class BoundedExecutor:
+    """Thread pool for blocking work called from async code, with queueing metrics.
+
+    At most max_workers calls run at once; further calls wait in the pool's
+    queue (up to max_queue, 0 = unbounded) without blocking the event loop.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 0, name: str = "pool"):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.name = name
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            if self.max_queue and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"{self.name} queue is full")
+            self.queued += 1
+        submitted = time.perf_counter()
+
+        def _call() -> Any:
+            started = time.perf_counter()
+            with self._lock:
+                wait = started - submitted
+                self.queued -= 1
+                self.active += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self._run_total += time.perf_counter() - started
+
+        return await asyncio.wrap_future(self._pool.submit(_call))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            done = self.completed or 1
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self._wait_total / done * 1000, 2),
+                "max_wait_ms": round(self._wait_max * 1000, 2),
+                "avg_run_ms": round(self._run_total / done * 1000, 2),
+            }
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._pool.shutdown(wait=wait)
@@ -1,4 +1,5 @@
 import re
+import sys
 import time
 import uuid
 
@@ -18,3 +19,29 @@ def now_ms() -> int:
 def gen_request_id() -> str:
     return uuid.uuid4().hex
 
+
+def process_memory() -> dict:
+    """Peak, current (RSS) and proportional (PSS) set size of this process in MB.
+
+    PSS splits shared pages (e.g. a memory-mapped index) between the processes
+    mapping them; RSS/PSS are only available on Linux and the peak only on Unix,
+    each omitted elsewhere.
+    """
+    out: dict = {}
+    try:
+        import resource  # Unix only
+    except ImportError:
+        pass
+    else:
+        # ru_maxrss is in KiB, except on macOS where it is in bytes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        out["max_rss_mb"] = round(peak, 1)
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in {"Rss", "Pss"}:
+                    out[key.lower() + "_mb"] = round(int(rest.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return out
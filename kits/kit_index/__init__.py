@@ -0,0 +1,71 @@
+from .ann import (
+    INDEX_KINDS,
+    AnnConfig,
+    apply_search_params,
+    build_index,
+    compact_documents,
+    delete_documents,
+    index_kind,
+    needs_rebuild,
+    rebuild_index,
+    resolve_kind,
+)
+from .bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from .cache import VectorStoreCache, index_signature, index_size_bytes
+from .filters import MetadataFilter, PositionMetadata, filtered_search, position_metadata
+from .lock import LockLost, LockTimeout, TenantLock
+from .mmr import mmr_select
+from .manifest import TenantManifest, chunk_hash, file_sha256
+from .store import (
+    ColumnarDocstore,
+    docstore_format,
+    index_files,
+    live_mask,
+    load_tombstones,
+    load_vectorstore,
+    mmap_io_flags,
+    save_vectorstore,
+)
+from .versions import IndexVersion, current_version, prune_versions, publish_version
+
+__all__ = [
+    "INDEX_KINDS",
+    "AnnConfig",
+    "apply_search_params",
+    "build_index",
+    "compact_documents",
+    "delete_documents",
+    "index_kind",
+    "needs_rebuild",
+    "rebuild_index",
+    "resolve_kind",
+    "BM25Index",
+    "reciprocal_rank_fusion",
+    "tokenize",
+    "VectorStoreCache",
+    "index_signature",
+    "index_size_bytes",
+    "MetadataFilter",
+    "PositionMetadata",
+    "filtered_search",
+    "position_metadata",
+    "LockLost",
+    "LockTimeout",
+    "TenantLock",
+    "mmr_select",
+    "TenantManifest",
+    "chunk_hash",
+    "file_sha256",
+    "ColumnarDocstore",
+    "docstore_format",
+    "index_files",
+    "live_mask",
+    "load_tombstones",
+    "load_vectorstore",
+    "mmap_io_flags",
+    "save_vectorstore",
+    "IndexVersion",
+    "current_version",
+    "prune_versions",
+    "publish_version",
+]
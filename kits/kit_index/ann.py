@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional, Set
+
+import faiss
+import numpy as np
+
+INDEX_KINDS = ("flat", "hnsw", "ivf", "ivfpq", "ivfsq")
+
+
+@dataclass
+class AnnConfig:
+    # flat | hnsw | ivf | ivfpq | ivfsq, or "auto": flat below the threshold, auto_kind above
+    kind: str = os.getenv("ANN_INDEX", "auto")
+    auto_kind: str = os.getenv("ANN_AUTO_KIND", "ivf")
+    auto_threshold: int = int(os.getenv("ANN_AUTO_THRESHOLD", "50000"))
+    # IVF kinds need enough vectors to train centroids; smaller corpora stay flat
+    min_train: int = int(os.getenv("ANN_MIN_TRAIN", "10000"))
+    max_train: int = int(os.getenv("ANN_MAX_TRAIN", "200000"))
+    nlist: int = int(os.getenv("ANN_NLIST", "0"))  # 0 = 4*sqrt(n)
+    hnsw_m: int = int(os.getenv("ANN_HNSW_M", "32"))
+    pq_m: int = int(os.getenv("ANN_PQ_M", "16"))
+    nprobe: int = int(os.getenv("ANN_NPROBE", "16"))
+    ef_search: int = int(os.getenv("ANN_EF_SEARCH", "64"))
+
+
+def resolve_kind(cfg: AnnConfig, n: int, override: Optional[str] = None) -> str:
+    """Index kind for a corpus of n vectors; override is a per-tenant setting."""
+    kind = (override or cfg.kind or "auto").lower()
+    if kind == "auto":
+        kind = cfg.auto_kind if n >= cfg.auto_threshold else "flat"
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown ANN index kind: {kind}")
+    if kind.startswith("ivf") and n < cfg.min_train:
+        return "flat"
+    return kind
+
+
+def _nlist(cfg: AnnConfig, n: int) -> int:
+    nlist = cfg.nlist or int(4 * math.sqrt(max(n, 1)))
+    # faiss wants ~39 training points per centroid
+    return max(1, min(nlist, n // 39, 65536))
+
+
+def _pq_m(cfg: AnnConfig, dim: int) -> int:
+    m = max(1, min(cfg.pq_m, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def factory_string(kind: str, dim: int, n: int, cfg: AnnConfig) -> str:
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{cfg.hnsw_m},Flat"
+    nlist = _nlist(cfg, n)
+    if kind == "ivf":
+        return f"IVF{nlist},Flat"
+    if kind == "ivfpq":
+        return f"IVF{nlist},PQ{_pq_m(cfg, dim)}"
+    if kind == "ivfsq":
+        return f"IVF{nlist},SQ8"
+    raise ValueError(f"Unknown ANN index kind: {kind}")
+
+
+def _ivf(index: "faiss.Index"):
+    """The IVF layer of an index as its concrete class, or None."""
+    ivf = faiss.try_extract_index_ivf(index)
+    # try_extract_index_ivf hands back a plain IndexIVF proxy; PQ/SQ checks need the subclass
+    return faiss.downcast_index(ivf) if ivf is not None else None
+
+
+def index_kind(index: "faiss.Index") -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    ivf = _ivf(index)
+    if ivf is None:
+        return "flat"
+    if isinstance(ivf, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(ivf, faiss.IndexIVFScalarQuantizer):
+        return "ivfsq"
+    return "ivf"
+
+
+def reconstruct_all(index: "faiss.Index") -> np.ndarray:
+    """All stored vectors in position order (approximate for PQ/SQ codes)."""
+    ivf = _ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype="float32")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def build_index(kind: str, vectors: np.ndarray, cfg: AnnConfig) -> "faiss.Index":
+    """Create, train (if needed) and fill an index of the given kind."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    index = faiss.index_factory(dim, factory_string(kind, dim, n, cfg))
+    if not index.is_trained:
+        sample = vectors
+        if n > cfg.max_train:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(n, cfg.max_train, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    ivf = _ivf(index)
+    if ivf is not None:
+        # keeps reconstruct() and remove_ids() available for later edits
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def needs_rebuild(index: "faiss.Index", cfg: AnnConfig, override: Optional[str] = None) -> Optional[str]:
+    """Return the kind to rebuild into, or None if the current index fits the corpus."""
+    n = index.ntotal
+    want = resolve_kind(cfg, n, override)
+    have = index_kind(index)
+    if want != have:
+        return want
+    ivf = _ivf(index)
+    # Retrain once the corpus outgrew its centroids (4x growth halves the target ratio)
+    if ivf is not None and not cfg.nlist and ivf.nlist * 2 < _nlist(cfg, n):
+        return want
+    return None
+
+
+def rebuild_index(index: "faiss.Index", kind: str, cfg: AnnConfig) -> "faiss.Index":
+    """Rebuild from the stored vectors, preserving positions (no re-embedding)."""
+    return build_index(kind, reconstruct_all(index), cfg)
+
+
+def apply_search_params(index: "faiss.Index", cfg: AnnConfig) -> None:
+    ivf = _ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(cfg.nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = cfg.ef_search
+
+
+def remove_positions(index: "faiss.Index", positions, cfg: AnnConfig) -> "faiss.Index":
+    """Drop vectors at the given positions; remaining vectors are renumbered densely.
+
+    Only flat indexes renumber on remove_ids (IVF keeps labels, HNSW cannot
+    remove at all), so the other kinds are rebuilt from their stored vectors.
+    """
+    drop = np.asarray(sorted(set(positions)), dtype="int64")
+    if drop.size == 0:
+        return index
+    if index_kind(index) == "flat":
+        index.remove_ids(drop)
+        return index
+    keep = np.setdiff1d(np.arange(index.ntotal, dtype="int64"), drop)
+    vectors = reconstruct_all(index)[keep]
+    kind = resolve_kind(cfg, len(keep), index_kind(index))
+    if len(keep) == 0:
+        return faiss.index_factory(index.d, "Flat")
+    return build_index(kind, vectors, cfg)
+
+
+def _drop_positions(vs, positions, cfg: AnnConfig) -> None:
+    vs.index = remove_positions(vs.index, positions, cfg)
+    dropped = set(positions)
+    remaining = [cid for pos, cid in sorted(vs.index_to_docstore_id.items()) if pos not in dropped]
+    vs.index_to_docstore_id = {i: cid for i, cid in enumerate(remaining)}
+
+
+def delete_documents(vs, ids, cfg: AnnConfig, tombstones: Optional[Set[int]] = None) -> int:
+    """Remove documents by docstore id from a LangChain FAISS store; returns the count removed.
+
+    Flat indexes drop the vectors right away. Other kinds can only drop them
+    by rebuilding, so given a tombstones set their positions are added to it
+    instead: the docstore entries go, the vectors stay (and searches must
+    exclude those positions) until compact_documents() rebuilds the index.
+    """
+    wanted = set(ids)
+    dead = tombstones if tombstones is not None else set()
+    positions = [pos for pos, cid in vs.index_to_docstore_id.items() if cid in wanted and pos not in dead]
+    if not positions:
+        return 0
+    removed = [vs.index_to_docstore_id[p] for p in positions]
+    vs.docstore.delete(removed)
+    if tombstones is not None and index_kind(vs.index) != "flat":
+        tombstones.update(positions)
+    else:
+        # Renumbering positions would invalidate tombstones: drop those vectors too
+        _drop_positions(vs, set(positions) | dead, cfg)
+        dead.clear()
+    return len(removed)
+
+
+def compact_documents(vs, tombstones: Set[int], cfg: AnnConfig, kind: Optional[str] = None) -> int:
+    """Drop tombstoned vectors, rebuilding (and retraining) the index from the live ones.
+
+    No re-embedding: the live vectors are read back from the index. kind
+    defaults to what the current kind resolves to for the live count.
+    Returns the number of vectors dropped and clears tombstones.
+    """
+    drop = sorted(p for p in tombstones if 0 <= p < vs.index.ntotal)
+    keep = np.setdiff1d(np.arange(vs.index.ntotal, dtype="int64"), np.asarray(drop, dtype="int64"))
+    kind = kind or resolve_kind(cfg, len(keep), index_kind(vs.index))
+    if len(keep) == 0:
+        index = faiss.index_factory(vs.index.d, "Flat")
+    else:
+        index = build_index(kind, reconstruct_all(vs.index)[keep], cfg)
+    dropped = set(drop)
+    remaining = [cid for pos, cid in sorted(vs.index_to_docstore_id.items()) if pos not in dropped]
+    vs.index = index
+    vs.index_to_docstore_id = {i: cid for i, cid in enumerate(remaining)}
+    tombstones.clear()
+    return len(drop)
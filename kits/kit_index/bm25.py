@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Words plus compound identifiers such as "err-1042", "v2.3.1" or "a/b_c"
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; compound identifiers are kept whole and also split into parts."""
+    out: List[str] = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        out.append(tok)
+        if not tok.isalnum():
+            out.extend(p for p in re.split(r"[-./_]", tok) if p)
+    return out
+
+
+class BM25Index:
+    """Sparse Okapi BM25 index over chunk texts, keyed by chunk id.
+
+    Persisted as bm25.json next to the FAISS files holding the per-chunk term
+    counts (so chunks can be removed on re-index); the inverted postings are
+    rebuilt in memory on first search.
+    """
+
+    FILENAME = "bm25.json"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, docs: Optional[Dict[str, Dict[str, int]]] = None):
+        self.k1 = k1
+        self.b = b
+        self.docs: Dict[str, Dict[str, int]] = docs or {}
+        # Built lazily: row -> chunk id, per-row length norm, term -> (rows, tfs)
+        self._ids: List[str] = []
+        self._norm: Optional[np.ndarray] = None
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, cid: str, text: str) -> None:
+        self.docs[cid] = dict(Counter(tokenize(text)))
+        self._norm = None
+
+    def remove(self, ids: Iterable[str]) -> int:
+        n = 0
+        for cid in ids:
+            if self.docs.pop(cid, None) is not None:
+                n += 1
+        if n:
+            self._norm = None
+        return n
+
+    def prepare(self) -> None:
+        """Build the in-memory postings now instead of on the first search."""
+        rows: Dict[str, List[int]] = {}
+        tfs: Dict[str, List[int]] = {}
+        lengths = np.zeros(len(self.docs), dtype=np.float32)
+        self._ids = list(self.docs)
+        for row, cid in enumerate(self._ids):
+            tf = self.docs[cid]
+            lengths[row] = sum(tf.values())
+            for term, cnt in tf.items():
+                rows.setdefault(term, []).append(row)
+                tfs.setdefault(term, []).append(cnt)
+        self._postings = {
+            term: (np.asarray(r, dtype=np.int32), np.asarray(tfs[term], dtype=np.float32)) for term, r in rows.items()
+        }
+        avgdl = float(lengths.mean()) if len(lengths) else 1.0
+        self._norm = self.k1 * (1.0 - self.b + self.b * lengths / (avgdl or 1.0))
+
+    def search(self, query: str, k: int, keep: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """Top-k (chunk id, BM25 score) for query, best first; keep(cid) restricts the candidates."""
+        if self._norm is None:
+            self.prepare()
+        n = len(self._ids)
+        if not n or k <= 0:
+            return []
+        # Postings are scored with vectorized numpy ops: cost is O(df) per term in C
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            rows, tf = posting
+            idf = math.log(1.0 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1.0) / (tf + self._norm[rows])
+        hits = np.flatnonzero(scores)
+        if keep is None and len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        if keep is None:
+            return [(self._ids[i], float(scores[i])) for i in hits]
+        out: List[Tuple[str, float]] = []
+        for i in hits:
+            if keep(self._ids[i]):
+                out.append((self._ids[i], float(scores[i])))
+                if len(out) >= k:
+                    break
+        return out
+
+    @classmethod
+    def load(cls, vs_dir: Path) -> Optional["BM25Index"]:
+        try:
+            with open(vs_dir / cls.FILENAME, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        return cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75), docs=data.get("docs") or {})
+
+    def save(self, vs_dir: Path) -> None:
+        vs_dir.mkdir(parents=True, exist_ok=True)
+        tmp = vs_dir / f"{self.FILENAME}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "k1": self.k1, "b": self.b, "docs": self.docs}, f, ensure_ascii=False)
+        os.replace(tmp, vs_dir / self.FILENAME)
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[Tuple[List[str], float]], k: int = 60
+) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists given as (ids best first, weight); returns (id, score) best first."""
+    scores: Dict[str, float] = {}
+    for ids, weight in rankings:
+        for rank, cid in enumerate(ids):
+            scores[cid] = scores.get(cid, 0.0) + weight / (k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from .store import index_files
+
+
+def index_signature(path: Path, names: Optional[Iterable[str]] = None) -> Optional[Tuple[Tuple[int, int], ...]]:
+    """Return (mtime_ns, size) of each index file, or None if any is missing."""
+    names = names or index_files(path)
+    if names is None:
+        return None
+    sig = []
+    for name in names:
+        try:
+            st = (path / name).stat()
+        except FileNotFoundError:
+            return None
+        sig.append((st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def index_size_bytes(path: Path, names: Optional[Iterable[str]] = None) -> int:
+    names = names or index_files(path) or ()
+    total = 0
+    for name in names:
+        try:
+            total += (path / name).stat().st_size
+        except FileNotFoundError:
+            continue
+    return total
+
+
+@dataclass
+class _Entry:
+    value: Any
+    signature: Hashable
+    size_bytes: int
+
+
+class VectorStoreCache:
+    """In-process LRU cache of loaded vectorstores keyed by tenant.
+
+    Each lookup passes the current on-disk signature of the index; an entry
+    whose signature differs is reloaded, so rewrites by the worker are picked
+    up on the next request. Eviction keeps both the entry count and the
+    (estimated) resident size under the configured budget.
+    """
+
+    def __init__(self, max_entries: int = 8, max_bytes: int = 0):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def _lookup(self, key: Hashable, signature: Hashable) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.signature == signature:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry.value
+        return False, None
+
+    def get(self, key: Hashable, signature: Hashable, loader: Callable[[], Any], size_bytes: int = 0) -> Any:
+        with self._lock:
+            found, value = self._lookup(key, signature)
+            if found:
+                return value
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Load outside the global lock so other tenants are not blocked;
+        # the per-key lock collapses concurrent loads of the same tenant.
+        with key_lock:
+            with self._lock:
+                found, value = self._lookup(key, signature)
+                if found:
+                    return value
+            value = loader()
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self._total_bytes -= old.size_bytes
+                    self.reloads += 1
+                else:
+                    self.misses += 1
+                self._entries[key] = _Entry(value=value, signature=signature, size_bytes=size_bytes)
+                self._total_bytes += size_bytes
+                self._evict()
+            return value
+
+    def _evict(self) -> None:
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or (self.max_bytes and self._total_bytes > self.max_bytes)
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size_bytes
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= entry.size_bytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from .store import ColumnarDocstore
+
+
+@dataclass(frozen=True)
+class MetadataFilter:
+    """Restricts retrieval to chunks of some files, a page range and/or an upload window.
+
+    Filenames are matched against the basename of the chunk's source; pages
+    use the numbering returned in search results and both bounds are
+    inclusive. Upload times are epoch seconds; files without a recorded
+    upload time never match a time bound. Hashable, so it can be part of
+    cache keys.
+    """
+
+    filenames: Optional[Tuple[str, ...]] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    uploaded_after: Optional[float] = None
+    uploaded_before: Optional[float] = None
+
+    @classmethod
+    def build(
+        cls,
+        filenames: Optional[List[str]] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+        uploaded_after: Optional[float] = None,
+        uploaded_before: Optional[float] = None,
+    ) -> Optional["MetadataFilter"]:
+        """Normalized filter, or None when nothing is restricted."""
+        names = tuple(sorted({Path(f).name for f in filenames if f})) if filenames else None
+        flt = cls(names, page_from, page_to, uploaded_after, uploaded_before)
+        return None if flt.empty else flt
+
+    @property
+    def empty(self) -> bool:
+        return self == MetadataFilter()
+
+    @property
+    def by_time(self) -> bool:
+        return self.uploaded_after is not None or self.uploaded_before is not None
+
+
+class PositionMetadata:
+    """Per-position file and page columns of a loaded vectorstore.
+
+    Columnar docstores already hold them as memory-mapped arrays; pickled
+    ones are scanned once per load. Masks for a filter are then computed
+    with vectorized comparisons, independent of how many chunks match.
+    """
+
+    def __init__(self, files: List[str], file_codes: np.ndarray, pages: np.ndarray):
+        self.files = files  # basenames, indexed by file code
+        self.file_codes = file_codes
+        self.pages = pages
+
+    def __len__(self) -> int:
+        return len(self.file_codes)
+
+    @classmethod
+    def from_vectorstore(cls, vs: FAISS) -> "PositionMetadata":
+        store = vs.docstore
+        if isinstance(store, ColumnarDocstore):
+            files = [Path(str(f.get("source", ""))).name for f in store.files]
+            return cls(files, store.rows["file"], store.rows["page"])
+        n = vs.index.ntotal
+        codes = np.full(n, -1, dtype=np.int32)
+        pages = np.full(n, -1, dtype=np.int32)
+        files: List[str] = []
+        code_of: Dict[str, int] = {}
+        for pos, cid in vs.index_to_docstore_id.items():
+            doc = store.search(cid)
+            if not isinstance(doc, Document) or not 0 <= pos < n:
+                continue
+            md = doc.metadata or {}
+            if md.get("source") is not None:
+                name = Path(str(md["source"])).name
+                code = code_of.get(name)
+                if code is None:
+                    code = code_of[name] = len(files)
+                    files.append(name)
+                codes[pos] = code
+            if isinstance(md.get("page"), int):
+                pages[pos] = md["page"]
+        return cls(files, codes, pages)
+
+    def mask(self, flt: MetadataFilter, uploaded_at: Optional[Mapping[str, float]] = None) -> np.ndarray:
+        """Boolean array over positions: True where the chunk passes flt."""
+        keep = np.ones(len(self), dtype=bool)
+        if flt.filenames is not None or flt.by_time:
+            allowed = []
+            wanted = set(flt.filenames) if flt.filenames is not None else None
+            for code, name in enumerate(self.files):
+                if wanted is not None and name not in wanted:
+                    continue
+                if flt.by_time:
+                    ts = (uploaded_at or {}).get(name)
+                    if ts is None:
+                        continue
+                    if flt.uploaded_after is not None and ts < flt.uploaded_after:
+                        continue
+                    if flt.uploaded_before is not None and ts > flt.uploaded_before:
+                        continue
+                allowed.append(code)
+            keep &= np.isin(self.file_codes, np.asarray(allowed, dtype=np.int32))
+        if flt.page_from is not None:
+            keep &= self.pages >= flt.page_from
+        if flt.page_to is not None:
+            keep &= (self.pages >= 0) & (self.pages <= flt.page_to)
+        return keep
+
+
+_POSITION_METADATA: "weakref.WeakKeyDictionary[FAISS, PositionMetadata]" = weakref.WeakKeyDictionary()
+
+
+def position_metadata(vs: FAISS) -> PositionMetadata:
+    """PositionMetadata of vs, built on first use and kept as long as vs is alive."""
+    pm = _POSITION_METADATA.get(vs)
+    if pm is None:
+        pm = _POSITION_METADATA[vs] = PositionMetadata.from_vectorstore(vs)
+    return pm
+
+
+def filtered_search(index: "faiss.Index", q: np.ndarray, k: int, mask: np.ndarray, exact_max: int = 4096):
+    """Top-k search restricted to positions where mask is True; same (D, I) shape as index.search.
+
+    Small allowed sets are scored exactly from their stored vectors, which is
+    cheaper than any index traversal and cannot come back short on IVF/HNSW.
+    Larger ones go through the index with an IDSelectorBitmap, so only
+    allowed ids are scored and the usual nprobe/efSearch settings apply.
+    """
+    allowed = np.flatnonzero(mask)
+    empty = (np.full((len(q), k), np.inf, dtype="float32"), np.full((len(q), k), -1, dtype="int64"))
+    if allowed.size == 0:
+        return empty
+    if allowed.size <= exact_max:
+        try:
+            vecs = index.reconstruct_batch(allowed.astype("int64"))
+        except RuntimeError:
+            vecs = None  # e.g. IVF without a direct map: use the selector instead
+        if vecs is not None:
+            if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                dist = -(q @ vecs.T)
+            else:
+                dist = (q * q).sum(1)[:, None] - 2.0 * (q @ vecs.T) + (vecs * vecs).sum(1)[None, :]
+            top = np.argsort(dist, axis=1, kind="stable")[:, :k]
+            D, I = empty
+            n = top.shape[1]
+            I[:, :n] = allowed[top]
+            D[:, :n] = np.take_along_axis(dist, top, axis=1)
+            if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                D[:, :n] = -D[:, :n]
+            return D, I
+    bitmap = np.packbits(mask, bitorder="little")
+    sel = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+    ivf = faiss.try_extract_index_ivf(index)
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=sel, efSearch=index.hnsw.efSearch)
+    elif ivf is not None:
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    return index.search(q, k, params=params)
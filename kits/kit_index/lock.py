@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger("kit_index")
+
+
+class LockTimeout(RuntimeError):
+    """Another writer held the tenant's index lock for longer than we were willing to wait."""
+
+
+class LockLost(RuntimeError):
+    """The lock expired while held (e.g. the holder stalled past its TTL); the write must not be published."""
+
+
+class TenantLock:
+    """Exclusive per-tenant index write lock.
+
+    With a Redis client it is a Redis lock (SET NX with a TTL), so writers on
+    any host exclude each other; the TTL is renewed in the background while
+    held, and a crashed holder's lock expires after ttl_s. Without one it
+    falls back to an fcntl lock file under lock_dir, which covers processes
+    sharing a filesystem on one host.
+
+        with TenantLock(tenant, redis=conn, lock_dir=DATA_DIR / "locks"):
+            ...
+    """
+
+    def __init__(
+        self,
+        tenant: str,
+        redis=None,
+        lock_dir: Optional[Path] = None,
+        ttl_s: float = 60.0,
+        wait_s: float = 120.0,
+        prefix: str = "docrag:index-lock:",
+    ):
+        if redis is None and lock_dir is None:
+            raise ValueError("TenantLock needs a Redis client or a lock directory")
+        self.tenant = tenant
+        self.ttl_s = ttl_s
+        self.wait_s = wait_s
+        self._redis = redis
+        self._key = f"{prefix}{tenant}"
+        self._path = (lock_dir / f"{tenant}.lock") if lock_dir is not None else None
+        self._lock = None  # redis-py Lock
+        self._fd = None
+        self._stop = threading.Event()
+        self._renewer: Optional[threading.Thread] = None
+        self.lost = False
+
+    def acquire(self) -> "TenantLock":
+        if self._redis is not None:
+            self._lock = self._redis.lock(self._key, timeout=self.ttl_s, sleep=0.1, blocking_timeout=self.wait_s, thread_local=False)
+            if not self._lock.acquire():
+                raise LockTimeout(f"Index lock for tenant {self.tenant} busy for {self.wait_s:.0f}s")
+            self._stop.clear()
+            self._renewer = threading.Thread(target=self._renew, name=f"index-lock-{self.tenant}", daemon=True)
+            self._renewer.start()
+            return self
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd = open(self._path, "a+")
+        deadline = time.monotonic() + self.wait_s
+        while fcntl is not None:
+            try:
+                fcntl.flock(fd.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    fd.close()
+                    raise LockTimeout(f"Index lock for tenant {self.tenant} busy for {self.wait_s:.0f}s")
+                time.sleep(0.05)
+        self._fd = fd
+        return self
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self.ttl_s / 3):
+            try:
+                self._lock.reacquire()
+            except Exception as e:
+                self.lost = True
+                logger.error("Lost index lock for tenant %s: %s", self.tenant, e)
+                return
+
+    def ensure_held(self) -> None:
+        """Raise LockLost unless the lock is still ours; call right before publishing."""
+        if self._lock is not None and (self.lost or not self._lock.owned()):
+            raise LockLost(f"Index lock for tenant {self.tenant} expired while held")
+
+    def release(self) -> None:
+        if self._lock is not None:
+            self._stop.set()
+            if self._renewer is not None:
+                self._renewer.join()
+            try:
+                self._lock.release()
+            except Exception:  # already expired; someone else may hold it now
+                pass
+            self._lock = None
+        if self._fd is not None:
+            if fcntl is not None:
+                fcntl.flock(self._fd.fileno(), fcntl.LOCK_UN)
+            self._fd.close()
+            self._fd = None
+
+    def __enter__(self) -> "TenantLock":
+        return self.acquire()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
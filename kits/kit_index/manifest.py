@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_hash(text: str, page: Optional[int] = None) -> str:
+    # Page is part of the identity so a chunk that moved keeps correct metadata
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(page if page is not None else "").encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class TenantManifest:
+    """Per-tenant record of indexed files: content hash and [chunk_hash, chunk_id] pairs.
+
+    Stored as manifest.json next to the FAISS files. Chunk ids are the
+    docstore ids of the vectors, so a file's chunks can be replaced in place.
+    """
+
+    FILENAME = "manifest.json"
+
+    def __init__(self, path: Path, files: Optional[Dict[str, dict]] = None, settings: Optional[dict] = None):
+        self.path = path
+        self.files: Dict[str, dict] = files or {}
+        # Per-tenant overrides, e.g. {"ann_index": "hnsw"}
+        self.settings: dict = settings or {}
+
+    @classmethod
+    def load(cls, vs_dir: Path) -> "TenantManifest":
+        path = vs_dir / cls.FILENAME
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        return cls(path, data.get("files") or {}, data.get("settings") or {})
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def save(self, vs_dir: Optional[Path] = None) -> None:
+        """Write manifest.json; vs_dir moves the manifest to another index directory first."""
+        if vs_dir is not None:
+            self.path = vs_dir / self.FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "settings": self.settings, "files": self.files}, f)
+        os.replace(tmp, self.path)
+
+    def get(self, name: str) -> Optional[dict]:
+        return self.files.get(name)
+
+    def chunk_ids_by_hash(self, name: str) -> Dict[str, List[str]]:
+        out: Dict[str, List[str]] = {}
+        for h, cid in (self.files.get(name) or {}).get("chunks", []):
+            out.setdefault(h, []).append(cid)
+        return out
+
+    def set_file(self, name: str, sha256: str, chunks: List[List[str]], uploaded_at: Optional[float] = None) -> None:
+        self.files[name] = {"sha256": sha256, "chunks": chunks}
+        if uploaded_at is not None:
+            self.files[name]["uploaded_at"] = uploaded_at
+
+    def upload_times(self) -> Dict[str, float]:
+        """Upload time (epoch seconds) of each file that has one recorded."""
+        return {name: e["uploaded_at"] for name, e in self.files.items() if e.get("uploaded_at") is not None}
+
+    def remove_file(self, name: str) -> List[str]:
+        entry = self.files.pop(name, None) or {}
+        return [cid for _, cid in entry.get("chunks", [])]
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from typing import List, Sequence
+
+import numpy as np
+
+
+def mmr_select(vectors: np.ndarray, relevance: Sequence[float], k: int, lambda_: float = 0.7) -> List[int]:
+    """Maximal marginal relevance: pick k rows balancing relevance against redundancy.
+
+    relevance is min-max scaled to [0, 1] and redundancy is the highest cosine
+    similarity (clipped at 0) to an already picked row, so the two terms are
+    comparable whatever the retriever's score scale. All-zero rows (no vector
+    available) are never considered redundant. Returns row indices in pick order.
+    """
+    m = len(relevance)
+    k = min(k, m)
+    if k <= 0:
+        return []
+    rel = np.asarray(relevance, dtype=np.float32)
+    span = float(rel.max() - rel.min())
+    rel = (rel - rel.min()) / span if span > 0 else np.ones(m, dtype=np.float32)
+    v = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(v, axis=1, keepdims=True)
+    v = np.divide(v, norms, out=np.zeros_like(v), where=norms > 0)
+    sim = np.clip(v @ v.T, 0.0, None)
+    redundancy = np.zeros(m, dtype=np.float32)
+    picked = np.zeros(m, dtype=bool)
+    order: List[int] = []
+    for _ in range(k):
+        score = lambda_ * rel - (1.0 - lambda_) * redundancy
+        score[picked] = -np.inf
+        i = int(np.argmax(score))
+        order.append(i)
+        picked[i] = True
+        np.maximum(redundancy, sim[i], out=redundancy)
+    return order
@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import pickle
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Collection, Dict, Iterator, List, Optional, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+PICKLE_FILES = ("index.faiss", "index.pkl")
+# docs.meta.json is written last and marks a complete columnar store
+COLUMNAR_FILES = ("index.faiss", "docs.rows", "docs.ids", "docs.bin", "docs.meta.json")
+
+# One fixed-size record per FAISS position; text lives in docs.bin at [offset, offset+length)
+ROW_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("file", "<i4"), ("page", "<i4"), ("chunk", "<i4")])
+# Version 1 stores had no chunk (position within the page) column
+ROW_DTYPES = {1: np.dtype([("offset", "<u8"), ("length", "<u4"), ("file", "<i4"), ("page", "<i4")]), 2: ROW_DTYPE}
+# Positions of deleted chunks whose vectors are still in the index (see ann.delete_documents)
+TOMBSTONES_FILE = "tombstones.npy"
+
+
+def docstore_format(path: Path) -> Optional[str]:
+    """"columnar" or "pickle" depending on what is on disk, None if there is no index."""
+    if not (path / "index.faiss").exists():
+        return None
+    if (path / "docs.meta.json").exists():
+        return "columnar"
+    if (path / "index.pkl").exists():
+        return "pickle"
+    return None
+
+
+def index_files(path: Path) -> Optional[tuple]:
+    fmt = docstore_format(path)
+    if fmt is None:
+        return None
+    return COLUMNAR_FILES if fmt == "columnar" else PICKLE_FILES
+
+
+def load_tombstones(path: Path) -> np.ndarray:
+    """Sorted tombstoned positions of the index in path (empty if none)."""
+    try:
+        return np.load(path / TOMBSTONES_FILE)
+    except FileNotFoundError:
+        return np.zeros(0, dtype="int64")
+
+
+def live_mask(n: int, tombstones: np.ndarray) -> Optional[np.ndarray]:
+    """Boolean array over n positions, False where tombstoned; None when nothing is."""
+    if tombstones.size == 0:
+        return None
+    mask = np.ones(n, dtype=bool)
+    mask[tombstones[tombstones < n]] = False
+    return mask
+
+
+def mmap_io_flags() -> int:
+    """faiss read flags that map index data from the page cache instead of copying it.
+
+    IO_FLAG_MMAP_IFC (newer faiss) also covers flat/HNSW storage; plain
+    IO_FLAG_MMAP only maps IVF inverted lists.
+    """
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return flag | faiss.IO_FLAG_READ_ONLY
+
+
+def _memmap(path: Path, dtype, count: int) -> np.ndarray:
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class RowIdMap(Mapping):
+    """Identity position -> row mapping for a read-only ColumnarDocstore.
+
+    The docstore accepts row numbers as keys, so search never needs an
+    id -> row dictionary and nothing proportional to N is built at load.
+    """
+
+    def __init__(self, n: int):
+        self._n = n
+
+    def __getitem__(self, pos: int) -> int:
+        pos = int(pos)
+        if not 0 <= pos < self._n:
+            raise KeyError(pos)
+        return pos
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self._n))
+
+    def __len__(self) -> int:
+        return self._n
+
+
+class ColumnarDocstore:
+    """Docstore reading chunk text lazily from memory-mapped files.
+
+    The row table (offset, length, file, page) and the fixed-width id array
+    are memory-mapped; a document's text is decoded only when search() is
+    called for it, i.e. for the top-k hits of a query.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / "docs.meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.files: List[dict] = meta["files"]
+        n = int(meta["count"])
+        self.rows = _memmap(path / "docs.rows", ROW_DTYPES[int(meta.get("version", 1))], n)
+        self._ids = _memmap(path / "docs.ids", np.dtype(f"S{max(1, int(meta['id_width']))}"), n)
+        self._row_of: Optional[Dict[str, int]] = None
+        self._blob_file = open(path / "docs.bin", "rb")
+        size = os.fstat(self._blob_file.fileno()).st_size
+        self._blob = mmap.mmap(self._blob_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def id(self, row: int) -> str:
+        return self._ids[row].decode("ascii")
+
+    def ids(self) -> List[str]:
+        return [cid.decode("ascii") for cid in self._ids]
+
+    def row(self, cid: str) -> Optional[int]:
+        if self._row_of is None:
+            self._row_of = {c: i for i, c in enumerate(self.ids())}
+        return self._row_of.get(cid)
+
+    def text(self, row: int) -> str:
+        r = self.rows[row]
+        start = int(r["offset"])
+        return self._blob[start : start + int(r["length"])].decode("utf-8")
+
+    def metadata(self, row: int) -> dict:
+        r = self.rows[row]
+        md = dict(self.files[int(r["file"])]) if r["file"] >= 0 else {}
+        if r["page"] >= 0:
+            md["page"] = int(r["page"])
+        if "chunk" in r.dtype.names and r["chunk"] >= 0:
+            md["chunk"] = int(r["chunk"])
+        md["id"] = self.id(row)
+        return md
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        row = search if isinstance(search, (int, np.integer)) else self.row(search)
+        if row is None or not 0 <= row < len(self.rows):
+            return f"ID {search} not found."
+        return Document(id=self.id(row), page_content=self.text(row), metadata=self.metadata(row))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise NotImplementedError("ColumnarDocstore is read-only; load with writable=True to modify")
+
+    def delete(self, ids: List) -> None:
+        raise NotImplementedError("ColumnarDocstore is read-only; load with writable=True to modify")
+
+
+def _write_columnar(vs: FAISS, path: Path, tombstones: Collection[int] = ()) -> None:
+    n = len(vs.index_to_docstore_id)
+    ids: List[bytes] = []
+    files: List[dict] = []
+    file_idx: Dict[str, int] = {}
+    rows = np.zeros(n, dtype=ROW_DTYPE)
+    offset = 0
+    with open(path / "docs.bin.tmp", "wb") as blob:
+        for pos in range(n):
+            cid = vs.index_to_docstore_id[pos]
+            doc = vs.docstore.search(cid)
+            if not isinstance(doc, Document):
+                if pos not in tombstones:
+                    raise ValueError(f"Could not find document for id {cid}")
+                # Deleted chunk still holding its index position: an empty row keeps positions aligned
+                rows[pos] = (offset, 0, -1, -1, -1)
+                ids.append(str(cid).encode("ascii"))
+                continue
+            data = doc.page_content.encode("utf-8")
+            md = doc.metadata or {}
+            source = md.get("source")
+            if source is None:
+                fi = -1
+            else:
+                fi = file_idx.get(source)
+                if fi is None:
+                    fi = file_idx[source] = len(files)
+                    files.append({"source": source})
+            page = md.get("page")
+            chunk = md.get("chunk")
+            rows[pos] = (offset, len(data), fi, page if isinstance(page, int) else -1, chunk if isinstance(chunk, int) else -1)
+            blob.write(data)
+            offset += len(data)
+            ids.append(str(cid).encode("ascii"))
+    width = max((len(i) for i in ids), default=1)
+    rows.tofile(path / "docs.rows.tmp")
+    np.array(ids, dtype=f"S{width}").tofile(path / "docs.ids.tmp")
+    with open(path / "docs.meta.json.tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": 2, "count": n, "id_width": width, "files": files}, f)
+    for name in ("docs.bin", "docs.rows", "docs.ids", "docs.meta.json"):
+        os.replace(path / f"{name}.tmp", path / name)
+
+
+def save_vectorstore(vs: FAISS, path: Path, fmt: str = "pickle", tombstones: Collection[int] = ()) -> None:
+    """Persist vs in the given docstore format, removing files of the other format.
+
+    tombstones are positions of deleted chunks still in the index; they are
+    saved alongside so readers can exclude them.
+    """
+    path.mkdir(parents=True, exist_ok=True)
+    # Never rewrite in place: readers may have the old file memory-mapped
+    faiss.write_index(vs.index, str(path / "index.faiss.tmp"))
+    os.replace(path / "index.faiss.tmp", path / "index.faiss")
+    if tombstones:
+        np.save(path / "tombstones.tmp.npy", np.asarray(sorted(tombstones), dtype="int64"))
+        os.replace(path / "tombstones.tmp.npy", path / TOMBSTONES_FILE)
+    else:
+        try:
+            os.remove(path / TOMBSTONES_FILE)
+        except FileNotFoundError:
+            pass
+    if fmt == "columnar":
+        _write_columnar(vs, path, set(tombstones))
+        stale = ("index.pkl",)
+    elif fmt == "pickle":
+        docstore = vs.docstore
+        if not isinstance(docstore, InMemoryDocstore):
+            raise ValueError("pickle format needs an in-memory docstore; load with writable=True")
+        with open(path / "index.pkl.tmp", "wb") as f:
+            pickle.dump((docstore, dict(vs.index_to_docstore_id)), f)
+        os.replace(path / "index.pkl.tmp", path / "index.pkl")
+        # marker first, so a half-removed columnar store is never picked up
+        stale = ("docs.meta.json", "docs.rows", "docs.ids", "docs.bin")
+    else:
+        raise ValueError(f"Unknown docstore format: {fmt}")
+    for name in stale:
+        try:
+            os.remove(path / name)
+        except FileNotFoundError:
+            pass
+
+
+def load_vectorstore(path: Path, embeddings, writable: bool = False, io_flags: int = 0) -> FAISS:
+    """Load a tenant index in either format.
+
+    Read-only loads of a columnar store keep chunk text on disk; writable
+    loads materialize an InMemoryDocstore so documents can be added/deleted.
+    With io_flags=mmap_io_flags() the vectors stay in the page cache and are
+    shared by every process that maps the same file; index types that cannot
+    be mapped are read normally.
+    """
+    fmt = docstore_format(path)
+    if fmt is None:
+        raise FileNotFoundError(f"No index in {path}")
+    try:
+        index = faiss.read_index(str(path / "index.faiss"), io_flags)
+    except RuntimeError:
+        if not io_flags:
+            raise
+        index = faiss.read_index(str(path / "index.faiss"))
+    if fmt == "pickle":
+        with open(path / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+    store = ColumnarDocstore(path)
+    if not writable:
+        return FAISS(embeddings, index, store, RowIdMap(len(store)))
+    ids = store.ids()
+    dead = set(load_tombstones(path).tolist())
+    docs = {cid: store.search(row) for row, cid in enumerate(ids) if row not in dead}
+    return FAISS(embeddings, index, InMemoryDocstore(docs), dict(enumerate(ids)))
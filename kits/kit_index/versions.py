@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import os
+import re
+import shutil
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from .store import docstore_format
+
+# Names the active generation's directory and the index epoch, e.g. "v000042 3f9c2a1b7d0e";
+# replaced atomically
+CURRENT_FILE = "CURRENT"
+_VERSION_RE = re.compile(r"^v(\d+)$")
+# Files of the pre-versioning layout, written straight into the tenant directory
+LEGACY_FILES = (
+    "index.faiss",
+    "index.pkl",
+    "docs.meta.json",
+    "docs.rows",
+    "docs.ids",
+    "docs.bin",
+    "bm25.json",
+    "manifest.json",
+)
+
+
+@dataclass(frozen=True)
+class IndexVersion:
+    path: Path  # directory holding this generation's index files
+    generation: int  # 0 for an index in the legacy unversioned layout
+    # Random per index lifetime: generations restart at 1 once the tenant
+    # directory is deleted, so only (epoch, generation) is unique
+    epoch: str = ""
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return (self.epoch, self.generation)
+
+
+def current_version(tenant_dir: Path) -> Optional[IndexVersion]:
+    """The tenant's active index generation, or None if it has no index yet.
+
+    Published generations are never modified, so (tenant, version.key)
+    identifies index contents and readers need no other change detection.
+    """
+    try:
+        name, _, epoch = (tenant_dir / CURRENT_FILE).read_text(encoding="utf-8").strip().partition(" ")
+    except FileNotFoundError:
+        return IndexVersion(tenant_dir, 0) if docstore_format(tenant_dir) is not None else None
+    m = _VERSION_RE.match(name)
+    if m is None:
+        raise ValueError(f"Corrupt {CURRENT_FILE} in {tenant_dir}: {name!r}")
+    return IndexVersion(tenant_dir / name, int(m.group(1)), epoch.strip())
+
+
+def _versions(tenant_dir: Path) -> List[Tuple[int, Path]]:
+    out = []
+    for p in tenant_dir.iterdir() if tenant_dir.exists() else ():
+        m = _VERSION_RE.match(p.name)
+        if m is not None and p.is_dir():
+            out.append((int(m.group(1)), p))
+    return sorted(out)
+
+
+def publish_version(tenant_dir: Path, write: Callable[[Path], None], keep: int = 2) -> IndexVersion:
+    """Write a new generation with write(dir) and atomically make it current.
+
+    The files go to a private temporary directory that is renamed into place
+    complete, then CURRENT is swapped to it, so readers see either the old or
+    the new generation and never a mix. Callers must hold the tenant's write
+    lock. The newest `keep` generations are retained for readers that
+    resolved CURRENT just before the swap.
+    """
+    tenant_dir.mkdir(parents=True, exist_ok=True)
+    cur = current_version(tenant_dir)
+    existing = _versions(tenant_dir)
+    gen = max([cur.generation if cur else 0] + [g for g, _ in existing]) + 1
+    # A new epoch whenever the tenant starts over (first publish, e.g. after a reset)
+    epoch = cur.epoch if cur is not None and cur.generation else uuid.uuid4().hex[:12]
+    final = tenant_dir / f"v{gen:06d}"
+    tmp = tenant_dir / f".tmp-{final.name}-{uuid.uuid4().hex[:8]}"
+    tmp.mkdir()
+    try:
+        write(tmp)
+        os.replace(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    pointer = tenant_dir / f"{CURRENT_FILE}.tmp"
+    pointer.write_text(f"{final.name} {epoch}".strip(), encoding="utf-8")
+    os.replace(pointer, tenant_dir / CURRENT_FILE)
+    prune_versions(tenant_dir, keep)
+    return IndexVersion(final, gen, epoch)
+
+
+def prune_versions(tenant_dir: Path, keep: int = 2) -> int:
+    """Delete all but the newest `keep` generations (never the current one); returns how many.
+
+    Also clears leftovers of writers that died mid-publish, and the legacy
+    top-level files once enough versioned generations exist. Callers must
+    hold the tenant's write lock.
+    """
+    cur = current_version(tenant_dir)
+    if cur is None or cur.generation == 0:
+        return 0
+    removed = 0
+    versions = _versions(tenant_dir)
+    for gen, path in versions[: max(0, len(versions) - max(1, keep))]:
+        if gen != cur.generation:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    for p in tenant_dir.glob(".tmp-v*"):
+        shutil.rmtree(p, ignore_errors=True)
+    if len(versions) >= keep:
+        for name in LEGACY_FILES:
+            try:
+                os.remove(tenant_dir / name)
+            except FileNotFoundError:
+                pass
+    return removed
@@ -2,9 +2,13 @@ from __future__ import annotations
 
 import asyncio
 import json
+import logging
 import os
+import random
+import threading
+import weakref
 from dataclasses import dataclass
-from typing import AsyncGenerator, Iterable, List, Optional
+from typing import AsyncGenerator, Dict, Iterable, List, Optional, Tuple
 
 try:
     from openai import AsyncOpenAI
@@ -16,26 +20,156 @@ try:
 except Exception:  # pragma: no cover
     httpx = None  # type: ignore
 
+from .answer_cache import AnswerCache, CachedAnswer
+from .batcher import QueryBatcher
+from .clients import HttpPoolConfig, LLMClientPool
+from .embed_cache import EmbeddingCache
+from .prompt import BuiltPrompt, PromptConfig, PromptSource, Tokenizer, answer_reservation, build_prompt, get_tokenizer
+from .rerank import CrossEncoderReranker, RerankConfig, RerankResult, get_reranker
+
 
 @dataclass
 class EmbedConfig:
     backend: str = os.getenv("EMBED_BACKEND", "sentence_transformers")
     model: str = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
     batch_size: int = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    # Persistent embedding cache (SQLite file); empty disables it
+    cache_path: str = os.getenv("EMBED_CACHE_PATH", "")
+    cache_max_entries: int = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+    # Remote (OpenAI) backend: concurrent batch requests and retries of transient failures
+    concurrency: int = int(os.getenv("EMBED_CONCURRENCY", "4"))
+    max_retries: int = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+    retry_backoff_s: float = float(os.getenv("EMBED_RETRY_BACKOFF_S", "0.5"))
+
+
+logger = logging.getLogger("kit_llm")
+
+_SYNC_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_SYNC_LOOP_LOCK = threading.Lock()
+
+
+def _run_sync(coro):
+    """Run coro to completion from blocking code, whether or not a loop is running in this thread.
+
+    Coroutines go to one long-lived loop on a daemon thread, so pooled
+    clients stay bound to a single loop and callers inside a running loop
+    (e.g. FastAPI) don't hit "event loop is already running".
+    """
+    global _SYNC_LOOP
+    with _SYNC_LOOP_LOCK:
+        if _SYNC_LOOP is None:
+            _SYNC_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_SYNC_LOOP.run_forever, name="kit-llm-sync", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _SYNC_LOOP).result()
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    try:
+        import openai
+    except Exception:  # pragma: no cover
+        return False
+    return isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError))
 
 
 class EmbeddingBackend:
     def __init__(self, cfg: Optional[EmbedConfig] = None):
         self.cfg = cfg or EmbedConfig()
         self._st_model = None
+        self._st_lock = threading.Lock()
+        self.cache: Optional[EmbeddingCache] = None
+        if self.cfg.cache_path:
+            self.cache = EmbeddingCache(self.cfg.cache_path, max_entries=self.cfg.cache_max_entries)
+        # Semaphores are bound to a loop; one per loop bounds all in-flight requests on it
+        self._sems: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self.retries = 0
 
     def _ensure_st(self):
         if self._st_model is None:
-            from sentence_transformers import SentenceTransformer
+            with self._st_lock:
+                if self._st_model is None:
+                    from sentence_transformers import SentenceTransformer
 
-            self._st_model = SentenceTransformer(self.cfg.model)
+                    self._st_model = SentenceTransformer(self.cfg.model)
+
+    def load(self) -> None:
+        """Load the local model now (no-op for remote/hash backends)."""
+        if self.cfg.backend not in {"hash", "openai"}:
+            self._ensure_st()
 
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None or not texts:
+            return self._embed_uncached(texts)
+        model_key = f"{self.cfg.backend}:{self.cfg.model}"
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        for i, vec in self.cache.get_many(model_key, texts).items():
+            out[i] = vec
+        missing = [i for i, v in enumerate(out) if v is None]
+        if missing:
+            todo = [texts[i] for i in missing]
+            vecs = self._embed_uncached(todo)
+            self.cache.put_many(model_key, todo, vecs)
+            for i, vec in zip(missing, vecs):
+                out[i] = vec
+        return out  # type: ignore[return-value]
+
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Async embed_texts: remote batches are sent concurrently, local models run in a thread."""
+        if self.cfg.backend != "openai":
+            return await asyncio.to_thread(self.embed_texts, texts)
+        if self.cache is None or not texts:
+            return await self._aembed_openai(texts)
+        model_key = f"{self.cfg.backend}:{self.cfg.model}"
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        for i, vec in (await asyncio.to_thread(self.cache.get_many, model_key, texts)).items():
+            out[i] = vec
+        missing = [i for i, v in enumerate(out) if v is None]
+        if missing:
+            todo = [texts[i] for i in missing]
+            vecs = await self._aembed_openai(todo)
+            await asyncio.to_thread(self.cache.put_many, model_key, todo, vecs)
+            for i, vec in zip(missing, vecs):
+                out[i] = vec
+        return out  # type: ignore[return-value]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_texts([text]))[0]
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._sems.get(loop)
+        if sem is None:
+            sem = self._sems[loop] = asyncio.Semaphore(max(1, self.cfg.concurrency))
+        return sem
+
+    async def _aembed_openai(self, texts: List[str]) -> List[List[float]]:
+        if AsyncOpenAI is None:
+            raise RuntimeError("openai package not installed")
+        # Retries are ours (with backoff across batches), not the client's
+        client = LLM_CLIENTS.openai().with_options(max_retries=0)
+        sem = self._semaphore()
+
+        async def _batch(batch: List[str]) -> List[List[float]]:
+            attempt = 0
+            while True:
+                try:
+                    async with sem:
+                        resp = await client.embeddings.create(model=self.cfg.model, input=batch, encoding_format="float")
+                    return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
+                except Exception as e:
+                    if attempt >= self.cfg.max_retries or not _is_retryable(e):
+                        raise
+                    delay = self.cfg.retry_backoff_s * (2**attempt)
+                    delay += random.uniform(0, delay)
+                    attempt += 1
+                    self.retries += 1
+                    logger.warning("Embedding request failed (%s); retry %d in %.2fs", e, attempt, delay)
+                    await asyncio.sleep(delay)
+
+        step = max(1, self.cfg.batch_size)
+        parts = await asyncio.gather(*(_batch(texts[i : i + step]) for i in range(0, len(texts), step)))
+        return [vec for part in parts for vec in part]
+
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
         if self.cfg.backend == "hash":
             # Lightweight deterministic embedding for tests/offline
             def _vec(t: str) -> List[float]:
@@ -45,21 +179,8 @@ class EmbeddingBackend:
                 return [((acc + i * 9973) % 10007) / 10007.0 for i in range(8)]
             return [_vec(t) for t in texts]
         if self.cfg.backend == "openai":
-            # Use OpenAI embeddings endpoint
-            if AsyncOpenAI is None:
-                raise RuntimeError("openai package not installed")
-            model = self.cfg.model
-            client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
-
-            async def _run() -> List[List[float]]:
-                out: List[List[float]] = []
-                for i in range(0, len(texts), self.cfg.batch_size):
-                    batch = texts[i : i + self.cfg.batch_size]
-                    resp = await client.embeddings.create(model=model, input=batch)
-                    out.extend([d.embedding for d in resp.data])
-                return out
-
-            return asyncio.get_event_loop().run_until_complete(_run())
+            # Blocking callers (worker, query batcher) share the async path
+            return _run_sync(self._aembed_openai(texts))
         # sentence-transformers default
         self._ensure_st()
         arr = self._st_model.encode(texts, batch_size=self.cfg.batch_size, show_progress_bar=False, normalize_embeddings=True)
@@ -75,6 +196,47 @@ class EmbeddingBackend:
         return self.embed_texts([text])[0]
 
 
+# Process-wide registry: one backend (and loaded model) per (backend, model)
+_BACKENDS: Dict[Tuple[str, str], EmbeddingBackend] = {}
+_BACKENDS_LOCK = threading.Lock()
+
+
+def get_embedding_backend(cfg: Optional[EmbedConfig] = None) -> EmbeddingBackend:
+    """Return the shared backend for cfg's (backend, model), creating it lazily."""
+    cfg = cfg or EmbedConfig()
+    key = (cfg.backend, cfg.model)
+    with _BACKENDS_LOCK:
+        be = _BACKENDS.get(key)
+        if be is None:
+            be = EmbeddingBackend(cfg)
+            _BACKENDS[key] = be
+    return be
+
+
+_BATCHERS: Dict[int, QueryBatcher] = {}
+
+
+def get_query_batcher(backend: EmbeddingBackend, max_wait_ms: Optional[float] = None, max_batch: Optional[int] = None) -> QueryBatcher:
+    """Return the shared query batcher in front of backend (one per backend instance)."""
+    with _BACKENDS_LOCK:
+        qb = _BATCHERS.get(id(backend))
+        if qb is None or qb.backend is not backend:
+            qb = QueryBatcher(
+                backend,
+                max_wait_ms=max_wait_ms if max_wait_ms is not None else float(os.getenv("EMBED_QUERY_MAX_WAIT_MS", "5")),
+                max_batch=max_batch if max_batch is not None else int(os.getenv("EMBED_QUERY_MAX_BATCH", "32")),
+            )
+            _BATCHERS[id(backend)] = qb
+    return qb
+
+
+def warmup_embeddings(cfg: Optional[EmbedConfig] = None) -> EmbeddingBackend:
+    """Load the shared model eagerly and run one encode so the first query is fast."""
+    be = get_embedding_backend(cfg)
+    be.embed_query("warmup")
+    return be
+
+
 @dataclass
 class ChatConfig:
     backend: str = os.getenv("LLM_BACKEND", "ollama")
@@ -83,12 +245,29 @@ class ChatConfig:
     max_tokens: int = int(os.getenv("LLM_MAX_TOKENS", "512"))
 
 
+# One pool per process; clients are reused across prompts for keep-alive
+LLM_CLIENTS = LLMClientPool()
+
+
+async def init_llm_clients(cfg: Optional[ChatConfig] = None) -> None:
+    """Create the pooled client for the configured chat backend on the running loop."""
+    cfg = cfg or ChatConfig()
+    if cfg.backend == "openai":
+        LLM_CLIENTS.openai()
+    else:
+        LLM_CLIENTS.http()
+
+
+async def close_llm_clients() -> None:
+    await LLM_CLIENTS.aclose()
+
+
 async def chat_stream(prompt: str, cfg: Optional[ChatConfig] = None) -> AsyncGenerator[str, None]:
     cfg = cfg or ChatConfig()
     if cfg.backend == "openai":
         if AsyncOpenAI is None:
             raise RuntimeError("openai package not installed")
-        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"))
+        client = LLM_CLIENTS.openai()
         stream = await client.chat.completions.create(
             model=cfg.model,
             temperature=cfg.temperature,
@@ -107,26 +286,27 @@ async def chat_stream(prompt: str, cfg: Optional[ChatConfig] = None) -> AsyncGen
     base = os.getenv("OLLAMA_HOST", "http://localhost:11434")
     url = base.rstrip("/") + "/api/generate"
     try:
-        async with httpx.AsyncClient(timeout=None) as client:
-            req = {
-                "model": cfg.model,
-                "prompt": prompt,
-                "stream": True,
-                "options": {"temperature": cfg.temperature, "num_predict": cfg.max_tokens},
-            }
-            async with client.stream("POST", url, json=req) as resp:
-                resp.raise_for_status()
-                async for line in resp.aiter_lines():
-                    if not line:
-                        continue
-                    try:
-                        data = json.loads(line)
-                    except Exception:
-                        continue
-                    if "response" in data and data["response"]:
-                        yield data["response"]
-                    if data.get("done"):
-                        break
+        client = LLM_CLIENTS.http()
+        req = {
+            "model": cfg.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {"temperature": cfg.temperature, "num_predict": cfg.max_tokens},
+        }
+        async with client.stream("POST", url, json=req) as resp:
+            resp.raise_for_status()
+            done = False
+            # Read to the end even after "done": a partially read response can't return to the pool
+            async for line in resp.aiter_lines():
+                if not line or done:
+                    continue
+                try:
+                    data = json.loads(line)
+                except Exception:
+                    continue
+                if "response" in data and data["response"]:
+                    yield data["response"]
+                done = bool(data.get("done"))
     except Exception:
         # Fallback: no tokens yielded on error to keep API responsive in tests
         return
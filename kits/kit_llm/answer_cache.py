@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import math
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from kits.kit_common.cache import TTLCache
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+_whitespace_re = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    q = _whitespace_re.sub(" ", question).strip().lower()
+    return q.rstrip("?!. ")
+
+
+@dataclass
+class CachedAnswer:
+    tokens: List[str]
+    sources: List[dict]
+    question: str = ""
+
+    @property
+    def answer(self) -> str:
+        return "".join(self.tokens)
+
+
+@dataclass
+class _Scope:
+    vectors: List[Tuple[List[float], Hashable]] = field(default_factory=list)
+
+
+class AnswerCache:
+    """Cache of generated answers keyed by (tenant, generation, question, top_k, model).
+
+    The index generation is part of the key, so a re-indexed tenant never
+    gets a stale answer. With semantic_threshold > 0, a miss on the exact
+    question falls back to the most similar cached question of the same
+    (tenant, generation, top_k, model) whose cosine similarity reaches the
+    threshold. Question vectors are kept for at most max_scopes scopes (LRU),
+    and a tenant's scopes of other generations are dropped once a new
+    generation is cached.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 3600.0, semantic_threshold: float = 0.0, max_per_scope: int = 256, max_scopes: int = 256):
+        self._cache = TTLCache(max_entries=max_entries, ttl_s=ttl_s)
+        self.semantic_threshold = semantic_threshold
+        self.max_per_scope = max(1, max_per_scope)
+        self.max_scopes = max(1, max_scopes)
+        self._scopes: "OrderedDict[Hashable, _Scope]" = OrderedDict()
+        self._generations: Dict[str, Hashable] = {}
+        self._lock = threading.Lock()
+        self.semantic_hits = 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.semantic_threshold > 0
+
+    @staticmethod
+    def scope(tenant: str, generation: Hashable, top_k: int, model: str, retrieval: Hashable = "dense") -> Tuple:
+        # retrieval: whatever else selects the sources (search mode, reranking)
+        return (tenant, generation, top_k, model, retrieval)
+
+    @staticmethod
+    def key(scope: Tuple, question: str) -> Tuple:
+        return scope + (normalize_question(question),)
+
+    def get(self, key: Tuple) -> Optional[CachedAnswer]:
+        return self._cache.get(key)
+
+    def get_semantic(self, scope: Tuple, qvec: List[float]) -> Optional[CachedAnswer]:
+        if not self.semantic:
+            return None
+        q = _unit(qvec)
+        with self._lock:
+            entries = list(self._scopes.get(scope, _Scope()).vectors)
+        if not entries:
+            return None
+        if np is not None:
+            sims = np.asarray([vec for vec, _ in entries], dtype="float32") @ np.asarray(q, dtype="float32")
+            best = int(sims.argmax())
+            best_sim = float(sims[best])
+        else:
+            all_sims = [sum(a * b for a, b in zip(q, vec)) for vec, _ in entries]
+            best_sim = max(all_sims)
+            best = all_sims.index(best_sim)
+        if best_sim < self.semantic_threshold:
+            return None
+        best_key = entries[best][1]
+        hit = self._cache.get(best_key)
+        if hit is not None:
+            self.semantic_hits += 1
+        return hit
+
+    def put(self, key: Tuple, answer: CachedAnswer, qvec: Optional[List[float]] = None) -> None:
+        self._cache.set(key, answer)
+        if self.semantic and qvec is not None:
+            scope = key[:-1]
+            tenant, generation = scope[0], scope[1]
+            with self._lock:
+                if self._generations.get(tenant, generation) != generation:
+                    # Entries of other generations can never be hit again
+                    for stale in [s for s in self._scopes if s[0] == tenant and s[1] != generation]:
+                        del self._scopes[stale]
+                self._generations[tenant] = generation
+                entries = self._scopes.setdefault(scope, _Scope()).vectors
+                self._scopes.move_to_end(scope)
+                entries.append((_unit(qvec), key))
+                del entries[: -self.max_per_scope]
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+
+    def invalidate_tenant(self, tenant: str) -> None:
+        self._cache.discard_where(lambda k: k[0] == tenant)
+        with self._lock:
+            for scope in [s for s in self._scopes if s[0] == tenant]:
+                del self._scopes[scope]
+            self._generations.pop(tenant, None)
+
+    def stats(self) -> Dict[str, float]:
+        out = self._cache.stats()
+        out["semantic_threshold"] = self.semantic_threshold
+        out["semantic_hits"] = self.semantic_hits
+        return out
+
+
+def _unit(vec: List[float]) -> List[float]:
+    norm = math.sqrt(sum(float(v) * float(v) for v in vec)) or 1.0
+    return [float(v) / norm for v in vec]
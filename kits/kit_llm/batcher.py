@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+
+class QueryBatcher:
+    """Coalesces concurrent embed_query calls into one embed_texts call.
+
+    The first pending query opens a window of max_wait_ms; everything that
+    arrives meanwhile (up to max_batch) is encoded in a single forward pass
+    on a background thread and each caller gets its own vector back. Works
+    for blocking callers (embed_query) and coroutines (aembed_query).
+    """
+
+    def __init__(self, backend, max_wait_ms: float = 5.0, max_batch: int = 32):
+        self.backend = backend
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[str, Future, float]] = []
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            self._ensure_thread()
+            self._pending.append((text, fut, time.monotonic()))
+            self._cond.notify()
+        return fut
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        # Document batches are already batched; pass straight through
+        return self.backend.embed_texts(texts)
+
+    def _take_batch(self) -> List[Tuple[str, Future, float]]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._pending[0][2] + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[: self.max_batch]
+            del self._pending[: self.max_batch]
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            try:
+                vecs = self.backend.embed_texts([t for t, _, _ in batch])
+            except BaseException as e:  # deliver errors to every waiting caller
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            self.max_seen = max(self.max_seen, len(batch))
+            for (_, fut, _), vec in zip(batch, vecs):
+                fut.set_result(vec)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "queries": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_seen": self.max_seen,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+        }
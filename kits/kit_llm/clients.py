@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import httpx
+except Exception:  # pragma: no cover
+    httpx = None  # type: ignore
+
+try:
+    from openai import AsyncOpenAI
+except Exception:  # pragma: no cover
+    AsyncOpenAI = None  # type: ignore
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+@dataclass
+class HttpPoolConfig:
+    max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    max_keepalive: int = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+    keepalive_expiry_s: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY_S", "60"))
+    connect_timeout_s: float = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "10"))
+    # "auto": HTTP/2 when the h2 package is installed
+    http2: str = os.getenv("LLM_HTTP2", "auto")
+
+    def use_http2(self) -> bool:
+        if self.http2 == "auto":
+            return _h2_available()
+        return self.http2 in {"1", "true", "True"}
+
+
+class LLMClientPool:
+    """Long-lived, pooled HTTP clients for the chat backends.
+
+    httpx connection pools belong to the event loop they were opened on, so
+    clients are kept per loop: the API's single loop gets one set for its
+    lifetime, while code that spins up short-lived loops (tests, scripts)
+    transparently gets fresh ones.
+    """
+
+    def __init__(self, cfg: Optional[HttpPoolConfig] = None):
+        self.cfg = cfg or HttpPoolConfig()
+        self._lock = threading.Lock()
+        # id(loop) -> (loop, {name: client})
+        self._by_loop: Dict[int, Tuple[asyncio.AbstractEventLoop, Dict[str, Any]]] = {}
+        self.created = 0
+
+    def _clients(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Drop clients of loops that are gone; their sockets went with them
+            for key, (lp, _) in list(self._by_loop.items()):
+                if lp.is_closed():
+                    del self._by_loop[key]
+            entry = self._by_loop.get(id(loop))
+            if entry is None or entry[0] is not loop:
+                entry = (loop, {})
+                self._by_loop[id(loop)] = entry
+            return entry[1]
+
+    def _new_http(self) -> "httpx.AsyncClient":
+        if httpx is None:
+            raise RuntimeError("httpx not installed")
+        self.created += 1
+        return httpx.AsyncClient(
+            # Streams may legitimately idle for a long time between tokens
+            timeout=httpx.Timeout(None, connect=self.cfg.connect_timeout_s),
+            limits=httpx.Limits(
+                max_connections=self.cfg.max_connections,
+                max_keepalive_connections=self.cfg.max_keepalive,
+                keepalive_expiry=self.cfg.keepalive_expiry_s,
+            ),
+            http2=self.cfg.use_http2(),
+        )
+
+    def http(self) -> "httpx.AsyncClient":
+        """Shared httpx client for the running loop (Ollama and other plain HTTP backends)."""
+        clients = self._clients()
+        client = clients.get("http")
+        if client is None or client.is_closed:
+            client = clients["http"] = self._new_http()
+        return client
+
+    def openai(self):
+        """Shared AsyncOpenAI client for the running loop, on its own pooled httpx client."""
+        if AsyncOpenAI is None:
+            raise RuntimeError("openai package not installed")
+        clients = self._clients()
+        client = clients.get("openai")
+        if client is None or client.is_closed():
+            client = clients["openai"] = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL"),
+                http_client=self._new_http(),
+            )
+        return client
+
+    async def aclose(self) -> None:
+        """Close the clients of the running loop (call from the app's shutdown hook)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._by_loop.pop(id(loop), None)
+        if entry is None or entry[0] is not loop:
+            return
+        for client in entry[1].values():
+            if httpx is not None and isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                await client.close()  # AsyncOpenAI also closes its httpx client
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loops": len(self._by_loop),
+                "clients_created": self.created,
+                "http2": self.cfg.use_http2(),
+                "max_connections": self.cfg.max_connections,
+                "max_keepalive": self.cfg.max_keepalive,
+            }
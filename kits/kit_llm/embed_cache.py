@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+_whitespace_re = re.compile(r"\s+")
+
+
+def text_key(model: str, text: str) -> bytes:
+    # \s also matches non-breaking spaces: same normalization as ingestion
+    norm = _whitespace_re.sub(" ", text).strip()
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(norm.encode("utf-8"))
+    return h.digest()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache: SQLite table of float32 blobs keyed by sha256(model, text).
+
+    Safe to share between threads and processes (WAL mode). The connection
+    is opened on first use in each process: a SQLite connection must not be
+    carried across fork(), so a forked child (e.g. an RQ work horse) opens
+    its own. When the row count exceeds max_entries the least recently used
+    tenth is evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 500_000):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._inherited: List[sqlite3.Connection] = []
+        self._count = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _INSTANCES.add(self)
+
+    def _db(self) -> sqlite3.Connection:
+        """This process's connection (call with self._lock held)."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB NOT NULL, last_used INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _after_fork(self) -> None:
+        # Never used nor closed here: closing may checkpoint and delete the
+        # WAL the parent is still using, so it is only kept from being collected
+        if self._conn is not None:
+            self._inherited.append(self._conn)
+        self._conn = None
+        self._lock = threading.Lock()  # another thread may have held it at fork time
+
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[int, List[float]]:
+        """Return {position: vector} for the texts found in the cache."""
+        keys = [text_key(model, t) for t in texts]
+        found: Dict[bytes, List[float]] = {}
+        with self._lock:
+            db = self._db()
+            # SQLite caps bound parameters; 500 stays well under every default
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                q = "SELECT key, vec FROM embeddings WHERE key IN (%s)" % ",".join("?" * len(part))
+                for key, blob in db.execute(q, part):
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = int(time.time())
+                db.executemany("UPDATE embeddings SET last_used=? WHERE key=?", [(now, k) for k in found])
+            out = {i: found[k] for i, k in enumerate(keys) if k in found}
+            self.hits += len(out)
+            self.misses += len(keys) - len(out)
+        return out
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = int(time.time())
+        rows = [(text_key(model, t), array("f", v).tobytes(), now) for t, v in zip(texts, vectors)]
+        with self._lock:
+            db = self._db()
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO embeddings(key, vec, last_used) VALUES (?, ?, ?)", rows)
+            self._count += db.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        target = int(self.max_entries * 0.9)
+        n = self._count - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (n,)
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.evictions += n
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._db()
+            total = self.hits + self.misses
+            return {
+                "entries": self._count,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_INSTANCES: "weakref.WeakSet[EmbeddingCache]" = weakref.WeakSet()
+
+
+def _reset_after_fork() -> None:
+    for cache in list(_INSTANCES):
+        cache._after_fork()
+
+
+if hasattr(os, "register_at_fork"):  # not on Windows, which cannot fork anyway
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger("kit_llm")
+
+PROMPT_HEAD = (
+    "You are a helpful assistant. Answer the user based only on the sources.\n"
+    "If unsure, say you don't know.\n\n"
+    "Question: {question}\n\n"
+    "Sources:\n"
+)
+PROMPT_TAIL = "\n\nAnswer in the language of the question."
+SOURCE_SEP = "\n\n"
+
+
+@dataclass
+class PromptConfig:
+    # Model context window (prompt + answer) in tokens
+    context_tokens: int = int(os.getenv("LLM_CONTEXT_TOKENS", "4096"))
+    # At most this share of the window is reserved for the answer, whatever LLM_MAX_TOKENS says
+    answer_max_fraction: float = float(os.getenv("PROMPT_ANSWER_MAX_FRACTION", "0.5"))
+    # Optional hard cap on tokens spent on sources; 0 = whatever the window leaves
+    sources_max_tokens: int = int(os.getenv("PROMPT_SOURCES_MAX_TOKENS", "0"))
+    # tiktoken encoding name, or a Hugging Face tokenizer repo ("org/name")
+    tokenizer: str = os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+    # Headroom for tokenizer mismatch with the serving model and chat templates
+    safety_tokens: int = int(os.getenv("PROMPT_SAFETY_TOKENS", "64"))
+    # A trimmed source shorter than this is dropped instead
+    min_source_tokens: int = int(os.getenv("PROMPT_MIN_SOURCE_TOKENS", "32"))
+
+
+class Tokenizer:
+    """Token counting/truncation with tiktoken or a Hugging Face tokenizer.
+
+    If neither can be loaded, falls back to ~4 characters per token, which
+    is close for English and conservative enough with the safety margin.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._encode = None
+        self._decode = None
+        try:
+            if "/" in name:
+                from transformers import AutoTokenizer
+
+                tok = AutoTokenizer.from_pretrained(name)
+                self._encode = lambda t: tok.encode(t, add_special_tokens=False)
+                self._decode = tok.decode
+            else:
+                import tiktoken
+
+                enc = tiktoken.get_encoding(name)
+                self._encode = enc.encode
+                self._decode = enc.decode
+        except Exception as e:
+            logger.warning("Tokenizer %s unavailable (%s); estimating 4 chars per token", name, e)
+
+    @property
+    def exact(self) -> bool:
+        return self._encode is not None
+
+    def count(self, text: str) -> int:
+        if self._encode is None:
+            return math.ceil(len(text) / 4)
+        return len(self._encode(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self._encode is None:
+            return text[: max_tokens * 4]
+        ids = self._encode(text)
+        return text if len(ids) <= max_tokens else self._decode(ids[:max_tokens])
+
+
+_TOKENIZERS: Dict[str, Tokenizer] = {}
+_TOKENIZERS_LOCK = threading.Lock()
+
+
+def get_tokenizer(name: Optional[str] = None) -> Tokenizer:
+    name = name or PromptConfig().tokenizer
+    with _TOKENIZERS_LOCK:
+        tok = _TOKENIZERS.get(name)
+        if tok is None:
+            tok = _TOKENIZERS[name] = Tokenizer(name)
+    return tok
+
+
+def answer_reservation(answer_tokens: int, cfg: Optional[PromptConfig] = None) -> int:
+    """Tokens of the window kept free for the answer: answer_tokens, capped at answer_max_fraction."""
+    cfg = cfg or PromptConfig()
+    return max(0, min(answer_tokens, int(cfg.context_tokens * cfg.answer_max_fraction)))
+
+
+@dataclass
+class PromptSource:
+    snippet: str
+    text: Optional[str] = None  # full chunk; replaces the snippet when the budget allows
+
+
+@dataclass
+class BuiltPrompt:
+    prompt: str
+    tokens: int
+    budget: int
+    answer_tokens: int  # reserved for the answer
+    # Per source, in input order: "full", "snippet", "trimmed" or "dropped"
+    used: List[str]
+
+    def info(self) -> dict:
+        return {"prompt_tokens": self.tokens, "sources_budget": self.budget, "answer_tokens": self.answer_tokens, "sources": self.used}
+
+
+def build_prompt(
+    question: str,
+    sources: Sequence[PromptSource],
+    answer_tokens: int,
+    cfg: Optional[PromptConfig] = None,
+    tokenizer: Optional[Tokenizer] = None,
+) -> BuiltPrompt:
+    """Pack best-first sources into the prompt under the model's token budget.
+
+    The budget is the context window minus the answer reservation (see
+    answer_reservation), the fixed template and a safety margin. Every source
+    first gets its snippet, in rank order, trimming the last one that only
+    partly fits; then snippets are upgraded to the full chunk, again in rank
+    order, where the extra tokens still fit. The top source is always kept,
+    trimmed if need be, even when the budget is exhausted.
+    """
+    cfg = cfg or PromptConfig()
+    tok = tokenizer or get_tokenizer(cfg.tokenizer)
+    head = PROMPT_HEAD.format(question=question)
+    fixed = tok.count(head) + tok.count(PROMPT_TAIL)
+    reserved = answer_reservation(answer_tokens, cfg)
+    budget = cfg.context_tokens - reserved - fixed - cfg.safety_tokens
+    if cfg.sources_max_tokens > 0:
+        budget = min(budget, cfg.sources_max_tokens)
+    budget = max(0, budget)
+
+    overhead = [tok.count(f"Source {i + 1}: {SOURCE_SEP}") for i in range(len(sources))]
+    texts: List[str] = [""] * len(sources)
+    costs: List[int] = [0] * len(sources)
+    used = ["dropped"] * len(sources)
+    remaining = budget
+    for i, src in enumerate(sources):
+        room = remaining - overhead[i]
+        if room < cfg.min_source_tokens:
+            if i > 0:
+                break
+            # Never answer from no sources at all: keep a trimmed top source
+            logger.warning("Prompt budget exhausted (%d tokens for sources); keeping only a trimmed top source", budget)
+            room = cfg.min_source_tokens
+        n = tok.count(src.snippet)
+        if n <= room:
+            texts[i], costs[i], used[i] = src.snippet, n, "snippet"
+        else:
+            texts[i] = tok.truncate(src.snippet, room)
+            costs[i], used[i] = tok.count(texts[i]), "trimmed"
+        remaining -= costs[i] + overhead[i]
+    for i, src in enumerate(sources):
+        if used[i] != "snippet" or not src.text or src.text == src.snippet:
+            continue
+        n = tok.count(src.text)
+        if n - costs[i] <= remaining:
+            remaining -= n - costs[i]
+            texts[i], costs[i], used[i] = src.text, n, "full"
+
+    # Sources are only ever dropped from the tail, so numbering stays contiguous
+    ctx = SOURCE_SEP.join(f"Source {i + 1}: {t}" for i, t in enumerate(texts) if used[i] != "dropped")
+    prompt = head + ctx + PROMPT_TAIL
+    return BuiltPrompt(prompt=prompt, tokens=tok.count(prompt), budget=budget, answer_tokens=reserved, used=used)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+
+@dataclass
+class RerankConfig:
+    model: str = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    # Candidates fetched from the retriever and offered to the cross-encoder
+    candidates: int = int(os.getenv("RERANK_CANDIDATES", "20"))
+    batch_size: int = int(os.getenv("RERANK_BATCH_SIZE", "8"))
+    # Time allowed for the rerank stage of one query; 0 = unbounded
+    budget_ms: float = float(os.getenv("RERANK_BUDGET_MS", "150"))
+    max_length: int = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+
+
+@dataclass
+class RerankResult:
+    order: List[int]  # candidate indices, best first; unscored ones keep retriever order at the end
+    scores: Dict[int, float] = field(default_factory=dict)
+    scored: int = 0
+    skipped: Optional[str] = None  # reason the stage was skipped entirely
+    truncated: bool = False
+    elapsed_ms: float = 0.0
+
+    def info(self) -> dict:
+        return {
+            "scored": self.scored,
+            "candidates": len(self.order),
+            "truncated": self.truncated,
+            "skipped": self.skipped,
+            "elapsed_ms": round(self.elapsed_ms, 2),
+        }
+
+
+class CrossEncoderReranker:
+    """Scores (query, passage) pairs with a sentence-transformers CrossEncoder on CPU.
+
+    Candidates are scored in batches in retriever order. A running estimate
+    of the cost per pair decides before each batch whether it still fits the
+    time budget; if not, the remaining candidates keep their retriever order
+    behind the scored ones. The model loads in the background on first use,
+    and queries arriving meanwhile skip reranking instead of waiting for it.
+    """
+
+    def __init__(self, cfg: Optional[RerankConfig] = None):
+        self.cfg = cfg or RerankConfig()
+        self._model = None
+        self._lock = threading.Lock()
+        self._loading: Optional[threading.Thread] = None
+        self.load_error: Optional[str] = None
+        self._ms_per_pair: Optional[float] = None
+        self.skips = 0
+        self.truncations = 0
+
+    def load(self) -> None:
+        """Load the model in this thread (startup warm-up)."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.cfg.model, max_length=self.cfg.max_length, device="cpu")
+
+    def _load_in_background(self) -> None:
+        def _run() -> None:
+            try:
+                self.load()
+            except Exception as e:  # e.g. sentence-transformers not installed
+                self.load_error = str(e)
+
+        with self._lock:
+            if self._loading is None:
+                self._loading = threading.Thread(target=_run, name="reranker-load", daemon=True)
+                self._loading.start()
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        self.load()
+        scores = self._model.predict([(query, t) for t in texts], batch_size=len(texts) or 1, show_progress_bar=False)
+        return [float(s) for s in scores]
+
+    def rerank(self, query: str, texts: Sequence[str], budget_ms: Optional[float] = None) -> RerankResult:
+        budget = self.cfg.budget_ms if budget_ms is None else budget_ms
+        n = len(texts)
+        res = RerankResult(order=list(range(n)))
+        if self._model is None:
+            self._load_in_background()
+            res.skipped = "unavailable" if self.load_error else "model_loading"
+            self.skips += 1
+            return res
+        t0 = time.perf_counter()
+        step = max(1, self.cfg.batch_size)
+        for start in range(0, n, step):
+            batch = texts[start : start + step]
+            elapsed = (time.perf_counter() - t0) * 1000
+            if budget and self._ms_per_pair is not None and elapsed + self._ms_per_pair * len(batch) > budget:
+                res.truncated = True
+                break
+            bt = time.perf_counter()
+            for i, s in enumerate(self.score(query, batch)):
+                res.scores[start + i] = s
+            per_pair = (time.perf_counter() - bt) * 1000 / len(batch)
+            # Smoothed so one slow batch (GC, noisy neighbour) doesn't disable reranking
+            self._ms_per_pair = per_pair if self._ms_per_pair is None else 0.8 * self._ms_per_pair + 0.2 * per_pair
+        res.elapsed_ms = (time.perf_counter() - t0) * 1000
+        res.scored = len(res.scores)
+        if not res.scored:
+            res.skipped = "over_budget"
+            self.skips += 1
+            return res
+        if res.truncated:
+            self.truncations += 1
+        scored = sorted(res.scores, key=lambda i: res.scores[i], reverse=True)
+        res.order = scored + [i for i in range(n) if i not in res.scores]
+        return res
+
+    def stats(self) -> dict:
+        return {
+            "model": self.cfg.model,
+            "loaded": self._model is not None,
+            "load_error": self.load_error,
+            "ms_per_pair": round(self._ms_per_pair, 3) if self._ms_per_pair is not None else None,
+            "skips": self.skips,
+            "truncations": self.truncations,
+        }
+
+
+_RERANKERS: Dict[str, CrossEncoderReranker] = {}
+_RERANKERS_LOCK = threading.Lock()
+
+
+def get_reranker(cfg: Optional[RerankConfig] = None) -> CrossEncoderReranker:
+    """Return the shared reranker for cfg's model, creating it lazily."""
+    cfg = cfg or RerankConfig()
+    with _RERANKERS_LOCK:
+        rr = _RERANKERS.get(cfg.model)
+        if rr is None:
+            rr = _RERANKERS[cfg.model] = CrossEncoderReranker(cfg)
+    return rr
@@ -0,0 +1,141 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+
+from kits.kit_index import (
+    AnnConfig,
+    build_index,
+    compact_documents,
+    delete_documents,
+    index_kind,
+    needs_rebuild,
+    rebuild_index,
+    resolve_kind,
+)
+
+
+def _cfg(**kw):
+    base = dict(kind="auto", auto_kind="ivf", auto_threshold=2000, min_train=1000, nlist=0)
+    base.update(kw)
+    return AnnConfig(**base)
+
+
+def test_resolve_kind_thresholds_and_overrides():
+    cfg = _cfg()
+    assert resolve_kind(cfg, 100) == "flat"
+    assert resolve_kind(cfg, 5000) == "ivf"
+    assert resolve_kind(cfg, 100, override="hnsw") == "hnsw"
+    # IVF kinds cannot be trained on tiny corpora
+    assert resolve_kind(cfg, 500, override="ivfpq") == "flat"
+    with pytest.raises(ValueError):
+        resolve_kind(cfg, 10, override="bogus")
+
+
+def test_flat_index_is_retrained_once_corpus_crosses_threshold():
+    cfg = _cfg()
+    rng = np.random.default_rng(0)
+    x = rng.random((3000, 16), dtype="float32")
+    flat = faiss.IndexFlatL2(16)
+    flat.add(x)
+    kind = needs_rebuild(flat, cfg)
+    assert kind == "ivf"
+    ivf = rebuild_index(flat, kind, cfg)
+    assert index_kind(ivf) == "ivf" and ivf.ntotal == 3000
+    assert needs_rebuild(ivf, cfg) is None
+    # Positions are preserved, so docstore mappings stay valid
+    _, ids = ivf.search(x[42:43], 1)
+    assert ids[0][0] == 42
+
+
+@pytest.mark.parametrize("kind", ["ivf", "ivfpq", "ivfsq"])
+def test_ivf_variants_round_trip_and_are_stable(kind, tmp_path):
+    cfg = _cfg(auto_kind=kind, pq_m=2)
+    rng = np.random.default_rng(3)
+    x = rng.random((3000, 16), dtype="float32")
+    index = build_index(kind, x, cfg)
+    assert index_kind(index) == kind
+    path = str(tmp_path / "index.faiss")
+    faiss.write_index(index, path)
+    loaded = faiss.read_index(path)
+    assert index_kind(loaded) == kind
+    # Saving an unchanged index must not trigger a rebuild
+    assert needs_rebuild(loaded, cfg) is None
+
+
+@pytest.mark.parametrize("kind", ["hnsw", "ivf", "ivfpq", "ivfsq"])
+def test_delete_documents_keeps_mapping_dense(kind):
+    from types import SimpleNamespace
+
+    cfg = _cfg(auto_threshold=10**9, pq_m=2)
+    rng = np.random.default_rng(1)
+    x = rng.random((1500, 8), dtype="float32")
+    deleted = []
+    vs = SimpleNamespace(
+        index=build_index(kind, x, cfg),
+        index_to_docstore_id={i: f"c{i}" for i in range(1500)},
+        docstore=SimpleNamespace(delete=deleted.extend),
+    )
+    assert delete_documents(vs, ["c0", "c10", "missing"], cfg) == 2
+    assert sorted(deleted) == ["c0", "c10"]
+    assert vs.index.ntotal == 1498 and len(vs.index_to_docstore_id) == 1498
+    assert index_kind(vs.index) == kind
+    assert vs.index_to_docstore_id[0] == "c1" and vs.index_to_docstore_id[9] == "c11"
+    _, ids = vs.index.search(x[11:12], 1)
+    assert vs.index_to_docstore_id[int(ids[0][0])] == "c11"
+
+
+@pytest.mark.parametrize("kind", ["hnsw", "ivf"])
+def test_tombstoned_deletes_keep_positions_until_compaction(kind):
+    from types import SimpleNamespace
+
+    cfg = _cfg(auto_threshold=10**9)
+    rng = np.random.default_rng(2)
+    x = rng.random((1500, 8), dtype="float32")
+    deleted = []
+    vs = SimpleNamespace(
+        index=build_index(kind, x, cfg),
+        index_to_docstore_id={i: f"c{i}" for i in range(1500)},
+        docstore=SimpleNamespace(delete=deleted.extend),
+    )
+    tombstones = set()
+    assert delete_documents(vs, ["c0", "c10"], cfg, tombstones) == 2
+    # No rebuild: vectors stay at their positions, only the docstore entries go
+    assert tombstones == {0, 10} and vs.index.ntotal == 1500 and sorted(deleted) == ["c0", "c10"]
+    assert delete_documents(vs, ["c10"], cfg, tombstones) == 0
+    assert compact_documents(vs, tombstones, cfg) == 2
+    assert tombstones == set() and index_kind(vs.index) == kind
+    assert vs.index.ntotal == 1498 and vs.index_to_docstore_id[9] == "c11"
+    _, ids = vs.index.search(x[11:12], 1)
+    assert vs.index_to_docstore_id[int(ids[0][0])] == "c11"
+
+
+def test_mmr_select_skips_near_duplicates():
+    from kits.kit_index import mmr_select
+
+    vectors = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0], [0.0, 0.0]], dtype="float32")
+    # Plain top-2 by relevance would be rows 0 and 1 (near duplicates)
+    assert mmr_select(vectors, [0.9, 0.89, 0.5, 0.1], 2, lambda_=0.5) == [0, 2]
+    assert mmr_select(vectors, [0.9, 0.89, 0.5, 0.1], 2, lambda_=1.0) == [0, 1]
+    assert mmr_select(vectors[:1], [1.0], 5) == [0]
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf"])
+def test_filtered_search_returns_only_allowed_positions(kind):
+    from kits.kit_index import filtered_search
+
+    cfg = _cfg(nlist=16, nprobe=4)
+    rng = np.random.default_rng(0)
+    x = rng.random((2000, 16), dtype="float32")
+    index = build_index(kind, x, cfg)
+    q = x[7:8]
+    mask = np.zeros(2000, dtype=bool)
+    mask[1::2] = True  # large set: bitmap selector through the index
+    _, ids = filtered_search(index, q, 5, mask, exact_max=100)
+    assert (ids[0] % 2 == 1).all() and (ids[0] >= 0).all()
+    mask[:] = False
+    mask[[3, 500, 1999]] = True  # small set: scored exactly, never comes back short
+    dists, ids = filtered_search(index, q, 5, mask, exact_max=100)
+    assert sorted(ids[0][:3]) == [3, 500, 1999] and list(ids[0][3:]) == [-1, -1]
+    expected = ((x[[3, 500, 1999]] - q) ** 2).sum(1)
+    assert np.allclose(sorted(dists[0][:3]), sorted(expected), rtol=1e-4)
@@ -81,6 +81,40 @@ def test_index_validation_errors(tmp_path):
     assert r2.status_code == 413
 
 
+def test_index_streams_uploads_to_disk_with_hashes(monkeypatch):
+    import hashlib
+
+    from apps.api import main as api_main
+
+    enqueued = []
+
+    class _Queue:
+        def enqueue(self, func, *args):
+            enqueued.append(args)
+            return type("Job", (), {"id": "job-1"})()
+
+    monkeypatch.setattr(api_main, "get_queue", lambda: _Queue(), raising=True)
+    monkeypatch.setenv("UPLOAD_CHUNK_KB", "1")
+    monkeypatch.setenv("MAX_FILE_MB", "1")
+    client = TestClient(app)
+    tenant = "tenant-upload"
+    body = b"0123456789" * 500
+    r = client.post("/index", headers={"X-Tenant-ID": tenant}, files=[("files", ("a.txt", body))])
+    assert r.status_code == 202
+    info = r.json()["files"][0]
+    assert info["size_bytes"] == len(body) and info["sha256"] == hashlib.sha256(body).hexdigest()
+    up_dir = api_main.UPLOADS_DIR / tenant
+    assert (up_dir / "a.txt").read_bytes() == body
+    assert enqueued == [(tenant, [str(up_dir / "a.txt")], [info["sha256"]])]
+
+    # An oversize file rejects the whole request and leaves earlier uploads untouched
+    big = b"x" * (1024 * 1024 + 1)
+    r = client.post("/index", headers={"X-Tenant-ID": tenant}, files=[("files", ("a.txt", b"new")), ("files", ("b.txt", big))])
+    assert r.status_code == 413
+    assert sorted(p.name for p in up_dir.iterdir()) == ["a.txt"] and (up_dir / "a.txt").read_bytes() == body
+    assert len(enqueued) == 1
+
+
 def test_answer_and_stream_with_fake_index(monkeypatch, tmp_path):
     tenant = "test-tenant"
     # Create small FAISS index
@@ -167,3 +201,436 @@ def test_reset_deletes_index(monkeypatch, tmp_path):
     # Now answer should 404
     r3 = client.post("/answer", headers={"X-Tenant-ID": tenant}, json={"question": "hello?"})
     assert r3.status_code == 404
+
+
+def test_search_reuses_cached_vectorstore_until_index_changes(monkeypatch):
+    import os
+
+    tenant = "tenant-cache"
+    make_index(tenant, ["alpha text", "beta text"], [{"source": "a.txt", "page": 1, "id": "a"}, {"source": "b.txt", "page": 1, "id": "b"}])
+    from apps.api import main as api_main
+
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    api_main.VS_CACHE.invalidate(tenant)
+    client = TestClient(app)
+
+    before = api_main.VS_CACHE.stats()
+    assert client.get("/search", params={"tenant": tenant, "q": "alpha"}).status_code == 200
+    assert client.get("/search", params={"tenant": tenant, "q": "beta"}).status_code == 200
+    mid = api_main.VS_CACHE.stats()
+    assert mid["misses"] == before["misses"] + 1
+    assert mid["hits"] == before["hits"] + 1
+
+    # Worker rewrites the index -> next request reloads it
+    make_index(tenant, ["gamma text"], [{"source": "c.txt", "page": 1, "id": "c"}])
+    faiss_file = index_path(tenant) / "index.faiss"
+    st = faiss_file.stat()
+    os.utime(faiss_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    r = client.get("/search", params={"tenant": tenant, "q": "gamma"})
+    assert r.status_code == 200
+    assert [x["filename"] for x in r.json()["results"]] == ["c.txt"]
+    assert api_main.VS_CACHE.stats()["reloads"] == mid["reloads"] + 1
+    assert "vectorstore_cache" in client.get("/stats").json()
+
+
+def test_answer_cache_replays_until_index_changes(monkeypatch):
+    import os
+
+    tenant = "tenant-answer-cache"
+    make_index(tenant, ["cached answer source"], [{"source": "a.txt", "page": 1, "id": "a"}])
+    from apps.api import main as api_main
+
+    calls = []
+
+    async def _fake_chat_stream(prompt, cfg=None):
+        calls.append(prompt)
+        for t in ["cached", " ", "answer"]:
+            yield t
+
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    monkeypatch.setattr(api_main, "chat_stream", _fake_chat_stream, raising=True)
+    client = TestClient(app)
+    headers = {"X-Tenant-ID": tenant}
+
+    r1 = client.post("/answer", headers=headers, json={"question": "What is cached?"})
+    # Normalized question (case, whitespace, trailing "?") hits the cache
+    r2 = client.post("/answer", headers=headers, json={"question": "  what is   CACHED "})
+    assert r1.json() == r2.json()
+    assert len(calls) == 1
+
+    # Cached answer replays as the usual SSE sequence. sse_starlette keeps a
+    # process-global exit event bound to the first loop that streamed.
+    from sse_starlette.sse import AppStatus
+
+    AppStatus.should_exit_event = None
+    with client.stream("POST", "/answer/stream", headers={**headers, "Accept": "text/event-stream"}, json={"question": "what is cached"}) as r:
+        buf = "".join(r.iter_text())
+    assert "event: context" in buf and buf.count("event: token") == 3 and '"cached": true' in buf
+    assert len(calls) == 1
+
+    # A rewritten index is a new generation -> answer regenerated
+    faiss_file = index_path(tenant) / "index.faiss"
+    st = faiss_file.stat()
+    os.utime(faiss_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    client.post("/answer", headers=headers, json={"question": "What is cached?"})
+    assert len(calls) == 2
+
+
+def test_semantic_answer_cache_reuses_similar_question():
+    from kits.kit_llm import AnswerCache, CachedAnswer
+
+    cache = AnswerCache(semantic_threshold=0.95)
+    scope = cache.scope("t", 1, 5, "m")
+    cache.put(cache.key(scope, "how to reset password"), CachedAnswer(tokens=["do X"], sources=[]), [1.0, 0.0, 0.1])
+    assert cache.get_semantic(scope, [0.99, 0.0, 0.12]).answer == "do X"
+    assert cache.get_semantic(scope, [0.0, 1.0, 0.0]) is None
+    assert cache.get_semantic(cache.scope("t", 2, 5, "m"), [1.0, 0.0, 0.1]) is None
+
+
+def test_semantic_answer_cache_scopes_are_bounded():
+    from kits.kit_llm import AnswerCache, CachedAnswer
+
+    cache = AnswerCache(semantic_threshold=0.95, max_scopes=3)
+    answer = CachedAnswer(tokens=["x"], sources=[])
+    for k in (1, 2):
+        cache.put(cache.key(cache.scope("t", 1, k, "m"), "q"), answer, [1.0, 0.0])
+    cache.put(cache.key(cache.scope("u", 1, 5, "m"), "q"), answer, [1.0, 0.0])
+    # A new generation of "t" retires the scopes of the old one
+    cache.put(cache.key(cache.scope("t", 2, 5, "m"), "q"), answer, [1.0, 0.0])
+    assert sorted(cache._scopes) == [("t", 2, 5, "m", "dense"), ("u", 1, 5, "m", "dense")]
+    for k in range(10):
+        cache.put(cache.key(cache.scope("u", 1, k, "m"), "q"), answer, [1.0, 0.0])
+    assert len(cache._scopes) == 3 and ("u", 1, 9, "m", "dense") in cache._scopes
+
+
+def test_semantic_answer_cache_lookup_maps_full_pool_to_503(monkeypatch):
+    from apps.api import main as api_main
+    from kits.kit_common import QueueFullError
+    from kits.kit_llm import AnswerCache
+
+    tenant = "tenant-answer-overloaded"
+    make_index(tenant, ["alpha text"], [{"source": "a.txt", "page": 1, "id": "a"}])
+
+    async def _no_embed(question):
+        return None
+
+    async def _full(*args):
+        raise QueueFullError("full")
+
+    monkeypatch.setattr(api_main, "ANSWER_CACHE", AnswerCache(semantic_threshold=0.9), raising=True)
+    monkeypatch.setattr(api_main, "_embed_query_async", _no_embed, raising=True)
+    monkeypatch.setattr(api_main.RETRIEVAL_POOL, "run", _full, raising=True)
+    r = TestClient(app).post("/answer", headers={"X-Tenant-ID": tenant}, json={"question": "alpha?"})
+    assert r.status_code == 503 and r.json()["detail"]["error"]["type"] == "overloaded"
+
+
+def test_search_results_cached_per_index_generation(monkeypatch):
+    import os
+
+    tenant = "tenant-retrieval-cache"
+    make_index(tenant, ["alpha text"], [{"source": "a.txt", "page": 1, "id": "a"}])
+    from apps.api import main as api_main
+
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    calls = []
+    real_search = api_main._search
+
+    def _counting_search(*args):
+        calls.append(args[1])
+        return real_search(*args)
+
+    monkeypatch.setattr(api_main, "_search", _counting_search, raising=True)
+    client = TestClient(app)
+
+    r1 = client.get("/search", params={"tenant": tenant, "q": "alpha"})
+    r2 = client.get("/search", params={"tenant": tenant, "q": " alpha  "})
+    assert r1.json() == r2.json()
+    assert calls == ["alpha"]
+    client.get("/search", params={"tenant": tenant, "q": "alpha", "k": 1})
+    assert len(calls) == 2
+
+    # New index generation -> fresh results
+    make_index(tenant, ["beta text"], [{"source": "b.txt", "page": 1, "id": "b"}])
+    faiss_file = index_path(tenant) / "index.faiss"
+    st = faiss_file.stat()
+    os.utime(faiss_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    r3 = client.get("/search", params={"tenant": tenant, "q": "alpha"})
+    assert [x["filename"] for x in r3.json()["results"]] == ["b.txt"]
+    assert len(calls) == 3
+    assert "retrieval_cache" in client.get("/stats").json()
+
+
+def test_hybrid_search_finds_exact_identifier(monkeypatch):
+    from kits.kit_index import BM25Index
+
+    tenant = "tenant-hybrid"
+    texts = [f"filler paragraph number {i} about nothing" for i in range(20)] + ["reset code ZX-4471 unlocks the device"]
+    metas = [{"source": f"f{i}.txt", "page": 1, "id": f"id{i}"} for i in range(len(texts))]
+    make_index(tenant, texts, metas)
+    from apps.api import main as api_main
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import FakeEmbeddings
+
+    # Sparse index keyed by docstore ids, as the worker writes it
+    vs = FAISS.load_local(str(index_path(tenant)), FakeEmbeddings(size=8), allow_dangerous_deserialization=True)
+    bm25 = BM25Index()
+    for cid in vs.index_to_docstore_id.values():
+        bm25.add(cid, vs.docstore.search(cid).page_content)
+    bm25.save(index_path(tenant))
+
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    client = TestClient(app)
+    params = {"tenant": tenant, "q": "ZX-4471", "k": 2}
+    dense = client.get("/search", params=params).json()["results"]
+    hybrid = client.get("/search", params={**params, "mode": "hybrid"}).json()["results"]
+    assert "f20.txt" not in [r["filename"] for r in dense]
+    assert hybrid[0]["filename"] == "f20.txt" and 0 < hybrid[0]["score"] <= 1
+    assert client.get("/search", params={**params, "mode": "bogus"}).status_code == 422
+
+
+def test_search_rerank_with_debug_timings(monkeypatch):
+    import kits.kit_llm.rerank as rerank_mod
+
+    tenant = "tenant-rerank"
+    texts = [f"filler {i}" for i in range(10)] + ["the answer is here: answer answer"]
+    make_index(tenant, texts, [{"source": f"f{i}.txt", "page": 1, "id": f"id{i}"} for i in range(len(texts))])
+    from apps.api import main as api_main
+
+    class _Model:
+        def predict(self, pairs, batch_size=32, show_progress_bar=False):
+            return [t.count("answer") / 10 for _, t in pairs]
+
+    rr = rerank_mod.CrossEncoderReranker(rerank_mod.RerankConfig(model="stub", candidates=20, budget_ms=0))
+    rr._model = _Model()
+    monkeypatch.setattr(api_main, "get_reranker", lambda: rr, raising=True)
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    monkeypatch.setenv("RERANK_CANDIDATES", "20")
+    client = TestClient(app)
+
+    r = client.get("/search", params={"tenant": tenant, "q": "answer", "k": 2, "rerank": "true", "debug": "true"})
+    body = r.json()
+    assert body["results"][0]["filename"] == "f10.txt"
+    assert body["results"][0]["score"] == pytest.approx(0.3)
+    dbg = body["debug"]
+    assert {"retrieve", "rerank", "total"} <= set(dbg["timings_ms"]) and dbg["rerank"]["scored"] == 11
+    assert "debug" not in client.get("/search", params={"tenant": tenant, "q": "answer"}).json()
+
+
+def test_search_mmr_and_adjacent_merge(monkeypatch):
+    from kits.kit_chunker import split_text
+
+    tenant = "tenant-mmr"
+    text = " ".join(f"w{i}" for i in range(40))
+    parts = split_text(text, max_tokens=16, overlap=4)
+    texts = parts + ["unrelated other page"]
+    metas = [{"source": "a.txt", "page": 0, "id": f"a{i}", "chunk": i} for i in range(len(parts))]
+    metas.append({"source": "b.txt", "page": 0, "id": "b0", "chunk": 0})
+    make_index(tenant, texts, metas)
+    from apps.api import main as api_main
+
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    client = TestClient(app)
+    params = {"tenant": tenant, "q": "w1", "k": 4}
+
+    merged = client.get("/search", params={**params, "merge_adjacent": "true", "debug": "true"}).json()
+    a_hits = [r for r in merged["results"] if r["filename"] == "a.txt"]
+    # All neighbouring a.txt chunks fold into one source whose text has no duplicated overlap
+    assert len(a_hits) == 1 and merged["debug"]["merged_chunks"] == len(parts) - 1
+    assert len(merged["results"]) == 2
+
+    # MMR works on stored vectors and returns k distinct picks
+    picked = client.get("/search", params={**params, "k": 2, "mmr": "true", "debug": "true"}).json()
+    assert len(picked["results"]) == 2 and len(set(r["id"] for r in picked["results"])) == 2
+    assert "mmr" in picked["debug"]["timings_ms"]
+
+
+def test_merge_adjacent_joins_text_in_chunk_order():
+    from langchain_community.docstore.document import Document
+
+    from apps.api.main import _Candidate, _merge_adjacent
+
+    def c(i, score, src="a.txt"):
+        words = [f"w{j}" for j in range(i * 3, i * 3 + 5)]  # 2-token overlap between neighbours
+        return _Candidate(Document(page_content=" ".join(words), metadata={"source": src, "page": 1, "chunk": i, "id": f"{src}{i}"}), score, [i])
+
+    # 2 and 0 arrive first, then 1 bridges them; 5 is not adjacent
+    out = _merge_adjacent([c(2, 0.9), c(0, 0.8), c(5, 0.7), c(1, 0.6), c(1, 0.5, src="b.txt")])
+    assert [x.doc.metadata.get("chunks") for x in out] == [[0, 1, 2], None, None]
+    assert out[0].doc.page_content == " ".join(f"w{j}" for j in range(11))
+    assert out[0].score == 0.9 and out[0].doc.metadata["id"] == "a.txt2" and out[0].positions == [0, 1, 2]
+
+
+# (LLM_MAX_TOKENS, LLM_CONTEXT_TOKENS): test defaults, shipped .env/compose, shipped max_tokens with the default window
+@pytest.mark.parametrize("max_tokens,context_tokens", [(None, None), (4096, 8192), (4096, 4096)])
+def test_answer_prompt_uses_full_chunk_within_token_budget(monkeypatch, max_tokens, context_tokens):
+    tenant = "tenant-prompt-budget"
+    long_text = "budget " + " ".join(f"word{i}" for i in range(300))
+    make_index(tenant, [long_text], [{"source": "a.txt", "page": 1, "id": "a"}])
+    from apps.api import main as api_main
+    from kits.kit_llm import ChatConfig, PromptConfig
+    from kits.kit_llm import prompt as prompt_mod
+
+    if max_tokens is not None:
+        monkeypatch.setattr(api_main, "ChatConfig", lambda: ChatConfig(max_tokens=max_tokens))
+        monkeypatch.setattr(prompt_mod, "PromptConfig", lambda: PromptConfig(context_tokens=context_tokens))
+
+    prompts = []
+
+    async def _fake_chat_stream(prompt, cfg=None):
+        prompts.append(prompt)
+        yield "ok"
+
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    monkeypatch.setattr(api_main, "chat_stream", _fake_chat_stream, raising=True)
+    client = TestClient(app)
+    r = client.post("/answer", headers={"X-Tenant-ID": tenant}, json={"question": "budget?", "debug": True})
+    assert r.status_code == 200
+    body = r.json()
+    # Snippet is ~400 chars, but the whole chunk fits the default window
+    assert "word299" in prompts[0]
+    assert body["debug"]["prompt"]["sources"] == ["full"]
+    assert "text" not in body["sources"][0]
+
+
+def test_search_metadata_filters(monkeypatch):
+    from kits.kit_index import BM25Index, TenantManifest
+
+    tenant = "tenant-filters"
+    texts = [f"shared topic paragraph {i}" for i in range(30)]
+    metas = [{"source": f"/uploads/{tenant}/doc{i % 3}.pdf", "page": i // 3, "id": f"id{i}"} for i in range(len(texts))]
+    make_index(tenant, texts, metas)
+    from apps.api import main as api_main
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import FakeEmbeddings
+
+    vs = FAISS.load_local(str(index_path(tenant)), FakeEmbeddings(size=8), allow_dangerous_deserialization=True)
+    bm25 = BM25Index()
+    for cid in vs.index_to_docstore_id.values():
+        bm25.add(cid, vs.docstore.search(cid).page_content)
+    bm25.save(index_path(tenant))
+    manifest = TenantManifest.load(index_path(tenant))
+    for i, ts in enumerate([1_700_000_000, 1_710_000_000]):  # doc2.pdf has no recorded upload time
+        manifest.set_file(f"doc{i}.pdf", "", [], uploaded_at=ts)
+    manifest.save()
+
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    client = TestClient(app)
+    base = {"tenant": tenant, "q": "shared topic", "k": 5}
+    for mode in ("dense", "hybrid"):
+        res = client.get("/search", params={**base, "mode": mode, "filename": "doc1.pdf", "page_from": 2, "page_to": 4}).json()["results"]
+        # Top-k is filled from the allowed chunks only
+        assert len(res) == 3
+        assert {r["filename"].rsplit("/", 1)[-1] for r in res} == {"doc1.pdf"} and all(2 <= r["page"] <= 4 for r in res)
+    res = client.get("/search", params={**base, "k": 20, "filename": ["doc0.pdf", "doc2.pdf"], "debug": True}).json()
+    assert len(res["results"]) == 20 and res["debug"]["filter"] == {"allowed": 20, "total": 30}
+    res = client.get("/search", params={**base, "k": 20, "uploaded_after": "2024-01-01T00:00:00Z"}).json()["results"]
+    assert {r["filename"].rsplit("/", 1)[-1] for r in res} == {"doc1.pdf"}
+    assert client.get("/search", params={**base, "filename": "missing.pdf"}).json()["results"] == []
+
+    async def _fake_chat_stream(prompt, cfg=None):
+        yield "ok"
+
+    monkeypatch.setattr(api_main, "chat_stream", _fake_chat_stream, raising=True)
+    r = client.post("/answer", headers={"X-Tenant-ID": tenant}, json={"question": "shared topic", "filenames": ["doc2.pdf"], "page_to": 0})
+    assert [s["filename"].rsplit("/", 1)[-1] for s in r.json()["sources"]] == ["doc2.pdf"]
+
+
+def test_api_follows_published_generations_and_reset_waits_for_writer(monkeypatch):
+    import shutil
+
+    from kits.kit_index import TenantLock, publish_version
+
+    tenant = "tenant-versions"
+    make_index(tenant, ["legacy text"], [{"source": "a.txt", "page": 1, "id": "a"}])
+    from apps.api import main as api_main
+
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    client = TestClient(app)
+    params = {"tenant": tenant, "q": "text", "k": 1}
+    assert client.get("/search", params=params).json()["results"][0]["snippet"] == "legacy text"
+
+    # Worker-style publish of a new generation: the API switches on the generation number
+    make_index("tenant-versions-src", ["fresh text"], [{"source": "b.txt", "page": 1, "id": "b"}])
+    src = api_main.tenant_dir("tenant-versions-src")
+    publish_version(api_main.tenant_dir(tenant), lambda d: [shutil.copy(f, d) for f in src.iterdir()])
+    assert api_main.index_generation(tenant)[1] == 1
+    assert client.get("/search", params=params).json()["results"][0]["snippet"] == "fresh text"
+
+    with TenantLock(tenant, lock_dir=api_main.DATA_DIR / "locks"):
+        r = client.post("/reset", headers={"X-Tenant-ID": tenant})
+    assert r.status_code == 409 and api_main.has_index(tenant)
+    assert client.post("/reset", headers={"X-Tenant-ID": tenant}).status_code == 200
+    assert not api_main.has_index(tenant)
+
+
+def test_reset_in_another_process_never_serves_the_old_index(monkeypatch):
+    import shutil
+
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import Embeddings
+
+    from apps.api import main as api_main
+    from kits.kit_index import publish_version
+
+    class _Emb(Embeddings):
+        def embed_documents(self, docs):
+            return FakeEmbBackend(8).embed_texts(docs)
+
+        def embed_query(self, text):
+            return FakeEmbBackend(8).embed_query(text)
+
+    def _publish(text, source):
+        vs = FAISS.from_texts([text], _Emb(), [{"source": source, "id": source}])
+        return publish_version(api_main.tenant_dir(tenant), lambda d: vs.save_local(str(d)))
+
+    tenant = "tenant-reset-epoch"
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    client = TestClient(app)
+    old = _publish("secret text", "secret.txt")
+    res = client.get("/search", params={"tenant": tenant, "q": "text"}).json()["results"]
+    assert [r["filename"] for r in res] == ["secret.txt"]
+    # /reset handled by another API process: this one's caches are not invalidated
+    shutil.rmtree(api_main.tenant_dir(tenant))
+    new = _publish("public text", "public.txt")
+    assert new.generation == old.generation == 1
+    res = client.get("/search", params={"tenant": tenant, "q": "text"}).json()["results"]
+    assert [r["filename"] for r in res] == ["public.txt"]
+
+
+def test_delete_document_enqueues_job_and_search_skips_tombstones(monkeypatch):
+    import numpy as np
+
+    from apps.api import main as api_main
+    from kits.kit_index import TenantManifest
+
+    tenant = "tenant-delete"
+    make_index(tenant, ["alpha text", "beta text"], [{"source": "a.txt", "id": "a"}, {"source": "b.txt", "id": "b"}])
+    monkeypatch.setattr(api_main, "get_embeddings", lambda: FakeEmbBackend(dim=8), raising=True)
+    TenantManifest(api_main.index_path(tenant) / TenantManifest.FILENAME, {"a.txt": {"sha256": "", "chunks": []}}).save()
+    upload = api_main.UPLOADS_DIR / tenant / "a.txt"
+    upload.parent.mkdir(parents=True, exist_ok=True)
+    upload.write_text("alpha text", encoding="utf-8")
+    enqueued = []
+
+    class _Queue:
+        def enqueue(self, func, *args):
+            enqueued.append((func, args))
+            return type("Job", (), {"id": "job-1"})()
+
+    monkeypatch.setattr(api_main, "get_queue", lambda: _Queue(), raising=True)
+    client = TestClient(app)
+    headers = {"X-Tenant-ID": tenant}
+    assert client.delete("/documents/missing.txt", headers=headers).status_code == 404
+    assert client.delete("/documents/..%2Fa.txt", headers=headers).status_code in (400, 404)
+    r = client.delete("/documents/a.txt", headers=headers)
+    assert r.status_code == 202 and r.json()["job_id"] == "job-1"
+    # The upload is moved aside for the worker to remove once the deletion is published
+    (pending,) = enqueued[0][1][2]
+    assert enqueued == [("apps.worker.worker.delete_files_job", (tenant, ["a.txt"], [pending]))]
+    assert not upload.exists() and (upload.parent / pending).read_text(encoding="utf-8") == "alpha text"
+
+    # Until compaction the deleted chunk's vector is still indexed; it must never be returned
+    np.save(api_main.index_path(tenant) / "tombstones.npy", np.asarray([0], dtype="int64"))
+    api_main.VS_CACHE.invalidate(tenant)
+    res = client.get("/search", params={"tenant": tenant, "q": "alpha text", "k": 2}).json()["results"]
+    assert [r["snippet"] for r in res] == ["beta text"]
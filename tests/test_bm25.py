@@ -0,0 +1,31 @@
+from kits.kit_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    toks = tokenize("Error ERR-1042 in v2.3.1")
+    assert "err-1042" in toks and "1042" in toks and "v2.3.1" in toks and "error" in toks
+
+
+def test_bm25_ranks_rare_terms_and_survives_roundtrip(tmp_path):
+    idx = BM25Index()
+    idx.add("a", "the service returned an error while connecting")
+    idx.add("b", "error code ERR-1042 means the token expired")
+    idx.add("c", "the service is healthy")
+    assert [cid for cid, _ in idx.search("ERR-1042", 3)] == ["b"]
+    assert idx.search("error service", 1)[0][0] == "a"
+    assert idx.search("nothing matches", 3) == []
+
+    assert idx.remove(["b", "missing"]) == 1
+    assert idx.search("1042", 3) == []
+    idx.save(tmp_path)
+    loaded = BM25Index.load(tmp_path)
+    assert len(loaded) == 2 and loaded.search("healthy", 2)[0][0] == "c"
+    assert BM25Index.load(tmp_path / "none") is None
+
+
+def test_reciprocal_rank_fusion_weights():
+    fused = reciprocal_rank_fusion([(["a", "b"], 1.0), (["b", "c"], 1.0)], k=60)
+    assert fused[0][0] == "b"
+    # A heavier sparse weight lets its top hit win
+    fused = reciprocal_rank_fusion([(["a", "b"], 1.0), (["c"], 3.0)], k=60)
+    assert fused[0][0] == "c"
@@ -21,3 +21,15 @@ def test_split_markdown_prefers_headings_then_tokens():
     assert chunks, "no chunks returned"
     # Ensure heading marker remains on a chunk
     assert any(c.lstrip().startswith("# ") for c in chunks)
+
+
+def test_join_chunks_removes_overlap():
+    from kits.kit_chunker import join_chunks
+
+    text = " ".join(f"w{i}" for i in range(30))
+    chunks = split_text(text, max_tokens=12, overlap=4)
+    joined = chunks[0]
+    for c in chunks[1:]:
+        joined = join_chunks(joined, c)
+    assert joined == text
+    assert join_chunks("x y", "z") == "x y z"
@@ -1,4 +1,6 @@
-from kits.kit_common import normalize_text, gen_request_id
+import sys
+
+from kits.kit_common import normalize_text, gen_request_id, process_memory
 
 
 def test_normalize_text_compacts_whitespace_and_strips():
@@ -12,3 +14,10 @@ def test_gen_request_id_unique_and_hex():
     b = gen_request_id()
     assert a != b
     assert len(a) == 32 and all(c in "0123456789abcdef" for c in a)
+
+
+def test_process_memory_without_resource_module(monkeypatch):
+    assert process_memory()["max_rss_mb"] > 0
+    # e.g. Windows: no resource module, the peak is simply left out
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert "max_rss_mb" not in process_memory()
@@ -0,0 +1,105 @@
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("langchain_community")
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import FakeEmbeddings
+
+from kits.kit_index import ColumnarDocstore, docstore_format, load_vectorstore, save_vectorstore
+
+
+def _store():
+    texts = ["первый chunk", "second chunk", "third"]
+    metas = [
+        {"source": "/u/a.pdf", "page": 0, "id": "c1", "total_pages": 2},
+        {"source": "/u/a.pdf", "page": 1, "id": "c2"},
+        {"source": "/u/b.txt", "id": "c3"},
+    ]
+    return FAISS.from_texts(texts, FakeEmbeddings(size=8), metas, ids=["c1", "c2", "c3"])
+
+
+def test_columnar_roundtrip_materializes_only_requested_rows(tmp_path):
+    save_vectorstore(_store(), tmp_path, fmt="columnar")
+    assert docstore_format(tmp_path) == "columnar"
+    assert not (tmp_path / "index.pkl").exists()
+
+    vs = load_vectorstore(tmp_path, FakeEmbeddings(size=8))
+    assert isinstance(vs.docstore, ColumnarDocstore)
+    doc = vs.docstore.search(vs.index_to_docstore_id[0])
+    assert doc.page_content == "первый chunk"
+    assert doc.metadata == {"source": "/u/a.pdf", "page": 0, "id": "c1"}
+    assert vs.docstore.search("c3").metadata == {"source": "/u/b.txt", "id": "c3"}
+    hits = vs.similarity_search_with_score_by_vector(FakeEmbeddings(size=8).embed_query("x"), k=3)
+    assert sorted(d.metadata["id"] for d, _ in hits) == ["c1", "c2", "c3"]
+
+
+def test_writable_load_and_format_switch(tmp_path):
+    save_vectorstore(_store(), tmp_path, fmt="columnar")
+    vs = load_vectorstore(tmp_path, FakeEmbeddings(size=8), writable=True)
+    vs.add_texts(["fourth"], [{"source": "/u/c.md", "id": "c4"}], ids=["c4"])
+    save_vectorstore(vs, tmp_path, fmt="pickle")
+    assert docstore_format(tmp_path) == "pickle"
+    assert not (tmp_path / "docs.meta.json").exists()
+    vs2 = load_vectorstore(tmp_path, FakeEmbeddings(size=8))
+    assert vs2.index.ntotal == 4
+    assert vs2.docstore.search("c4").page_content == "fourth"
+
+
+def test_mmap_load_searches_like_plain_load(tmp_path):
+    from kits.kit_index import mmap_io_flags
+
+    save_vectorstore(_store(), tmp_path, fmt="columnar")
+    q = FakeEmbeddings(size=8).embed_query("x")
+    plain = load_vectorstore(tmp_path, FakeEmbeddings(size=8))
+    mapped = load_vectorstore(tmp_path, FakeEmbeddings(size=8), io_flags=mmap_io_flags())
+    assert mapped.index.ntotal == 3
+    a = [d.metadata["id"] for d, _ in plain.similarity_search_with_score_by_vector(q, k=3)]
+    b = [d.metadata["id"] for d, _ in mapped.similarity_search_with_score_by_vector(q, k=3)]
+    assert a == b
+    # Rewriting the index replaces the file, so an existing mapping stays valid
+    save_vectorstore(plain, tmp_path, fmt="columnar")
+    assert len(mapped.similarity_search_with_score_by_vector(q, k=3)) == 3
+
+
+def test_columnar_keeps_chunk_position_and_reads_v1_stores(tmp_path):
+    import json
+
+    import numpy as np
+
+    from kits.kit_index.store import ROW_DTYPES
+
+    vs = FAISS.from_texts(["a", "b"], FakeEmbeddings(size=8), [{"source": "/u/a.txt", "id": "c1", "chunk": 3}, {"id": "c2"}], ids=["c1", "c2"])
+    save_vectorstore(vs, tmp_path, fmt="columnar")
+    store = load_vectorstore(tmp_path, FakeEmbeddings(size=8)).docstore
+    assert store.metadata(0) == {"source": "/u/a.txt", "chunk": 3, "id": "c1"}
+    assert store.metadata(1) == {"id": "c2"}
+
+    # Stores written before the chunk column existed
+    rows = np.fromfile(tmp_path / "docs.rows", dtype=ROW_DTYPES[2])
+    old = np.zeros(len(rows), dtype=ROW_DTYPES[1])
+    for name in ROW_DTYPES[1].names:
+        old[name] = rows[name]
+    old.tofile(tmp_path / "docs.rows")
+    meta = json.loads((tmp_path / "docs.meta.json").read_text())
+    meta["version"] = 1
+    (tmp_path / "docs.meta.json").write_text(json.dumps(meta))
+    store = load_vectorstore(tmp_path, FakeEmbeddings(size=8)).docstore
+    assert store.metadata(0) == {"source": "/u/a.txt", "id": "c1"} and store.text(1) == "b"
+
+
+def test_position_metadata_masks_columnar_and_pickled_stores(tmp_path):
+    from kits.kit_index import MetadataFilter, position_metadata
+
+    texts = [f"t{i}" for i in range(6)]
+    metas = [{"source": f"/up/d{i % 2}.pdf", "page": i // 2} for i in range(6)]
+    vs = FAISS.from_texts(texts, FakeEmbeddings(size=8), metas)
+    flt = MetadataFilter.build(["d1.pdf"], page_from=1)
+    expected = [False, False, False, True, False, True]
+    assert position_metadata(vs).mask(flt).tolist() == expected
+    save_vectorstore(vs, tmp_path, fmt="columnar")
+    loaded = load_vectorstore(tmp_path, FakeEmbeddings(size=8))
+    assert position_metadata(loaded).mask(flt).tolist() == expected
+    by_time = MetadataFilter.build(uploaded_after=100.0)
+    assert position_metadata(loaded).mask(by_time, {"d0.pdf": 200.0, "d1.pdf": 50.0}).tolist() == [True, False] * 3
+    assert MetadataFilter.build([], None) is None
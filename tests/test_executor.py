@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from kits.kit_common import BoundedExecutor, QueueFullError
+
+
+def test_bounded_executor_limits_concurrency_without_blocking_loop():
+    ex = BoundedExecutor(max_workers=2, name="test")
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return "ok"
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        t = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(ex.run(work) for _ in range(6)))
+        t.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(main())
+    assert results == ["ok"] * 6
+    assert max(peak) == 2
+    # 3 rounds of 50ms ran off-loop; the ticker kept going meanwhile
+    assert ticks >= 10
+    st = ex.stats()
+    assert st["completed"] == 6 and st["queued"] == 0 and st["active"] == 0
+    assert st["max_wait_ms"] > 0
+    ex.shutdown()
+
+
+def test_bounded_executor_rejects_when_queue_full():
+    ex = BoundedExecutor(max_workers=1, max_queue=1, name="test")
+    gate = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(ex.run(gate.wait))
+        await asyncio.sleep(0.01)
+        # first occupies the only worker, second fills the queue
+        second = asyncio.ensure_future(ex.run(gate.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(QueueFullError):
+            await ex.run(gate.wait)
+        gate.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(main())
+    assert ex.stats()["rejected"] == 1
+    ex.shutdown()
@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("faiss")
+
+from kits.kit_index import LockLost, LockTimeout, TenantLock, current_version, prune_versions, publish_version
+
+
+def _write(text):
+    def _w(d):
+        (d / "index.faiss").write_text(text)
+        (d / "index.pkl").write_text(text)
+
+    return _w
+
+
+def test_publish_swaps_generations_atomically(tmp_path):
+    tenant = tmp_path / "t"
+    assert current_version(tenant) is None
+    v1 = publish_version(tenant, _write("one"))
+    assert v1.generation == 1 and current_version(tenant) == v1
+    assert (v1.path / "index.faiss").read_text() == "one"
+
+    # A failing writer leaves the current generation untouched and no temp dir behind
+    def _boom(d):
+        _write("half")(d)
+        raise RuntimeError("disk full")
+
+    with pytest.raises(RuntimeError):
+        publish_version(tenant, _boom)
+    assert current_version(tenant) == v1
+    assert not list(tenant.glob(".tmp-*"))
+
+    publish_version(tenant, _write("two"))
+    v3 = publish_version(tenant, _write("three"), keep=2)
+    assert current_version(tenant).generation == 3 == v3.generation
+    assert sorted(p.name for p in tenant.iterdir() if p.is_dir()) == ["v000002", "v000003"]
+
+
+def test_legacy_layout_is_read_then_replaced(tmp_path):
+    tenant = tmp_path / "t"
+    tenant.mkdir()
+    _write("legacy")(tenant)
+    legacy = current_version(tenant)
+    assert legacy.generation == 0 and legacy.path == tenant
+    publish_version(tenant, _write("v1"), keep=2)
+    # Still there for readers that resolved the legacy index a moment ago
+    assert (tenant / "index.faiss").exists()
+    publish_version(tenant, _write("v2"), keep=2)
+    assert not (tenant / "index.faiss").exists() and current_version(tenant).generation == 2
+    assert prune_versions(tenant, keep=1) == 1
+
+
+def test_version_key_is_unique_across_resets(tmp_path):
+    import shutil
+
+    tenant = tmp_path / "t"
+    v1 = publish_version(tenant, _write("one"))
+    v2 = publish_version(tenant, _write("two"))
+    assert v2.epoch == v1.epoch and current_version(tenant) == v2
+    # A reset deletes the tenant directory: numbering restarts, the epoch does not repeat
+    shutil.rmtree(tenant)
+    again = publish_version(tenant, _write("other"))
+    assert again.generation == 1 and again.key != v1.key
+    # CURRENT written before epochs existed still reads
+    (tenant / "CURRENT").write_text("v000001", encoding="utf-8")
+    assert current_version(tenant).key == ("", 1)
+
+
+def test_file_lock_excludes_other_writers(tmp_path):
+    held = threading.Event()
+    release = threading.Event()
+
+    def _holder():
+        with TenantLock("t", lock_dir=tmp_path):
+            held.set()
+            release.wait(5)
+
+    t = threading.Thread(target=_holder)
+    t.start()
+    held.wait(5)
+    t0 = time.monotonic()
+    with pytest.raises(LockTimeout):
+        TenantLock("t", lock_dir=tmp_path, wait_s=0.2).acquire()
+    assert time.monotonic() - t0 >= 0.2
+    # Other tenants are independent
+    with TenantLock("other", lock_dir=tmp_path, wait_s=0):
+        pass
+    release.set()
+    t.join()
+    with TenantLock("t", lock_dir=tmp_path, wait_s=1):
+        pass
+
+
+class _StubRedisLock:
+    def __init__(self, store, name, timeout):
+        self.store, self.name, self.timeout = store, name, timeout
+
+    def acquire(self):
+        if self.name in self.store:
+            return False
+        self.store[self.name] = self
+        return True
+
+    def reacquire(self):
+        if self.store.get(self.name) is not self:
+            raise RuntimeError("not owned")
+
+    def owned(self):
+        return self.store.get(self.name) is self
+
+    def release(self):
+        if self.store.get(self.name) is self:
+            del self.store[self.name]
+
+
+class _StubRedis:
+    def __init__(self):
+        self.store = {}
+
+    def lock(self, name, timeout, sleep, blocking_timeout, thread_local):
+        return _StubRedisLock(self.store, name, timeout)
+
+
+def test_redis_lock_detects_expiry_before_publish():
+    r = _StubRedis()
+    lock = TenantLock("t", redis=r, ttl_s=0.03).acquire()
+    with pytest.raises(LockTimeout):
+        TenantLock("t", redis=r).acquire()
+    lock.ensure_held()
+    r.store.clear()  # TTL ran out while the holder stalled
+    time.sleep(0.05)
+    with pytest.raises(LockLost):
+        lock.ensure_held()
+    lock.release()
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from kits.kit_llm import ChatConfig, LLMClientPool, chat_stream
+import kits.kit_llm as kit_llm
+
+
+class _OllamaStub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        lines = [{"response": "hel"}, {"response": "lo"}, {"done": True}]
+        body = "".join(json.dumps(x) + "\n" for x in lines).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def ollama_stub(monkeypatch):
+    _OllamaStub.connections = 0
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _OllamaStub)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OLLAMA_HOST", f"http://127.0.0.1:{srv.server_address[1]}")
+    monkeypatch.setattr(kit_llm, "LLM_CLIENTS", LLMClientPool(), raising=True)
+    yield _OllamaStub
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_chat_stream_reuses_pooled_connection(ollama_stub):
+    cfg = ChatConfig(backend="ollama", model="stub")
+
+    async def _run():
+        outs = []
+        for _ in range(3):
+            outs.append("".join([t async for t in chat_stream("hi", cfg)]))
+        stats = kit_llm.LLM_CLIENTS.stats()
+        await kit_llm.close_llm_clients()
+        return outs, stats
+
+    outs, stats = asyncio.run(_run())
+    assert outs == ["hello"] * 3
+    assert ollama_stub.connections == 1
+    assert stats["clients_created"] == 1 and stats["loops"] == 1
+    assert kit_llm.LLM_CLIENTS.stats()["loops"] == 0
+
+
+def test_client_pool_is_per_event_loop(ollama_stub):
+    cfg = ChatConfig(backend="ollama", model="stub")
+
+    async def _ask():
+        return "".join([t async for t in chat_stream("hi", cfg)])
+
+    # A client bound to a finished loop must not be reused by the next one
+    assert asyncio.run(_ask()) == "hello"
+    assert asyncio.run(_ask()) == "hello"
+    assert kit_llm.LLM_CLIENTS.stats()["clients_created"] == 2
@@ -1,5 +1,7 @@
 import types
 
+import pytest
+
 from kits.kit_llm import EmbeddingBackend, EmbedConfig
 
 
@@ -32,3 +34,254 @@ def test_embedding_backend_sentence_transformers_monkeypatched(monkeypatch):
     # embed_query uses same path
     vq = be.embed_query("hi")
     assert len(vq) == 4
+
+
+def test_embedding_registry_shares_one_model_across_threads(monkeypatch):
+    import threading
+
+    import kits.kit_llm as kit_llm
+
+    loads = []
+
+    class _CountingST(_StubST):
+        def __init__(self, model):
+            loads.append(model)
+            super().__init__(model)
+
+    import sys
+
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=_CountingST))
+    monkeypatch.setattr(kit_llm, "_BACKENDS", {}, raising=True)
+
+    cfg = EmbedConfig(backend="sentence_transformers", model="shared-model", batch_size=4)
+    backends = []
+
+    def _use():
+        be = kit_llm.get_embedding_backend(cfg)
+        be.embed_query("hello")
+        backends.append(be)
+
+    threads = [threading.Thread(target=_use) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(b) for b in backends}) == 1
+    assert loads == ["shared-model"]
+    # A different model gets its own backend
+    other = kit_llm.get_embedding_backend(EmbedConfig(backend="sentence_transformers", model="other-model"))
+    assert other is not backends[0]
+    assert kit_llm.warmup_embeddings(cfg) is backends[0]
+
+
+def test_embedding_cache_skips_known_texts_and_evicts(tmp_path, monkeypatch):
+    import kits.kit_llm as kit_llm
+
+    calls = []
+
+    def _fake_ensure(self):
+        self._st_model = _StubST(self.cfg.model)
+
+    monkeypatch.setattr(kit_llm.EmbeddingBackend, "_ensure_st", _fake_ensure, raising=True)
+    cfg = EmbedConfig(backend="sentence_transformers", model="fake-model", cache_path=str(tmp_path / "emb.sqlite"), cache_max_entries=10)
+    be = EmbeddingBackend(cfg)
+    orig = be._embed_uncached
+    monkeypatch.setattr(be, "_embed_uncached", lambda texts: calls.append(list(texts)) or orig(texts))
+
+    first = be.embed_texts(["alpha", "beta"])
+    # Whitespace-only differences hit the same entry; order is preserved
+    second = be.embed_texts(["beta ", "gamma", "alpha"])
+    assert calls == [["alpha", "beta"], ["gamma"]]
+    assert second[0] == pytest.approx(first[1], rel=1e-6) and second[2] == pytest.approx(first[0], rel=1e-6)
+
+    # A fresh backend on the same file sees the persisted vectors
+    be2 = EmbeddingBackend(cfg)
+    monkeypatch.setattr(be2, "_embed_uncached", lambda texts: calls.append(list(texts)) or orig(texts))
+    be2.embed_texts(["gamma"])
+    assert len(calls) == 2
+    assert be2.cache.stats()["hits"] == 1
+
+    be2.embed_texts([f"t{i}" for i in range(20)])
+    st = be2.cache.stats()
+    assert st["entries"] <= 10 and st["evictions"] > 0
+
+
+@pytest.mark.skipif(not hasattr(__import__("os"), "fork"), reason="needs fork()")
+def test_embedding_cache_connection_is_not_shared_across_fork(tmp_path):
+    import os
+
+    from kits.kit_llm.embed_cache import EmbeddingCache
+
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite"))
+    assert cache._conn is None  # nothing opened until first use (e.g. by a preloading parent)
+    cache.put_many("m", ["parent"], [[1.0, 2.0]])
+    parent_conn = cache._conn
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover - child
+        ok = cache.get_many("m", ["parent"]) == {0: [1.0, 2.0]} and cache._conn is not parent_conn
+        cache.put_many("m", ["child"], [[3.0, 4.0]])
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    assert cache._conn is parent_conn and cache.get_many("m", ["child"]) == {0: [3.0, 4.0]}
+
+
+def test_query_batcher_coalesces_concurrent_queries():
+    import asyncio
+    import threading
+
+    from kits.kit_llm import QueryBatcher
+
+    calls = []
+
+    class _Backend:
+        def embed_texts(self, texts):
+            calls.append(len(texts))
+            return [[float(len(t))] for t in texts]
+
+    qb = QueryBatcher(_Backend(), max_wait_ms=50, max_batch=8)
+    results = {}
+
+    def _ask(i):
+        results[i] = qb.embed_query("x" * i)
+
+    threads = [threading.Thread(target=_ask, args=(i,)) for i in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: [float(i)] for i in range(1, 9)}
+    assert sum(calls) == 8 and len(calls) < 8
+
+    async def _many():
+        return await asyncio.gather(*(qb.aembed_query("y" * i) for i in range(1, 5)))
+
+    assert asyncio.run(_many()) == [[1.0], [2.0], [3.0], [4.0]]
+    assert qb.stats()["max_batch_seen"] >= 4
+
+
+def test_query_batcher_propagates_errors():
+    from kits.kit_llm import QueryBatcher
+
+    class _Broken:
+        def embed_texts(self, texts):
+            raise RuntimeError("model failed")
+
+    qb = QueryBatcher(_Broken(), max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="model failed"):
+        qb.embed_query("hi")
+
+
+class _EmbeddingsStub:
+    """Stand-in for POST /v1/embeddings: tracks concurrency and fails the first N requests with 503."""
+
+    def __init__(self, fail_first: int = 0, delay_s: float = 0.05):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        stub = self
+        self.fail_left = fail_first
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                import json
+                import time
+
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub._lock:
+                    stub.requests += 1
+                    fail = stub.fail_left > 0
+                    stub.fail_left -= int(fail)
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(delay_s)
+                with stub._lock:
+                    stub.in_flight -= 1
+                if fail:
+                    out, status = {"error": {"message": "busy", "type": "server_error"}}, 503
+                else:
+                    data = [{"object": "embedding", "index": i, "embedding": [float(len(t)), float(i)]} for i, t in enumerate(body["input"])]
+                    out, status = {"object": "list", "data": data, "model": body["model"], "usage": {"prompt_tokens": 0, "total_tokens": 0}}, 200
+                raw = json.dumps(out).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _openai_backend(monkeypatch, stub, **kw):
+    import kits.kit_llm as kit_llm
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", stub.base_url)
+    monkeypatch.setattr(kit_llm, "LLM_CLIENTS", kit_llm.LLMClientPool(), raising=True)
+    return EmbeddingBackend(EmbedConfig(backend="openai", model="emb", cache_path="", **kw))
+
+
+def test_aembed_texts_sends_batches_concurrently_and_retries(monkeypatch):
+    import asyncio
+
+    stub = _EmbeddingsStub(fail_first=1)
+    try:
+        be = _openai_backend(monkeypatch, stub, batch_size=2, concurrency=2, max_retries=2, retry_backoff_s=0.01)
+        texts = ["a", "bb", "ccc", "dddd", "eeeee", "ffffff", "g"]
+        vecs = asyncio.run(be.aembed_texts(texts))
+    finally:
+        stub.close()
+    # Order preserved across concurrently sent batches
+    assert [v[0] for v in vecs] == [float(len(t)) for t in texts]
+    assert stub.requests == 5  # 4 batches + 1 retried 503
+    assert stub.max_in_flight == 2
+    assert be.retries == 1
+
+
+def test_openai_embed_texts_sync_wrapper_works_inside_running_loop(monkeypatch):
+    import asyncio
+
+    stub = _EmbeddingsStub()
+    try:
+        be = _openai_backend(monkeypatch, stub, batch_size=8)
+
+        async def _inside_loop():
+            # Blocking call from a coroutine used to fail with "event loop is already running"
+            return be.embed_texts(["x", "yy"]), await be.aembed_query("zzz")
+
+        vecs, q = asyncio.run(_inside_loop())
+        assert be.embed_query("four") == [4.0, 0.0]
+    finally:
+        stub.close()
+    assert [v[0] for v in vecs] == [1.0, 2.0]
+    assert q == [3.0, 0.0]
+
+
+def test_aembed_texts_gives_up_after_max_retries(monkeypatch):
+    import asyncio
+
+    import openai
+
+    stub = _EmbeddingsStub(fail_first=10, delay_s=0)
+    try:
+        be = _openai_backend(monkeypatch, stub, max_retries=1, retry_backoff_s=0.01)
+        with pytest.raises(openai.InternalServerError):
+            asyncio.run(be.aembed_texts(["a"]))
+    finally:
+        stub.close()
+    assert stub.requests == 2
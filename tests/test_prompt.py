@@ -0,0 +1,84 @@
+from kits.kit_llm import PromptConfig, PromptSource, Tokenizer, build_prompt
+
+
+class _WordTokenizer(Tokenizer):
+    """One token per whitespace-separated word, so budgets are easy to reason about."""
+
+    def __init__(self):
+        self.name = "words"
+        self._encode = lambda t: t.split()
+        self._decode = lambda ids: " ".join(ids)
+
+
+def _cfg(context_tokens: int, **kw) -> PromptConfig:
+    kw.setdefault("answer_max_fraction", 1.0)
+    return PromptConfig(context_tokens=context_tokens, sources_max_tokens=0, tokenizer="words", safety_tokens=0, min_source_tokens=2, **kw)
+
+
+def _sources(n: int, snippet_words: int = 10, full_words: int = 40):
+    return [
+        PromptSource(
+            snippet=" ".join(f"s{i}w{j}" for j in range(snippet_words)),
+            text=" ".join(f"s{i}w{j}" for j in range(full_words)),
+        )
+        for i in range(n)
+    ]
+
+
+def test_prompt_expands_to_full_chunks_when_budget_allows():
+    tok = _WordTokenizer()
+    built = build_prompt("what?", _sources(3), answer_tokens=100, cfg=_cfg(1000), tokenizer=tok)
+    assert built.used == ["full", "full", "full"]
+    assert "s2w39" in built.prompt
+    assert built.tokens <= 1000 - 100
+
+
+def test_prompt_expands_best_sources_first_and_stays_in_budget():
+    tok = _WordTokenizer()
+    sources = _sources(3)
+    fixed = build_prompt("what?", [], answer_tokens=0, cfg=_cfg(10_000), tokenizer=tok).tokens
+    # Room for three snippets plus one expansion, not two
+    window = 100 + fixed + 3 * (10 + 2) + 30 + 5
+    built = build_prompt("what?", sources, answer_tokens=100, cfg=_cfg(window), tokenizer=tok)
+    assert built.used == ["full", "snippet", "snippet"]
+    assert built.tokens <= window - 100
+
+
+def test_prompt_trims_last_source_and_drops_the_rest():
+    tok = _WordTokenizer()
+    fixed = build_prompt("what?", [], answer_tokens=0, cfg=_cfg(10_000), tokenizer=tok).tokens
+    window = 50 + fixed + (10 + 2) + (2 + 4)
+    built = build_prompt("what?", _sources(4), answer_tokens=50, cfg=_cfg(window), tokenizer=tok)
+    assert built.used == ["snippet", "trimmed", "dropped", "dropped"]
+    assert "s1w3" in built.prompt and "s1w4" not in built.prompt
+    assert "Source 3" not in built.prompt
+    assert built.tokens <= window - 50
+
+
+def test_prompt_sources_cap_and_fallback_tokenizer():
+    # Unknown encoding -> character heuristic; still respects the explicit cap
+    cfg = PromptConfig(context_tokens=100_000, sources_max_tokens=40, tokenizer="no-such-encoding", safety_tokens=0, min_source_tokens=4)
+    tok = Tokenizer("no-such-encoding")
+    assert not tok.exact
+    built = build_prompt("q", [PromptSource(snippet="x" * 400, text="x" * 4000)] * 3, answer_tokens=512, cfg=cfg, tokenizer=tok)
+    assert built.budget == 40
+    assert built.used[0] == "trimmed" and built.used[1:] == ["dropped", "dropped"]
+
+
+def test_answer_reservation_is_capped_so_sources_still_fit():
+    # Shipped config before LLM_CONTEXT_TOKENS was set: LLM_MAX_TOKENS == window
+    tok = _WordTokenizer()
+    built = build_prompt("what?", _sources(3), answer_tokens=1000, cfg=_cfg(1000, answer_max_fraction=0.5), tokenizer=tok)
+    assert built.answer_tokens == 500 and built.budget > 0
+    assert built.used == ["full", "full", "full"]
+    assert built.tokens <= 1000 - 500
+
+
+def test_top_source_is_kept_trimmed_when_budget_is_exhausted(caplog):
+    tok = _WordTokenizer()
+    with caplog.at_level("WARNING", logger="kit_llm"):
+        built = build_prompt("what?", _sources(2), answer_tokens=95, cfg=_cfg(100, answer_max_fraction=1.0), tokenizer=tok)
+    assert built.budget == 0
+    assert built.used == ["trimmed", "dropped"]
+    assert "s0w1" in built.prompt and "s0w2" not in built.prompt
+    assert "budget exhausted" in caplog.text
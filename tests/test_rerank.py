@@ -0,0 +1,56 @@
+import sys
+import time
+import types
+
+import pytest
+
+from kits.kit_llm import CrossEncoderReranker, RerankConfig
+
+
+class _StubCrossEncoder:
+    """Scores a pair by how often the query's words occur in the passage."""
+
+    delay_s = 0.0
+
+    def __init__(self, model, max_length=256, device="cpu"):
+        self.model = model
+
+    def predict(self, pairs, batch_size=32, show_progress_bar=False):
+        time.sleep(self.delay_s * len(pairs))
+        return [sum(t.lower().count(w) for w in q.lower().split()) for q, t in pairs]
+
+
+@pytest.fixture()
+def stub_cross_encoder(monkeypatch):
+    _StubCrossEncoder.delay_s = 0.0
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(CrossEncoder=_StubCrossEncoder))
+    return _StubCrossEncoder
+
+
+def test_rerank_orders_by_cross_encoder_score(stub_cross_encoder):
+    rr = CrossEncoderReranker(RerankConfig(model="stub", batch_size=2, budget_ms=0))
+    rr.load()
+    res = rr.rerank("apple", ["pear", "apple pie", "apple apple", "plum"])
+    assert res.order[:2] == [2, 1] and res.scored == 4 and not res.truncated
+    assert res.info()["candidates"] == 4
+
+
+def test_rerank_truncates_to_time_budget(stub_cross_encoder):
+    stub_cross_encoder.delay_s = 0.01
+    rr = CrossEncoderReranker(RerankConfig(model="stub", batch_size=2, budget_ms=50))
+    rr.load()
+    texts = ["x"] * 19 + ["apple"]
+    res = rr.rerank("apple", texts)
+    # ~20 ms per batch: only the first batches fit, the rest keep retriever order
+    assert res.truncated and 0 < res.scored < len(texts)
+    assert sorted(res.order) == list(range(len(texts)))
+    assert res.order[-1] == len(texts) - 1
+
+
+def test_rerank_skips_until_model_loaded(monkeypatch):
+    monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace())
+    rr = CrossEncoderReranker(RerankConfig(model="missing"))
+    res = rr.rerank("q", ["a", "b"])
+    assert res.skipped == "model_loading" and res.order == [0, 1]
+    rr._loading.join(5)
+    assert rr.rerank("q", ["a", "b"]).skipped == "unavailable"
@@ -0,0 +1,42 @@
+from kits.kit_index import VectorStoreCache, index_signature
+
+
+def test_cache_hits_reloads_and_evicts():
+    cache = VectorStoreCache(max_entries=2)
+    loads = []
+
+    def loader(name):
+        def _load():
+            loads.append(name)
+            return object()
+        return _load
+
+    a1 = cache.get("a", 1, loader("a"))
+    assert cache.get("a", 1, loader("a")) is a1
+    # Signature change forces a reload
+    a2 = cache.get("a", 2, loader("a"))
+    assert a2 is not a1
+    cache.get("b", 1, loader("b"))
+    cache.get("c", 1, loader("c"))
+    st = cache.stats()
+    assert st["hits"] == 1 and st["misses"] == 3 and st["reloads"] == 1
+    assert st["entries"] == 2 and st["evictions"] == 1
+    # "a" was least recently used and got evicted
+    cache.get("a", 2, loader("a"))
+    assert loads == ["a", "a", "b", "c", "a"]
+
+
+def test_cache_respects_byte_budget():
+    cache = VectorStoreCache(max_entries=10, max_bytes=100)
+    cache.get("a", 1, object, size_bytes=60)
+    cache.get("b", 1, object, size_bytes=60)
+    st = cache.stats()
+    assert st["entries"] == 1 and st["bytes"] == 60
+
+
+def test_index_signature_requires_both_files(tmp_path):
+    assert index_signature(tmp_path) is None
+    (tmp_path / "index.faiss").write_bytes(b"x")
+    assert index_signature(tmp_path) is None
+    (tmp_path / "index.pkl").write_bytes(b"y")
+    assert index_signature(tmp_path) is not None
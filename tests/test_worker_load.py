@@ -6,6 +6,14 @@ pytest.importorskip("langchain_community")
 from apps.worker.worker import _load_documents, _chunk_documents
 
 
+def _index_dir(tenant: str) -> Path:
+    """Directory of the tenant's current index generation."""
+    from apps.worker import worker
+    from kits.kit_index import current_version
+
+    return current_version(worker.FAISS_DIR / tenant).path
+
+
 def test_worker_loads_and_normalizes_txt(tmp_path):
     p = tmp_path / "sample.txt"
     p.write_text("Hello   world\nNew\tline", encoding="utf-8")
@@ -19,3 +27,494 @@ def test_chunk_documents_not_empty(tmp_path):
     docs = _load_documents(p)
     chunks = _chunk_documents(docs, max_tokens=20, overlap=5)
     assert chunks and all(isinstance(t, tuple) and t[0] for t in chunks)
+
+
+def test_index_files_job_embeds_in_batches(tmp_path, monkeypatch):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import FakeEmbeddings
+
+    from apps.worker import worker
+
+    files = []
+    for name in ("a.txt", "b.txt"):
+        p = tmp_path / name
+        p.write_text(" ".join(f"{name}-w{i}" for i in range(50)), encoding="utf-8")
+        files.append(str(p))
+    monkeypatch.setenv("CHUNK_MAX_TOKENS", "10")
+    monkeypatch.setenv("CHUNK_OVERLAP", "0")
+    monkeypatch.setenv("EMBED_BATCH_SIZE", "3")
+    batch_sizes = []
+    backend = worker.get_embedding_backend()
+    orig = backend.embed_texts
+
+    def _spy(texts):
+        batch_sizes.append(len(texts))
+        return orig(texts)
+
+    monkeypatch.setattr(backend, "embed_texts", _spy)
+
+    worker.index_files_job("tenant-stream", files)
+    assert max(batch_sizes) <= 3
+    assert sum(batch_sizes) == 10  # 5 chunks per file
+    vs = FAISS.load_local(str(_index_dir("tenant-stream")), FakeEmbeddings(size=8), allow_dangerous_deserialization=True)
+    assert vs.index.ntotal == 10
+
+
+def test_reindex_skips_unchanged_and_replaces_changed_chunks(tmp_path, monkeypatch):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import FakeEmbeddings
+
+    from apps.worker import worker
+
+    monkeypatch.setenv("CHUNK_MAX_TOKENS", "10")
+    monkeypatch.setenv("CHUNK_OVERLAP", "0")
+    p = tmp_path / "doc.txt"
+    words = [f"w{i}" for i in range(40)]
+    p.write_text(" ".join(words), encoding="utf-8")
+    embedded = []
+    backend = worker.get_embedding_backend()
+    orig = backend.embed_texts
+    monkeypatch.setattr(backend, "embed_texts", lambda texts: embedded.extend(texts) or orig(texts))
+
+    def _load():
+        return FAISS.load_local(str(_index_dir("tenant-dedup")), FakeEmbeddings(size=8), allow_dangerous_deserialization=True)
+
+    worker.index_files_job("tenant-dedup", [str(p)])
+    assert len(embedded) == 4 and _load().index.ntotal == 4
+    from kits.kit_index import TenantManifest
+
+    # Upload time recorded for upload-time search filters
+    assert TenantManifest.load(_index_dir("tenant-dedup")).upload_times() == {"doc.txt": p.stat().st_mtime}
+
+    # Same content again: nothing embedded, no duplicate vectors
+    embedded.clear()
+    worker.index_files_job("tenant-dedup", [str(p)])
+    assert embedded == [] and _load().index.ntotal == 4
+
+    # Only the last chunk changes: one new embedding, the stale vector is removed
+    words[-1] = "changed"
+    p.write_text(" ".join(words), encoding="utf-8")
+    worker.index_files_job("tenant-dedup", [str(p)])
+    assert embedded == [" ".join(words[30:])]
+    vs = _load()
+    assert vs.index.ntotal == 4
+    texts = sorted(vs.docstore.search(i).page_content for i in vs.index_to_docstore_id.values())
+    assert " ".join(words[30:]) in texts and " ".join(words[30:39] + ["w39"]) not in texts
+
+
+def test_worker_keeps_bm25_in_sync_with_faiss(tmp_path, monkeypatch):
+    from kits.kit_index import BM25Index
+
+    from apps.worker import worker
+
+    monkeypatch.setenv("CHUNK_MAX_TOKENS", "10")
+    monkeypatch.setenv("CHUNK_OVERLAP", "0")
+    p = tmp_path / "ids.txt"
+    words = [f"w{i}" for i in range(19)] + ["ERR-1042"]
+    p.write_text(" ".join(words), encoding="utf-8")
+    worker.index_files_job("tenant-bm25", [str(p)])
+    bm25 = BM25Index.load(_index_dir("tenant-bm25"))
+    assert len(bm25) == 2 and len(bm25.search("err-1042", 5)) == 1
+
+    words[-1] = "fixed"
+    p.write_text(" ".join(words), encoding="utf-8")
+    worker.index_files_job("tenant-bm25", [str(p)])
+    bm25 = BM25Index.load(_index_dir("tenant-bm25"))
+    assert len(bm25) == 2 and bm25.search("err-1042", 5) == [] and len(bm25.search("fixed", 5)) == 1
+
+    # Index from before hybrid search: the next job backfills bm25.json
+    (_index_dir("tenant-bm25") / BM25Index.FILENAME).unlink()
+    worker.index_files_job("tenant-bm25", [str(p)])
+    assert len(BM25Index.load(_index_dir("tenant-bm25"))) == 2
+
+
+def _write_pdf(path, pages):
+    """Minimal PDF with one line of Helvetica text per page."""
+    n = len(pages)
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(n)), n)).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode())
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    path.write_bytes(bytes(out))
+
+
+def test_parallel_parsing_streams_pages_in_order(tmp_path, monkeypatch, caplog):
+    from apps.worker import parsing, worker
+
+    pdf = tmp_path / "big.pdf"
+    _write_pdf(pdf, [f"page {i} text" for i in range(7)])
+    txt = tmp_path / "notes.txt"
+    txt.write_text("plain   text file", encoding="utf-8")
+
+    sequential = [(d.page_content, d.metadata["page"]) for d in worker._iter_documents(pdf)]
+    assert sequential == [(f"page {i} text", i) for i in range(7)]
+
+    stream = parsing.DocumentStream([pdf, txt, pdf], 2, pages_per_part=2, lookahead=3)
+    try:
+        assert [(d.page_content, d.metadata["page"]) for d in stream.documents(0)] == sequential
+        stream.skip(1)
+        docs = list(stream.documents(2))
+        assert [d.metadata["page"] for d in docs] == list(range(7)) and docs[0].metadata["total_pages"] == 7
+        # A stream whose files are all consumed has nothing left
+        assert list(stream.documents(3)) == []
+    finally:
+        stream.close()
+        parsing.shutdown_parse_pool()
+    # A file expected unchanged is left out of the pool but still parses if it did change
+    stream = parsing.DocumentStream([pdf, txt], 2, pages_per_part=2, lookahead=3, skip={1})
+    try:
+        assert [d.page_content for d in stream.documents(1)] == ["plain text file"]
+    finally:
+        stream.close()
+        parsing.shutdown_parse_pool()
+
+    monkeypatch.setenv("PARSE_WORKERS", "2")
+    monkeypatch.setenv("PARSE_PAGES_PER_TASK", "3")
+    monkeypatch.setenv("WORKER_CLASS", "simple")
+    planned = []
+    real_split = parsing.split_parts
+    monkeypatch.setattr(parsing, "split_parts", lambda p, n: planned.append(p.name) or real_split(p, n))
+    try:
+        worker.index_files_job("tenant-parallel", [str(pdf), str(txt)])
+        pool = parsing._PARSE_POOL
+        assert pool is not None and planned == ["big.pdf", "notes.txt"]
+        # Unchanged re-uploads are not parsed, and a SimpleWorker reuses its pool
+        planned.clear()
+        worker.index_files_job("tenant-parallel", [str(pdf), str(txt)])
+        assert planned == [] and parsing._PARSE_POOL is pool
+    finally:
+        parsing.shutdown_parse_pool()
+    from kits.kit_index import TenantManifest
+
+    manifest = TenantManifest.load(_index_dir("tenant-parallel"))
+    assert len(manifest.get("big.pdf")["chunks"]) == 7 and len(manifest.get("notes.txt")["chunks"]) == 1
+
+    # A single part is parsed in-process
+    worker.index_files_job("tenant-parallel-one", [str(txt)])
+    assert parsing._PARSE_POOL is None
+    # A forked work horse uses a pool for the job only when PARSE_WORKERS asks for one
+    monkeypatch.setenv("WORKER_CLASS", "fork")
+    planned.clear()
+    worker.index_files_job("tenant-parallel-fork", [str(pdf), str(txt)])
+    assert planned == ["big.pdf", "notes.txt"] and parsing._PARSE_POOL is None
+    monkeypatch.delenv("PARSE_WORKERS")
+    monkeypatch.setattr(worker.os, "cpu_count", lambda: 4)
+    planned.clear()
+    with caplog.at_level("INFO", logger=worker.logger.name):
+        worker.index_files_job("tenant-parallel-fork2", [str(pdf), str(txt)])
+    assert planned == [] and "parses in-process" in caplog.text
+
+
+def test_concurrent_jobs_for_one_tenant_do_not_lose_chunks(tmp_path, monkeypatch):
+    import threading
+
+    from apps.worker import worker
+    from kits.kit_index import current_version
+
+    monkeypatch.setenv("PARSE_WORKERS", "1")
+    files = []
+    for i in range(4):
+        p = tmp_path / f"doc{i}.txt"
+        p.write_text(f"document number {i} " * 5, encoding="utf-8")
+        files.append(str(p))
+    errors = []
+
+    def _job(paths):
+        try:
+            worker.index_files_job("tenant-concurrent", paths)
+        except Exception as e:  # pragma: no cover - surfaced below
+            errors.append(e)
+
+    threads = [threading.Thread(target=_job, args=([f],)) for f in files]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    tenant_dir = worker.FAISS_DIR / "tenant-concurrent"
+    version = current_version(tenant_dir)
+    # Each job published its own generation on top of the previous one
+    assert version.generation == 4
+    from kits.kit_index import TenantManifest
+
+    assert sorted(TenantManifest.load(version.path).files) == [f"doc{i}.txt" for i in range(4)]
+    # Older generations are pruned down to INDEX_KEEP_GENERATIONS
+    assert sorted(p.name for p in tenant_dir.iterdir() if p.name.startswith("v")) == ["v000003", "v000004"]
+
+
+class _Pipeline:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self):
+        pass
+
+
+class _Connection:
+    def pipeline(self):
+        return _Pipeline()
+
+
+class _Registry:
+    def __init__(self, name, jobs):
+        self.name, self.jobs = name, jobs
+
+    def add(self, job, ttl=None, exc_string="", pipeline=None):
+        self.jobs.append((self.name, job.id, ttl))
+
+
+class _QueuedJob:
+    """Just enough of an RQ job for the worker's coalescing."""
+
+    registered: list = []  # (registry, job id, ttl) of every ended job
+
+    def __init__(self, job_id, tenant, paths):
+        self.id = job_id
+        self.args = (tenant, paths)
+        self.kwargs = {}
+        self.func_name = "apps.worker.worker.index_files_job"
+        self.origin = "default"
+        self.connection = _Connection()
+        self.serializer = None
+        self.meta = {}
+        self.status = "queued"
+        self.result_ttl = self.failure_ttl = None
+        self.started_at = self.ended_at = None
+        self.finished_job_registry = _Registry("finished", self.registered)
+        self.failed_job_registry = _Registry("failed", self.registered)
+
+    def save_meta(self):
+        pass
+
+    def save(self, pipeline=None, include_meta=True):
+        pass
+
+    def set_status(self, status, pipeline=None):
+        self.status = status
+
+    def get_result_ttl(self, default_ttl):
+        return self.result_ttl if self.result_ttl is not None else default_ttl
+
+    def cleanup(self, ttl=None, pipeline=None, remove_from_queue=True):
+        pass
+
+
+def _fake_queue(monkeypatch, running, queued):
+    import rq
+
+    from apps.worker import worker
+
+    running.connection = None  # index lock falls back to a lock file
+    by_id = {j.id: j for j in [running, *queued]}
+    dependents = []
+    _QueuedJob.registered.clear()
+
+    class _Queue:
+        def __init__(self, name, connection=None, serializer=None):
+            self.connection = connection
+            self.serializer = serializer
+
+        def get_job_ids(self, offset=0, length=-1):
+            ids = [j.id for j in queued]
+            return ids[offset:] if length < 0 else ids[offset : offset + length]
+
+        def remove(self, job_id):
+            before = len(queued)
+            queued[:] = [j for j in queued if j.id != job_id]
+            return before - len(queued)
+
+        def enqueue_job(self, job, at_front=False):
+            job.status = "queued"
+            queued.insert(0 if at_front else len(queued), job)
+
+        def enqueue_dependents(self, job, pipeline=None):
+            dependents.append(job.id)
+
+    class _Job:
+        @staticmethod
+        def fetch_many(job_ids, connection, serializer=None):
+            return [by_id.get(i) for i in job_ids]
+
+    monkeypatch.setattr(worker, "Queue", _Queue)
+    monkeypatch.setattr(worker, "Job", _Job)
+    monkeypatch.setattr(rq, "get_current_job", lambda: running)
+    return dependents
+
+
+def _txt(tmp_path, name):
+    p = tmp_path / name
+    p.write_text(f"contents of {name} " * 5, encoding="utf-8")
+    return str(p)
+
+
+def test_queued_jobs_of_a_tenant_are_coalesced_into_one_publish(tmp_path, monkeypatch):
+    from apps.worker import worker
+    from kits.kit_index import TenantManifest, current_version
+
+    monkeypatch.setenv("PARSE_WORKERS", "1")
+    tenant = "tenant-coalesce"
+    running = _QueuedJob("j0", tenant, [_txt(tmp_path, "a.txt")])
+    b, c = _QueuedJob("j1", tenant, [_txt(tmp_path, "b.txt")]), _QueuedJob("j2", tenant, [_txt(tmp_path, "c.txt")])
+    other = _QueuedJob("j3", "tenant-else", [_txt(tmp_path, "d.txt")])
+    queued = [b, other, c]
+    dependents = _fake_queue(monkeypatch, running, queued)
+
+    worker.index_files_job(*running.args)
+
+    version = current_version(worker.FAISS_DIR / tenant)
+    assert version.generation == 1  # one load/append/publish for all three jobs
+    assert sorted(TenantManifest.load(version.path).files) == ["a.txt", "b.txt", "c.txt"]
+    assert queued == [other]
+    assert running.meta["coalesced_jobs"] == ["j1", "j2"]
+    for j in (b, c):
+        assert j.status == "finished" and j.ended_at >= j.started_at
+        assert j.meta["coalesced_into"] == "j0" and j.meta["generation"] == 1 and j.meta["progress"] == 100
+    # Ended through RQ's registries, and jobs depending on them are released
+    assert _QueuedJob.registered == [("finished", "j1", 500), ("finished", "j2", 500)]
+    assert dependents == ["j1", "j2"]
+
+
+def test_failed_file_of_a_coalesced_job_only_fails_that_job(tmp_path, monkeypatch):
+    from apps.worker import worker
+    from kits.kit_index import TenantManifest, current_version
+
+    monkeypatch.setenv("PARSE_WORKERS", "1")
+    tenant = "tenant-coalesce-fail"
+    running = _QueuedJob("j0", tenant, [_txt(tmp_path, "a.txt")])
+    bad, good = _QueuedJob("j1", tenant, [_txt(tmp_path, "b.xyz")]), _QueuedJob("j2", tenant, [_txt(tmp_path, "c.txt")])
+    _fake_queue(monkeypatch, running, [bad, good])
+
+    worker.index_files_job(*running.args)
+
+    assert bad.status == "failed" and "Unsupported" in bad.meta["error"]
+    assert good.status == "finished"
+    assert sorted(_QueuedJob.registered) == [("failed", "j1", 31536000), ("finished", "j2", 500)]
+    version = current_version(worker.FAISS_DIR / tenant)
+    assert sorted(TenantManifest.load(version.path).files) == ["a.txt", "c.txt"]
+
+    # A failure on the running job's own file hands the claimed jobs back to the queue
+    running = _QueuedJob("j3", tenant, [_txt(tmp_path, "e.xyz")])
+    later = _QueuedJob("j4", tenant, [_txt(tmp_path, "f.txt")])
+    queued = [later]
+    _fake_queue(monkeypatch, running, queued)
+    with pytest.raises(ValueError):
+        worker.index_files_job(*running.args)
+    assert queued == [later] and later.status == "queued" and "coalesced_into" not in later.meta
+
+
+def test_timed_out_batch_is_released_and_not_taken_over_again(tmp_path, monkeypatch):
+    from rq.timeouts import JobTimeoutException
+
+    from apps.worker import worker
+    from kits.kit_index import TenantManifest, current_version
+
+    monkeypatch.setenv("PARSE_WORKERS", "1")
+    tenant = "tenant-coalesce-timeout"
+    running = _QueuedJob("j0", tenant, [_txt(tmp_path, "a.txt")])
+    b, c = _QueuedJob("j1", tenant, [_txt(tmp_path, "b.txt")]), _QueuedJob("j2", tenant, [_txt(tmp_path, "c.txt")])
+    queued = [b, c]
+    _fake_queue(monkeypatch, running, queued)
+    real_save = worker._IndexWriter.save
+
+    def _timeout(self, lock):
+        raise JobTimeoutException("Task exceeded maximum timeout value (180 seconds)")
+
+    monkeypatch.setattr(worker._IndexWriter, "save", _timeout)
+    with pytest.raises(JobTimeoutException):
+        worker.index_files_job(*running.args)
+    # Back at the front, in their original order
+    assert queued == [b, c] and b.meta["released_from"] == "j0" and "coalesced_into" not in b.meta
+
+    # The next job runs alone instead of timing out on the same batch again
+    monkeypatch.setattr(worker._IndexWriter, "save", real_save)
+    queued.remove(b)
+    _fake_queue(monkeypatch, b, queued)
+    worker.index_files_job(*b.args)
+    assert queued == [c] and b.meta["coalesced_jobs"] == []
+    assert sorted(TenantManifest.load(current_version(worker.FAISS_DIR / tenant).path).files) == ["b.txt"]
+
+
+def test_coalescing_stops_at_the_size_budget(tmp_path, monkeypatch):
+    from apps.worker import worker
+
+    monkeypatch.setenv("PARSE_WORKERS", "1")
+    tenant = "tenant-coalesce-bytes"
+    paths = [_txt(tmp_path, f"{n}.txt") for n in "abcd"]
+    size = Path(paths[0]).stat().st_size
+    monkeypatch.setenv("INDEX_COALESCE_MAX_BYTES", str(2 * size))
+    running = _QueuedJob("j0", tenant, paths[:1])
+    b, c, d = (_QueuedJob(f"j{i}", tenant, [p]) for i, p in enumerate(paths[1:], 1))
+    queued = [b, c, d]
+    _fake_queue(monkeypatch, running, queued)
+    worker.index_files_job(*running.args)
+    assert running.meta["coalesced_jobs"] == ["j1"] and queued == [c, d]
+
+
+@pytest.mark.parametrize("fmt", ["pickle", "columnar"])
+def test_delete_files_job_tombstones_then_compacts(tmp_path, monkeypatch, fmt):
+    from apps.worker import worker
+    from kits.kit_index import AnnConfig, BM25Index, TenantManifest, current_version, load_tombstones, load_vectorstore
+
+    monkeypatch.setenv("PARSE_WORKERS", "1")
+    monkeypatch.setenv("DOCSTORE_FORMAT", fmt)
+    monkeypatch.setattr(worker, "AnnConfig", lambda: AnnConfig(kind="hnsw"))
+    tenant = f"tenant-delete-{fmt}"
+    worker.index_files_job(tenant, [_txt(tmp_path, "keep.txt"), _txt(tmp_path, "drop.txt")])
+    before = load_vectorstore(_index_dir(tenant), None).index.ntotal
+    # As left by DELETE /documents/drop.txt, then a new drop.txt uploaded before the job ran
+    pending = worker.UPLOADS_DIR / tenant / ".deleting-1234abcd-drop.txt"
+    pending.parent.mkdir(parents=True, exist_ok=True)
+    pending.write_text("drop", encoding="utf-8")
+    reupload = pending.with_name("drop.txt")
+    reupload.write_text("drop again", encoding="utf-8")
+
+    worker.delete_files_job(tenant, ["drop.txt", "unknown.txt"], [pending.name, None])
+    assert not pending.exists() and reupload.read_text(encoding="utf-8") == "drop again"
+    path = _index_dir(tenant)
+    vs = load_vectorstore(path, None, writable=True)
+    # HNSW cannot remove in place: the vectors stay, tombstoned, until compaction
+    dead = load_tombstones(path)
+    assert vs.index.ntotal == before and dead.size > 0
+    assert all(not hasattr(vs.docstore.search(vs.index_to_docstore_id[int(p)]), "page_content") for p in dead)
+    assert list(TenantManifest.load(path).files) == ["keep.txt"]
+    assert all("drop" not in vs.docstore.search(cid).page_content for cid in BM25Index.load(path).docs)
+
+    worker.compact_index_job(tenant)
+    version = current_version(worker.FAISS_DIR / tenant)
+    assert version.generation == 3
+    vs = load_vectorstore(version.path, None)
+    assert load_tombstones(version.path).size == 0 and vs.index.ntotal == before - dead.size
+    assert {vs.docstore.search(cid).metadata["source"].rsplit("/", 1)[-1] for cid in vs.index_to_docstore_id.values()} == {"keep.txt"}
+
+
+def test_index_files_job_uses_hashes_from_upload(tmp_path, monkeypatch):
+    from apps.worker import worker
+    from kits.kit_index import TenantManifest, file_sha256
+
+    monkeypatch.setenv("PARSE_WORKERS", "1")
+    path = _txt(tmp_path, "a.txt")
+    sha = file_sha256(Path(path))
+
+    def _no_rehash(p):
+        raise AssertionError("file was hashed again")
+
+    monkeypatch.setattr(worker, "file_sha256", _no_rehash)
+    worker.index_files_job("tenant-hashes", [path], [sha])
+    assert TenantManifest.load(_index_dir("tenant-hashes")).get("a.txt")["sha256"] == sha